@@ -0,0 +1,203 @@
+!***** ACTIVITY.F90 **********************************************************************
+!   Active-cell tracking: cells in quiescent, uniform regions (ambient gas at
+!   the floors, masked obstacles, undisturbed initial states) have a zero
+!   flux residual, so glflux only evaluates the fluxes, inner integrals and
+!   face integrals of the cells in the active list.
+!
+!   A cell is quiescent when, for every variable, its higher modes and the
+!   jumps of its neighbours' averages (or of the boundary/MPI traces at the
+!   edges of the domain) are within act_tol of the cell's own scale:
+!
+!       rh : act_tol*rh,    mx,my,mz : act_tol*sqrt(rh*en),    en,p** : act_tol*en
+!
+!   and its face neighbours are uniform as well. A face is evaluated when
+!   either of its cells is active. The list is rebuilt from the current
+!   state at every glflux call, so disturbances are picked up one cell ahead
+!   of where they reach. With lactcell off (the default, or llns on, whose
+!   noise is never uniform) all cells are active. With act_tol = 0 only
+!   exactly uniform regions are skipped; a positive act_tol drops the small
+!   residual of nearly uniform cells, trading accuracy for speed.
+!*******************************************************************************
+module activity
+
+use params
+use basis_funcs
+use boundary
+
+!===========================================================================
+! Active cells: flags (.false. in the ghost layer) and the compact list
+!------------------------------------------------------------
+logical, dimension(0:nx+1,0:ny+1,0:nz+1) :: lcell_act = .false.
+integer, dimension(3,nx*ny*nz) :: icell_act
+integer :: ncell_act = -1
+!===========================================================================
+
+contains
+
+    !===========================================================================
+    ! Rebuild lcell_act and icell_act from Q_r and the external face traces
+    !------------------------------------------------------------
+    subroutine set_active_cells(Q_r)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_r
+        logical, dimension(nx,ny,nz) :: lunif
+        real, dimension(nQ) :: q0, tol
+        integer i,j,k
+
+        if (.not. lactcell .or. llns) then
+            if (ncell_act == nx*ny*nz) return
+            lcell_act(1:nx,1:ny,1:nz) = .true.
+            call fill_cell_list
+            return
+        end if
+
+        ! Uniform cells: all higher (active) modes within tolerance
+        do k = 1,nz
+        !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(i,q0,tol)
+        do j = 1,ny
+        do i = 1,nx
+            q0(:) = Q_r(i,j,k,:,1)
+            call act_tolerance(q0, tol)
+            lunif(i,j,k) = cell_uniform(Q_r(i,j,k,:,:), tol)
+        end do
+        end do
+        !$OMP END PARALLEL DO
+        end do
+
+        ! Quiescent cells: uniform, with uniform neighbours of the same average
+        do k = 1,nz
+        !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(i,q0,tol)
+        do j = 1,ny
+        do i = 1,nx
+            lcell_act(i,j,k) = .true.
+            if (.not. lunif(i,j,k)) cycle
+
+            q0(:) = Q_r(i,j,k,:,1)
+            call act_tolerance(q0, tol)
+
+            if (i > 1) then
+                if (.not. nbr_quiet(lunif(i-1,j,k), Q_r(i-1,j,k,:,1), q0, tol)) cycle
+            else
+                if (.not. ext_quiet(Qxlo_ext(j,k,:,:), q0, tol)) cycle
+            end if
+            if (i < nx) then
+                if (.not. nbr_quiet(lunif(i+1,j,k), Q_r(i+1,j,k,:,1), q0, tol)) cycle
+            else
+                if (.not. ext_quiet(Qxhi_ext(j,k,:,:), q0, tol)) cycle
+            end if
+
+            if (lact_y) then
+                if (j > 1) then
+                    if (.not. nbr_quiet(lunif(i,j-1,k), Q_r(i,j-1,k,:,1), q0, tol)) cycle
+                else
+                    if (.not. ext_quiet(Qylo_ext(i,k,:,:), q0, tol)) cycle
+                end if
+                if (j < ny) then
+                    if (.not. nbr_quiet(lunif(i,j+1,k), Q_r(i,j+1,k,:,1), q0, tol)) cycle
+                else
+                    if (.not. ext_quiet(Qyhi_ext(i,k,:,:), q0, tol)) cycle
+                end if
+            end if
+
+            if (lact_z) then
+                if (k > 1) then
+                    if (.not. nbr_quiet(lunif(i,j,k-1), Q_r(i,j,k-1,:,1), q0, tol)) cycle
+                else
+                    if (.not. ext_quiet(Qzlo_ext(i,j,:,:), q0, tol)) cycle
+                end if
+                if (k < nz) then
+                    if (.not. nbr_quiet(lunif(i,j,k+1), Q_r(i,j,k+1,:,1), q0, tol)) cycle
+                else
+                    if (.not. ext_quiet(Qzhi_ext(i,j,:,:), q0, tol)) cycle
+                end if
+            end if
+
+            lcell_act(i,j,k) = .false.
+        end do
+        end do
+        !$OMP END PARALLEL DO
+        end do
+
+        call fill_cell_list
+
+    end subroutine set_active_cells
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Compact list of the active cells, in storage order
+    !------------------------------------------------------------
+    subroutine fill_cell_list
+        implicit none
+        integer i,j,k
+
+        ncell_act = 0
+        do k = 1,nz
+        do j = 1,ny
+        do i = 1,nx
+            if (lcell_act(i,j,k)) then
+                ncell_act = ncell_act + 1
+                icell_act(1:3,ncell_act) = (/ i, j, k /)
+            end if
+        end do
+        end do
+        end do
+    end subroutine fill_cell_list
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Internal helpers
+    !------------------------------------------------------------
+    ! Absolute tolerance of each variable for a cell with averages q0
+    subroutine act_tolerance(q0, tol)
+        implicit none
+        real, dimension(nQ), intent(in)  :: q0
+        real, dimension(nQ), intent(out) :: tol
+
+        tol(rh)    = act_tol*abs(q0(rh))
+        tol(mx:mz) = act_tol*sqrt(abs(q0(rh)*q0(en)))
+        tol(en:nQ) = act_tol*abs(q0(en))
+    end subroutine act_tolerance
+
+    ! All active higher modes of a cell within tolerance
+    logical function cell_uniform(Qc, tol)
+        implicit none
+        real, dimension(nQ,nbasis), intent(in) :: Qc
+        real, dimension(nQ), intent(in) :: tol
+        integer ia,ir
+
+        cell_uniform = .false.
+        do ia = 2,nbas_act
+            ir = ibas_act(ia)
+            if (any(abs(Qc(:,ir)) > tol)) return
+        end do
+        cell_uniform = .true.
+    end function cell_uniform
+
+    ! Interior neighbour: uniform, with the same averages
+    logical function nbr_quiet(lunif_nbr, qn, q0, tol)
+        implicit none
+        logical, intent(in) :: lunif_nbr
+        real, dimension(nQ), intent(in) :: qn, q0, tol
+
+        nbr_quiet = lunif_nbr
+        if (nbr_quiet) nbr_quiet = all(abs(qn - q0) <= tol)
+    end function nbr_quiet
+
+    ! Boundary or MPI neighbour: all external face traces equal the averages
+    logical function ext_quiet(Qext, q0, tol)
+        implicit none
+        real, dimension(nface,nQ), intent(in) :: Qext
+        real, dimension(nQ), intent(in) :: q0, tol
+        integer ieq
+
+        ext_quiet = .false.
+        do ieq = 1,nQ
+            if (any(abs(Qext(:,ieq) - q0(ieq)) > tol(ieq))) return
+        end do
+        ext_quiet = .true.
+    end function ext_quiet
+    !---------------------------------------------------------------------------
+
+end module activity
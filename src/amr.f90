@@ -0,0 +1,128 @@
+!***** AMR.F90 ***************************************************************************
+!   Mesh refinement: moving the modal coefficients of a cell to its children.
+!
+!   Refinement splits a cell in two along every refined direction (those with
+!   more than one cell per rank), giving nchild = nref(1)*nref(2)*nref(3)
+!   children. The coefficients of child c follow by L2 projection, which for
+!   the Legendre-product basis (norm 8/cbasis on the reference cube) gives
+!
+!       a_c(m) = cbasis(m)/8 * int phi_m(xi) sum_n a(n) phi_n(map_c(xi))
+!
+!   with map_c(xi) = (xi + s_c)/2 along a refined direction (s_c = +-1 the
+!   offset of the child) and xi along the others. The matrices are tabulated
+!   once, with a quadrature that is exact for the basis.
+!
+!   So far this is used to restart on a grid twice as fine (lrefine_read, see
+!   set_ic_from_file). Refining blocks of the grid during a run, the coarse/
+!   fine flux correction and balancing the blocks over the ranks are not
+!   implemented.
+!*******************************************************************************
+module amr
+
+use params
+use helpers
+use basis_funcs
+
+!===========================================================================
+! Prolongation matrices (m,n,child), child = 1 + cx + nref(1)*(cy + nref(2)*cz)
+! with (cx,cy,cz) = 0 for the lower and 1 for the upper half along each axis
+!------------------------------------------------------------
+integer, dimension(3) :: nref = 1
+integer :: nchild = 1
+real, dimension(:,:,:), allocatable :: amr_prol
+!===========================================================================
+
+contains
+
+    !===========================================================================
+    ! Tabulate amr_prol (call after set_bfvals_3D)
+    !------------------------------------------------------------
+    subroutine set_amr_prol
+        implicit none
+        real, dimension(:), allocatable :: xq, wq, wp
+        real, dimension(:,:), allocatable :: xp, xc3, bfp, bfc
+        integer nq1,npt,ic,idir,ix,iy,iz,ipt,m,n
+        integer, dimension(3) :: ioff
+
+        nref(1) = merge(2, 1, nx > 1)
+        nref(2) = merge(2, 1, ny > 1)
+        nref(3) = merge(2, 1, nz > 1)
+        nchild = product(nref)
+
+        ! Exact for the products of two modes of the highest degree
+        nq1 = maxval(ideg(:,1:nbasis)) + 1
+        npt = nq1**3
+        allocate(xq(nq1), wq(nq1), xp(npt,3), xc3(npt,3), wp(npt))
+        allocate(bfp(npt,nbastot), bfc(npt,nbastot))
+        if (allocated(amr_prol)) deallocate(amr_prol)
+        allocate(amr_prol(nbasis,nbasis,nchild))
+
+        call gauss_legendre(nq1, xq, wq)
+        ipt = 0
+        do iz = 1,nq1
+        do iy = 1,nq1
+        do ix = 1,nq1
+            ipt = ipt + 1
+            xp(ipt,1:3) = (/ xq(ix), xq(iy), xq(iz) /)
+            wp(ipt) = wq(ix)*wq(iy)*wq(iz)
+        end do
+        end do
+        end do
+        call eval_basis(npt, xp, 0, bfc)
+
+        do ic = 1,nchild
+            ioff(1) = mod(ic-1, nref(1))
+            ioff(2) = mod((ic-1)/nref(1), nref(2))
+            ioff(3) = (ic-1)/(nref(1)*nref(2))
+            do idir = 1,3
+                if (nref(idir) == 1) then
+                    xc3(:,idir) = xp(:,idir)
+                else
+                    xc3(:,idir) = 0.5*(xp(:,idir) + 2*ioff(idir) - 1)
+                end if
+            end do
+            ! parent modes at the child's quadrature points
+            call eval_basis(npt, xc3, 0, bfp)
+
+            do m = 1,nbasis
+            do n = 1,nbasis
+                amr_prol(m,n,ic) = 0.125*cbasis(m)*sum(wp(:)*bfc(:,m)*bfp(:,n))
+            end do
+            end do
+        end do
+
+        deallocate(xq, wq, xp, xc3, wp, bfp, bfc)
+    end subroutine set_amr_prol
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Fill Q_r from the state Q_c on the grid coarsened by nref (set_amr_prol
+    !   must have been called): every coarse cell gives its nchild children
+    !------------------------------------------------------------
+    subroutine amr_refine(Q_c, Q_r)
+        implicit none
+        real, dimension(:,:,:,:,:), intent(in) :: Q_c
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(out) :: Q_r
+        integer i,j,k,ic,ieq,ir,ii,jj,kk
+
+        do k = 1,nz/nref(3)
+        do j = 1,ny/nref(2)
+        do i = 1,nx/nref(1)
+            do ic = 1,nchild
+                ii = nref(1)*(i-1) + 1 + mod(ic-1, nref(1))
+                jj = nref(2)*(j-1) + 1 + mod((ic-1)/nref(1), nref(2))
+                kk = nref(3)*(k-1) + 1 + (ic-1)/(nref(1)*nref(2))
+                do ieq = 1,nQ
+                do ir = 1,nbasis
+                    Q_r(ii,jj,kk,ieq,ir) = sum(amr_prol(ir,1:nbasis,ic)*Q_c(i,j,k,ieq,1:nbasis))
+                end do
+                end do
+            end do
+        end do
+        end do
+        end do
+    end subroutine amr_refine
+    !---------------------------------------------------------------------------
+
+end module amr
@@ -24,13 +24,13 @@ real, dimension(nbastot) :: cbasis
 integer ibitri  ! set by set_cbasis_3D using chosen value of iquad
 
 ! TODO: only in set_weights_3D
-real wgt1d(5)    ! wgt1d: quadrature weights for 1-D integration
+real wgt1d(max(5,nedge))    ! wgt1d: quadrature weights for 1-D integration
 
 ! TODO: only in init, set_weights_3D, glflux
-real wgt2d(30)   ! wgt2d: quadrature weights for 2-D integration
+real wgt2d(max(30,nface))   ! wgt2d: quadrature weights for 2-D integration
 
 ! TODO: only in init, set_weights_3D, innerintegral
-real wgt3d(100)  ! wgt3d: quadrature weights for 3-D integration
+real wgt3d(max(100,npg))  ! wgt3d: quadrature weights for 3-D integration
 
 ! TODO: only in limiter, set_face_vals_3D
 real, dimension(nslim,nbastot) :: bf_faces
@@ -63,6 +63,52 @@ real, dimension(nbastot,nbastot) :: cell_int,xp_int,xm_int,yp_int,ym_int,zp_int,
 real, dimension(nbastot,nbastot) :: cell_int0,xp_int0,xm_int0,yp_int0,ym_int0,zp_int0,zm_int0
 real, dimension(nbastot) :: cbas_xp,cbas_xm,cbas_yp,cbas_ym,cbas_zp,cbas_zm
 integer, dimension(nbastot) :: ibas_x, ibas_y, ibas_z
+
+! Active directions and basis modes (set by set_active_basis)
+!   * a direction with a single periodic cell carries no dynamics, so the
+!     flux kernels skip it and only modes independent of it are evolved
+logical :: lact_y = .true., lact_z = .true.
+integer :: nbas_act = nbasis
+integer, dimension(nbastot) :: ibas_act
+logical, dimension(nbastot) :: lbas_act = .true.
+
+! Legendre degree of each basis mode along x, y, z (set by set_mode_degrees)
+integer, dimension(3,nbastot) :: ideg
+
+! Bases with cubic and higher modes (iquad >= 4) are not covered by the
+! hand-written tables: all tables are then generated from ideg
+!   * dbval_int_wgt: wgt3d * d(basis)/d(x,y,z) at the interior points,
+!     used for the volume integrals in innerintegral2
+logical :: lgenbasis = .false.
+real, dimension(npg,nbastot,3) :: dbval_int_wgt
+
+! d(basis)/d(x,y,z) at the interior points in cell coordinates, for every
+! basis (set by set_int_derivs); used by the diagnostics
+real, dimension(npg,nbastot,3) :: dbfvals_int
+
+! Sum-factorized tensor-product operators (set by set_tensor_ops)
+!   * bases with ibitri = 1 are {P_a(x)P_b(y)P_c(z)}, a,b,c < nedge, so they
+!     are applied with 1D operators one direction at a time
+!   * imode3(c+1,b+1,a+1) is the mode index of P_a(x)P_b(y)P_c(z)
+!   * quadrature points are ordered (z,y,x) in the cell and (y,z), (z,x),
+!     (x,y) on the x-, y-, z-faces (fastest index first)
+logical :: ltensor = .false.
+integer, dimension(nedge,nedge,nedge) :: imode3
+real, dimension(nedge,nedge) :: bf1d      ! P_n(xquad(iq)), stored (iq,n+1)
+real, dimension(nedge,nedge) :: bf1d_w    ! wgt1d(iq)*P_n(xquad(iq))
+real, dimension(nedge,nedge) :: dbf1d_w   ! wgt1d(iq)*P_n'(xquad(iq))
+real, dimension(nedge) :: bf1d_p, bf1d_m  ! P_n(+1), P_n(-1)
+
+! Face traces (set by set_face_traces)
+!   * on the faces normal to ixyz a mode P_a(x)P_b(y)P_c(z) is (+-1)**a times
+!     its tangential part T = P_b(y)P_c(z) (x-faces; likewise for y, z), so
+!     the traces of a cell are E +- O with E (O) the sum over even (odd) a
+!   * modes sharing T are summed first: itan(ir,ixyz) indexes the ntan(ixyz)
+!     distinct tangential parts, tabulated at the face points in bftan, and
+!     ipar(ir,ixyz) is the parity of the normal degree
+integer, dimension(3) :: ntan
+integer, dimension(nbastot,3) :: itan, ipar
+real, dimension(nface,nbastot,3) :: bftan
 !===========================================================================
 
 contains
@@ -76,8 +122,10 @@ contains
         call set_internal_vals_3D()     ! Define basis function values at quadrature points INTERNAL to cell.
         call set_face_vals_3D()   ! Define local basis function values at quadrature points on a cell face.
         call set_weights_3D()     ! Define weights for integral approximation using Gaussian quadrature.
+        call set_int_derivs()     ! Basis function derivatives at the interior quadrature points.
+        if (lgenbasis) call set_generated_vals()  ! Bases with cubic and higher modes
 
-        if (test_basis .and. iam == print_mpi) then
+        if (test_basis .and. .not. lgenbasis .and. iam == print_mpi) then
     	   print *,'Testing basis...'
     	   call test_basis_3D()
     	   print *,'Done testing basis...'
@@ -157,7 +205,7 @@ contains
         bfvtk(1:nvtk3,kxyyzz) = bfvtk(1:nvtk3,kx)*bfvtk(1:nvtk3,kyy)*bfvtk(1:nvtk3,kzz)   ! basis function = x P_2(y)P_2(z)
         bfvtk(1:nvtk3,kyzzxx) = bfvtk(1:nvtk3,ky)*bfvtk(1:nvtk3,kzz)*bfvtk(1:nvtk3,kxx)   ! basis function = y P_2(z)P_2(x)
         bfvtk(1:nvtk3,kzxxyy) = bfvtk(1:nvtk3,kz)*bfvtk(1:nvtk3,kxx)*bfvtk(1:nvtk3,kyy)   ! basis function = z P_2(x)P_2(y)
-        bfvtk(1:nvtk3,kxxyyzz) = bfvtk(1:nvtk3,kx)*bfvtk(1:nvtk3,kyy)*bfvtk(1:nvtk3,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
+        bfvtk(1:nvtk3,kxxyyzz) = bfvtk(1:nvtk3,kxx)*bfvtk(1:nvtk3,kyy)*bfvtk(1:nvtk3,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
 
         do igrid=1,nvtk3
             bfvtk_dx(igrid,1) = 0.
@@ -291,6 +339,8 @@ contains
             xquad(3) = xq4m
             xquad(4) = xq4p
         end if
+        if (iquad .gt. 4) call gauss_legendre(nedge, xquad, wgt1d)
+        if (iquad .eq. 1) xquad(1) = 0.
 
         if (iquad .eq. 1) then            ! 2-point Gaussian quadrature
             bfvals_int(1,1) = 1.        ! basis function = 1
@@ -338,7 +388,7 @@ contains
         bfvals_int(1:npg,kxyyzz) = bfvals_int(1:npg,kx)*bfvals_int(1:npg,kyy)*bfvals_int(1:npg,kzz)   ! basis function = x P_2(y)P_2(z)
         bfvals_int(1:npg,kyzzxx) = bfvals_int(1:npg,ky)*bfvals_int(1:npg,kzz)*bfvals_int(1:npg,kxx)   ! basis function = y P_2(z)P_2(x)
         bfvals_int(1:npg,kzxxyy) = bfvals_int(1:npg,kz)*bfvals_int(1:npg,kxx)*bfvals_int(1:npg,kyy)   ! basis function = z P_2(x)P_2(y)
-        bfvals_int(1:npg,kxxyyzz) = bfvals_int(1:npg,kx)*bfvals_int(1:npg,kyy)*bfvals_int(1:npg,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
+        bfvals_int(1:npg,kxxyyzz) = bfvals_int(1:npg,kxx)*bfvals_int(1:npg,kyy)*bfvals_int(1:npg,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
 
     end subroutine set_internal_vals_3D
 
@@ -373,6 +423,7 @@ contains
             xquad(3) = xq4m
             xquad(4) = xq4p
         end if
+        if (iquad .gt. 4) call gauss_legendre(nedge, xquad, wgt1d)
 
         ! bfvals_rsp:  positive rs-face
         ! bfvals_rsm:  negative rs-face
@@ -448,7 +499,7 @@ contains
         bfvals_xp(1:nface,kxyyzz) = bfvals_xp(1:nface,kx)*bfvals_xp(1:nface,kyy)*bfvals_xp(1:nface,kzz)   ! basis function = x P_2(y)P_2(z)
         bfvals_xp(1:nface,kyzzxx) = bfvals_xp(1:nface,ky)*bfvals_xp(1:nface,kzz)*bfvals_xp(1:nface,kxx)   ! basis function = y P_2(z)P_2(x)
         bfvals_xp(1:nface,kzxxyy) = bfvals_xp(1:nface,kz)*bfvals_xp(1:nface,kxx)*bfvals_xp(1:nface,kyy)   ! basis function = z P_2(x)P_2(y)
-        bfvals_xp(1:nface,kxxyyzz) = bfvals_xp(1:nface,kx)*bfvals_xp(1:nface,kyy)*bfvals_xp(1:nface,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
+        bfvals_xp(1:nface,kxxyyzz) = bfvals_xp(1:nface,kxx)*bfvals_xp(1:nface,kyy)*bfvals_xp(1:nface,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
 
         bfvals_xm = bfvals_xp
         bfvals_xm(1:nface,kx) = -bfvals_xp(1:nface,kx)
@@ -477,7 +528,7 @@ contains
         bfvals_yp(1:nface,kxyyzz) = bfvals_yp(1:nface,kx)*bfvals_yp(1:nface,kyy)*bfvals_yp(1:nface,kzz)   ! basis function = x P_2(y)P_2(z)
         bfvals_yp(1:nface,kyzzxx) = bfvals_yp(1:nface,ky)*bfvals_yp(1:nface,kzz)*bfvals_yp(1:nface,kxx)   ! basis function = y P_2(z)P_2(x)
         bfvals_yp(1:nface,kzxxyy) = bfvals_yp(1:nface,kz)*bfvals_yp(1:nface,kxx)*bfvals_yp(1:nface,kyy)   ! basis function = z P_2(x)P_2(y)
-        bfvals_yp(1:nface,kxxyyzz) = bfvals_yp(1:nface,kx)*bfvals_yp(1:nface,kyy)*bfvals_yp(1:nface,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
+        bfvals_yp(1:nface,kxxyyzz) = bfvals_yp(1:nface,kxx)*bfvals_yp(1:nface,kyy)*bfvals_yp(1:nface,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
 
         bfvals_ym = bfvals_yp
         bfvals_ym(1:nface,ky) = -bfvals_yp(1:nface,ky)
@@ -506,7 +557,7 @@ contains
         bfvals_zp(1:nface,kxyyzz) = bfvals_zp(1:nface,kx)*bfvals_zp(1:nface,kyy)*bfvals_zp(1:nface,kzz)   ! basis function = x P_2(y)P_2(z)
         bfvals_zp(1:nface,kyzzxx) = bfvals_zp(1:nface,ky)*bfvals_zp(1:nface,kzz)*bfvals_zp(1:nface,kxx)   ! basis function = y P_2(z)P_2(x)
         bfvals_zp(1:nface,kzxxyy) = bfvals_zp(1:nface,kz)*bfvals_zp(1:nface,kxx)*bfvals_zp(1:nface,kyy)   ! basis function = z P_2(x)P_2(y)
-        bfvals_zp(1:nface,kxxyyzz) = bfvals_zp(1:nface,kx)*bfvals_zp(1:nface,kyy)*bfvals_zp(1:nface,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
+        bfvals_zp(1:nface,kxxyyzz) = bfvals_zp(1:nface,kxx)*bfvals_zp(1:nface,kyy)*bfvals_zp(1:nface,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
 
 
         bfvals_zm = bfvals_zp
@@ -562,7 +613,7 @@ contains
         bf_faces(1:nslim,kxyyzz) = bf_faces(1:nslim,kx)*bf_faces(1:nslim,kyy)*bf_faces(1:nslim,kzz)   ! basis function = x P_2(y)P_2(z)
         bf_faces(1:nslim,kyzzxx) = bf_faces(1:nslim,ky)*bf_faces(1:nslim,kzz)*bf_faces(1:nslim,kxx)   ! basis function = y P_2(z)P_2(x)
         bf_faces(1:nslim,kzxxyy) = bf_faces(1:nslim,kz)*bf_faces(1:nslim,kxx)*bf_faces(1:nslim,kyy)   ! basis function = z P_2(x)P_2(y)
-        bf_faces(1:nslim,kxxyyzz) = bf_faces(1:nslim,kx)*bf_faces(1:nslim,kyy)*bf_faces(1:nslim,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
+        bf_faces(1:nslim,kxxyyzz) = bf_faces(1:nslim,kxx)*bf_faces(1:nslim,kyy)*bf_faces(1:nslim,kzz)  ! basis function = P_2(x)P_2(y)P_2(z)
 
     end subroutine set_face_vals_3D
 
@@ -595,6 +646,7 @@ contains
             wgt1d(3) = wq4p
             wgt1d(4) = wq4m
         end if
+        if (iquad .gt. 4) call gauss_legendre(nedge, xquad, wgt1d)
 
         ! Define weights for 2-D integration
         if (iquad .eq. 1) then        ! 1-point quadrature
@@ -992,4 +1044,673 @@ contains
     end subroutine test_basis_3D
     !---------------------------------------------------------------------------
 
+
+    !===========================================================================
+    ! set_active_basis : flag the y/z directions as inactive when they hold a
+    !   single periodic cell and build the list of basis modes that do not
+    !   vary along an inactive direction (the 1D/2D tensor-product subsets).
+    !   Must be called after set_bfvals_3D.
+    !------------------------------------------------------------
+    subroutine set_active_basis(ldeg_y, ldeg_z)
+        implicit none
+        logical, intent(in) :: ldeg_y, ldeg_z
+        integer ir
+
+        lact_y = .not. ldeg_y
+        lact_z = .not. ldeg_z
+
+        nbas_act = 0
+        do ir = 1,nbasis
+            lbas_act(ir) = (lact_y .or. ideg(2,ir) == 0) .and. (lact_z .or. ideg(3,ir) == 0)
+            if (lbas_act(ir)) then
+                nbas_act = nbas_act + 1
+                ibas_act(nbas_act) = ir
+            end if
+        end do
+    end subroutine set_active_basis
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! zero_inactive_modes : remove the components of Q_r along basis modes
+    !   that vary in an inactive direction (they are not evolved)
+    !------------------------------------------------------------
+    subroutine zero_inactive_modes(Q_r)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_r
+        integer ir
+
+        do ir = 2,nbasis
+            if (.not. lbas_act(ir)) Q_r(:,:,:,:,ir) = 0.
+        end do
+    end subroutine zero_inactive_modes
+    !---------------------------------------------------------------------------
+
+    !===========================================================================
+    ! set_mode_degrees : Legendre degree of every basis mode along x, y, z.
+    !   The named modes (kx, kxx, ...) keep their slots; for generated bases
+    !   the remaining slots take the other members of the tensor-product or
+    !   total-degree family in order of increasing degree.
+    !------------------------------------------------------------
+    subroutine set_mode_degrees
+        implicit none
+        integer, parameter :: nmodes = 30
+        integer, dimension(nmodes) :: kmode
+        integer, dimension(3,nmodes) :: kdeg
+        logical, dimension(nbastot) :: lnamed
+        integer im,ir,a,b,c,ntot
+
+        kmode = (/ 1, kx, ky, kz, kyz, kzx, kxy, kxyz, kxx, kyy, kzz,                  &
+                   kyzz, kzxx, kxyy, kyyz, kzzx, kxxy, kyyzz, kzzxx, kxxyy,           &
+                   kyzxx, kzxyy, kxyzz, kxyyzz, kyzzxx, kzxxyy, kxxyyzz, kxxx, kyyy, kzzz /)
+        kdeg = reshape( (/ 0,0,0, 1,0,0, 0,1,0, 0,0,1, 0,1,1, 1,0,1, 1,1,0, 1,1,1,     &
+                           2,0,0, 0,2,0, 0,0,2, 0,1,2, 2,0,1, 1,2,0, 0,2,1, 1,0,2,    &
+                           2,1,0, 0,2,2, 2,0,2, 2,2,0, 2,1,1, 1,2,1, 1,1,2, 1,2,2,    &
+                           2,1,2, 2,2,1, 2,2,2, 3,0,0, 0,3,0, 0,0,3 /), (/ 3,nmodes /) )
+
+        ideg(:,:) = 0
+        lnamed(:) = .false.
+        do im = 1,nmodes
+            ir = kmode(im)
+            if (ir > nbastot) cycle
+            ideg(:,ir) = kdeg(:,im)
+            lnamed(ir) = in_family(kdeg(1,im), kdeg(2,im), kdeg(3,im))
+        end do
+
+        lgenbasis = iquad >= 4
+        if (.not. lgenbasis) return
+
+        ir = 0
+        do ntot = 0,3*(nedge-1)
+            do a = 0,nedge-1
+            do b = 0,nedge-1
+            do c = 0,nedge-1
+                if (a+b+c /= ntot .or. .not. in_family(a,b,c)) cycle
+                if (any(lnamed(1:nbasis) .and. ideg(1,1:nbasis) == a                   &
+                        .and. ideg(2,1:nbasis) == b .and. ideg(3,1:nbasis) == c)) cycle
+                do
+                    ir = ir + 1
+                    if (ir > nbasis) exit
+                    if (.not. lnamed(ir)) exit
+                end do
+                if (ir > nbasis) return
+                ideg(:,ir) = (/ a, b, c /)
+            end do
+            end do
+            end do
+        end do
+
+    contains
+
+        logical function in_family(a, b, c)
+            integer, intent(in) :: a, b, c
+            if (ibitri == 1) then
+                in_family = max(a, b, c) < nedge
+            else
+                in_family = a + b + c < nedge
+            end if
+        end function in_family
+
+    end subroutine set_mode_degrees
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! set_tensor_ops : 1D Legendre operators for the sum-factorized kernels.
+    !   Only used for the tensor-product bases (ibitri = 1) when every
+    !   direction is active; the reduced 1D/2D mode sets of set_active_basis
+    !   are cheaper with the dense tables.
+    !------------------------------------------------------------
+    subroutine set_tensor_ops(lsf)
+        implicit none
+        logical, intent(in) :: lsf
+        real, dimension(0:nedge) :: pn, dpn
+        integer iq,ir
+
+        ltensor = lsf .and. ibitri == 1 .and. nbas_act == nbasis .and. nbasis == nedge**3
+        if (.not. ltensor) return
+
+        call legendre(nedge, 1., pn, dpn)
+        bf1d_p(1:nedge) = pn(0:nedge-1)
+        call legendre(nedge, -1., pn, dpn)
+        bf1d_m(1:nedge) = pn(0:nedge-1)
+        do iq = 1,nedge
+            call legendre(nedge, xquad(iq), pn, dpn)
+            bf1d(iq,1:nedge) = pn(0:nedge-1)
+            bf1d_w(iq,1:nedge) = wgt1d(iq)*pn(0:nedge-1)
+            dbf1d_w(iq,1:nedge) = wgt1d(iq)*dpn(0:nedge-1)
+        end do
+
+        do ir = 1,nbasis
+            imode3(ideg(3,ir)+1, ideg(2,ir)+1, ideg(1,ir)+1) = ir
+        end do
+    end subroutine set_tensor_ops
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! set_generated_vals : basis function tables built from the Legendre
+    !   degrees of each mode (ideg) for the point sets used by the solver:
+    !   interior and face quadrature points, limiter points and VTK points
+    !------------------------------------------------------------
+    subroutine set_generated_vals
+        implicit none
+        real, dimension(npg,3) :: xint
+        real, dimension(nvtk3,3) :: xvtk
+        real, dimension(nface,3) :: xface
+        integer i1,i2,i3,ip,ir,idir
+
+        ! Interior points, ordered (z,y,x) fastest first
+        do i1 = 1,nedge
+        do i2 = 1,nedge
+        do i3 = 1,nedge
+            ip = (i1-1)*nface + (i2-1)*nedge + i3
+            xint(ip,:) = (/ xquad(i1), xquad(i2), xquad(i3) /)
+        end do
+        end do
+        end do
+        call eval_basis(npg, xint, 0, bfvals_int)
+        do idir = 1,3
+            do ir = 1,nbasis
+                dbval_int_wgt(1:npg,ir,idir) = wgt3d(1:npg)*dbfvals_int(1:npg,ir,idir)
+            end do
+        end do
+
+        ! Face points: (y,z) on x-faces, (z,x) on y-faces, (x,y) on z-faces
+        do i1 = 1,nedge
+        do i2 = 1,nedge
+            ip = (i1-1)*nedge + i2
+            xface(ip,:) = (/ 1., xquad(i2), xquad(i1) /)
+        end do
+        end do
+        call eval_basis(nface, xface, 0, bfvals_xp)
+        xface(:,1) = -1.
+        call eval_basis(nface, xface, 0, bfvals_xm)
+        do i1 = 1,nedge
+        do i2 = 1,nedge
+            ip = (i1-1)*nedge + i2
+            xface(ip,:) = (/ xquad(i1), 1., xquad(i2) /)
+        end do
+        end do
+        call eval_basis(nface, xface, 0, bfvals_yp)
+        xface(:,2) = -1.
+        call eval_basis(nface, xface, 0, bfvals_ym)
+        do i1 = 1,nedge
+        do i2 = 1,nedge
+            ip = (i1-1)*nedge + i2
+            xface(ip,:) = (/ xquad(i2), xquad(i1), 1. /)
+        end do
+        end do
+        call eval_basis(nface, xface, 0, bfvals_zp)
+        xface(:,3) = -1.
+        call eval_basis(nface, xface, 0, bfvals_zm)
+
+        ! Limiter points: the six faces, then the interior
+        bf_faces(1:nface,:)           = bfvals_xm(1:nface,:)
+        bf_faces(nface+1:2*nface,:)   = bfvals_xp(1:nface,:)
+        bf_faces(2*nface+1:3*nface,:) = bfvals_ym(1:nface,:)
+        bf_faces(3*nface+1:4*nface,:) = bfvals_yp(1:nface,:)
+        bf_faces(4*nface+1:5*nface,:) = bfvals_zm(1:nface,:)
+        bf_faces(5*nface+1:6*nface,:) = bfvals_zp(1:nface,:)
+        bf_faces(6*nface+1:nslim,:)   = bfvals_int(1:npg,:)
+
+        ! VTK points, ordered like the interior points
+        do i1 = 1,nvtk
+        do i2 = 1,nvtk
+        do i3 = 1,nvtk
+            ip = (i1-1)*nvtk2 + (i2-1)*nvtk + i3
+            xvtk(ip,:) = (/ xgrid(i1), xgrid(i2), xgrid(i3) /)
+        end do
+        end do
+        end do
+        call eval_basis(nvtk3, xvtk, 0, bfvtk)
+        call eval_basis(nvtk3, xvtk, 1, bfvtk_dx)
+        call eval_basis(nvtk3, xvtk, 2, bfvtk_dy)
+        call eval_basis(nvtk3, xvtk, 3, bfvtk_dz)
+    end subroutine set_generated_vals
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! set_int_derivs : derivatives of every basis mode along x, y, z at the
+    !   interior quadrature points (same ordering as bfvals_int)
+    !------------------------------------------------------------
+    subroutine set_int_derivs
+        implicit none
+        real, dimension(npg,3) :: xint
+        integer i1,i2,i3,ip,idir
+
+        do i1 = 1,nedge
+        do i2 = 1,nedge
+        do i3 = 1,nedge
+            ip = (i1-1)*nface + (i2-1)*nedge + i3
+            xint(ip,:) = (/ xquad(i1), xquad(i2), xquad(i3) /)
+        end do
+        end do
+        end do
+        do idir = 1,3
+            call eval_basis(npg, xint, idir, dbfvals_int(:,:,idir))
+        end do
+    end subroutine set_int_derivs
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! eval_basis : values (ider = 0) or derivatives along direction ider of
+    !   every basis mode at npt points with cell coordinates xp(:,1:3)
+    !------------------------------------------------------------
+    subroutine eval_basis(npt, xp, ider, bf)
+        implicit none
+        integer, intent(in) :: npt, ider
+        real, dimension(npt,3), intent(in) :: xp
+        real, dimension(npt,nbastot), intent(out) :: bf
+        real, dimension(0:nedge,3) :: pn, dpn
+        integer ip,ir,idir
+
+        bf(:,:) = 0.
+        do ip = 1,npt
+            do idir = 1,3
+                call legendre(nedge, xp(ip,idir), pn(:,idir), dpn(:,idir))
+            end do
+            do ir = 1,nbasis
+                bf(ip,ir) = 1.
+                do idir = 1,3
+                    if (idir == ider) then
+                        bf(ip,ir) = bf(ip,ir)*dpn(ideg(idir,ir),idir)
+                    else
+                        bf(ip,ir) = bf(ip,ir)*pn(ideg(idir,ir),idir)
+                    end if
+                end do
+            end do
+        end do
+    end subroutine eval_basis
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! legendre : P_n(x) and P_n'(x) for n = 0..nmax by recurrence
+    !------------------------------------------------------------
+    subroutine legendre(nmax, x, pn, dpn)
+        implicit none
+        integer, intent(in) :: nmax
+        real, intent(in) :: x
+        real, dimension(0:nmax), intent(out) :: pn, dpn
+        integer n
+
+        pn(0) = 1.
+        dpn(0) = 0.
+        if (nmax < 1) return
+        pn(1) = x
+        dpn(1) = 1.
+        do n = 1,nmax-1
+            pn(n+1) = ((2*n+1)*x*pn(n) - n*pn(n-1))/(n+1)
+            dpn(n+1) = dpn(n-1) + (2*n+1)*pn(n)
+        end do
+    end subroutine legendre
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! gauss_legendre : n-point Gauss-Legendre nodes (ascending) and weights
+    !   on [-1,1] by Newton iteration from the Chebyshev guesses
+    !------------------------------------------------------------
+    subroutine gauss_legendre(n, xq, wq)
+        implicit none
+        integer, intent(in) :: n
+        real, dimension(n), intent(out) :: xq, wq
+        real, dimension(0:n) :: pn, dpn
+        real*8 x, dx
+        integer i, it
+
+        do i = 1,n
+            x = -cos(pi*(i - 0.25d0)/(n + 0.5d0))
+            do it = 1,100
+                call legendre(n, real(x), pn, dpn)
+                dx = pn(n)/dpn(n)
+                x = x - dx
+                if (abs(dx) < 1.d-15) exit
+            end do
+            call legendre(n, real(x), pn, dpn)
+            xq(i) = x
+            wq(i) = 2./((1. - x**2)*dpn(n)**2)
+        end do
+    end subroutine gauss_legendre
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! set_face_traces : tangential parts of the active modes on the faces
+    !   normal to x, y, z (taken from the + face tables, where P_a(1) = 1).
+    !   Must be called after set_active_basis.
+    !------------------------------------------------------------
+    subroutine set_face_traces
+        implicit none
+        integer, dimension(2,nbastot) :: ktan
+        integer ixyz,ia,ir,it,jt
+        integer, dimension(2) :: kt
+
+        do ixyz = 1,3
+            ntan(ixyz) = 0
+            do ia = 1,nbas_act
+                ir = ibas_act(ia)
+                kt = pack(ideg(:,ir), (/ 1,2,3 /) /= ixyz)
+                jt = 0
+                do it = 1,ntan(ixyz)
+                    if (all(ktan(:,it) == kt)) jt = it
+                end do
+                if (jt == 0) then
+                    ntan(ixyz) = ntan(ixyz) + 1
+                    jt = ntan(ixyz)
+                    ktan(:,jt) = kt
+                    select case(ixyz)
+                    case(1)
+                        bftan(1:nface,jt,ixyz) = bfvals_xp(1:nface,ir)
+                    case(2)
+                        bftan(1:nface,jt,ixyz) = bfvals_yp(1:nface,ir)
+                    case(3)
+                        bftan(1:nface,jt,ixyz) = bfvals_zp(1:nface,ir)
+                    end select
+                end if
+                itan(ir,ixyz) = jt
+                ipar(ir,ixyz) = mod(ideg(ixyz,ir), 2)
+            end do
+        end do
+    end subroutine set_face_traces
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! face_trace_pair : traces Qp, Qm of the expansion Qc on the + and - faces
+    !   normal to ixyz, sharing the tangential sums between both faces
+    !------------------------------------------------------------
+    subroutine face_trace_pair(Qc, ixyz, Qp, Qm)
+        implicit none
+        real, dimension(nbasis), intent(in) :: Qc
+        integer, intent(in) :: ixyz
+        real, dimension(nface), intent(out) :: Qp, Qm
+        real, dimension(nbastot,0:1) :: C
+        real E, O
+        integer ia,ir,nt,ipnt
+
+        nt = ntan(ixyz)
+        C(1:nt,:) = 0.
+        do ia = 1,nbas_act
+            ir = ibas_act(ia)
+            C(itan(ir,ixyz),ipar(ir,ixyz)) = C(itan(ir,ixyz),ipar(ir,ixyz)) + Qc(ir)
+        end do
+        do ipnt = 1,nface
+            E = sum(bftan(ipnt,1:nt,ixyz)*C(1:nt,0))
+            O = sum(bftan(ipnt,1:nt,ixyz)*C(1:nt,1))
+            Qp(ipnt) = E + O
+            Qm(ipnt) = E - O
+        end do
+    end subroutine face_trace_pair
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! face_trace : trace Qf of the expansion Qc on the face normal to ixyz at
+    !   side = +1 or -1
+    !------------------------------------------------------------
+    subroutine face_trace(Qc, ixyz, side, Qf)
+        implicit none
+        real, dimension(nbasis), intent(in) :: Qc
+        integer, intent(in) :: ixyz
+        real, intent(in) :: side
+        real, dimension(nface), intent(out) :: Qf
+        real, dimension(nbastot) :: C
+        integer ia,ir,nt,ipnt
+
+        nt = ntan(ixyz)
+        C(1:nt) = 0.
+        do ia = 1,nbas_act
+            ir = ibas_act(ia)
+            if (ipar(ir,ixyz) == 1) then
+                C(itan(ir,ixyz)) = C(itan(ir,ixyz)) + side*Qc(ir)
+            else
+                C(itan(ir,ixyz)) = C(itan(ir,ixyz)) + Qc(ir)
+            end if
+        end do
+        do ipnt = 1,nface
+            Qf(ipnt) = sum(bftan(ipnt,1:nt,ixyz)*C(1:nt))
+        end do
+    end subroutine face_trace
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! face_trace_int : surface integrals sum(wgt2d*(phi_p*fp - phi_m*fm)) of
+    !   the fluxes fp, fm on the + and - faces normal to ixyz for every active
+    !   mode. With phi_m = (-1)**a phi_p they reduce to the tangential
+    !   integrals of fp - fm (even a) and fp + fm (odd a).
+    !------------------------------------------------------------
+    subroutine face_trace_int(fp, fm, ixyz, R)
+        implicit none
+        real, dimension(nface), intent(in) :: fp, fm
+        integer, intent(in) :: ixyz
+        real, dimension(nbasis), intent(out) :: R
+        real, dimension(nface,0:1) :: F
+        real, dimension(nbastot,0:1) :: G
+        integer ia,ir,it
+
+        F(:,0) = wgt2d(1:nface)*(fp - fm)
+        F(:,1) = wgt2d(1:nface)*(fp + fm)
+        do it = 1,ntan(ixyz)
+            G(it,0) = sum(bftan(1:nface,it,ixyz)*F(:,0))
+            G(it,1) = sum(bftan(1:nface,it,ixyz)*F(:,1))
+        end do
+        R(:) = 0.
+        do ia = 1,nbas_act
+            ir = ibas_act(ia)
+            R(ir) = G(itan(ir,ixyz),ipar(ir,ixyz))
+        end do
+    end subroutine face_trace_int
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! tp_eval_int : values of the expansion Qc at the interior quadrature points
+    !------------------------------------------------------------
+    subroutine tp_eval_int(Qc, Qp)
+        implicit none
+        real, dimension(nbasis), intent(in) :: Qc
+        real, dimension(nedge,nedge,nedge), intent(out) :: Qp
+        real, dimension(nedge,nedge,nedge) :: Cq, T
+        integer a,b,c,i1,i2
+
+        do a = 1,nedge
+        do b = 1,nedge
+        do c = 1,nedge
+            Cq(c,b,a) = Qc(imode3(c,b,a))
+        end do
+        end do
+        end do
+
+        ! x: T(c,b,ix) = sum_a P_a(x) Cq(c,b,a)
+        do i1 = 1,nedge
+            T(:,:,i1) = bf1d(i1,1)*Cq(:,:,1)
+            do a = 2,nedge
+                T(:,:,i1) = T(:,:,i1) + bf1d(i1,a)*Cq(:,:,a)
+            end do
+        end do
+        ! y: Cq(c,iy,ix) = sum_b P_b(y) T(c,b,ix)
+        do i1 = 1,nedge
+        do i2 = 1,nedge
+            Cq(:,i2,i1) = bf1d(i2,1)*T(:,1,i1)
+            do b = 2,nedge
+                Cq(:,i2,i1) = Cq(:,i2,i1) + bf1d(i2,b)*T(:,b,i1)
+            end do
+        end do
+        end do
+        ! z: Qp(iz,iy,ix) = sum_c P_c(z) Cq(c,iy,ix)
+        do i1 = 1,nedge
+        do i2 = 1,nedge
+            Qp(:,i2,i1) = matmul(bf1d, Cq(:,i2,i1))
+        end do
+        end do
+    end subroutine tp_eval_int
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! tp_eval_face : values of the expansion Qc at the quadrature points of
+    !   an ixyz-face, bfn = bf1d_p (positive face) or bf1d_m (negative face)
+    !------------------------------------------------------------
+    subroutine tp_eval_face(Qc, ixyz, bfn, Qf)
+        implicit none
+        real, dimension(nbasis), intent(in) :: Qc
+        integer, intent(in) :: ixyz
+        real, dimension(nedge), intent(in) :: bfn
+        real, dimension(nedge,nedge), intent(out) :: Qf
+        real, dimension(nedge,nedge) :: S
+        integer a,b,c
+
+        ! Collapse the normal direction: S(fast,slow) in face ordering
+        S(:,:) = 0.
+        select case(ixyz)
+        case(1)  ! S(b,c) = sum_a P_a(+-1) C(c,b,a)
+            do a = 1,nedge
+            do b = 1,nedge
+            do c = 1,nedge
+                S(b,c) = S(b,c) + bfn(a)*Qc(imode3(c,b,a))
+            end do
+            end do
+            end do
+        case(2)  ! S(c,a) = sum_b P_b(+-1) C(c,b,a)
+            do a = 1,nedge
+            do b = 1,nedge
+            do c = 1,nedge
+                S(c,a) = S(c,a) + bfn(b)*Qc(imode3(c,b,a))
+            end do
+            end do
+            end do
+        case(3)  ! S(a,b) = sum_c P_c(+-1) C(c,b,a)
+            do a = 1,nedge
+            do b = 1,nedge
+            do c = 1,nedge
+                S(a,b) = S(a,b) + bfn(c)*Qc(imode3(c,b,a))
+            end do
+            end do
+            end do
+        end select
+
+        ! Qf(p,q) = sum_m sum_n P_m(p) P_n(q) S(m,n)
+        Qf = matmul(bf1d, matmul(S, transpose(bf1d)))
+    end subroutine tp_eval_face
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! tp_int_grad : volume integrals 0.25*cbasis*(dxi*<dphi/dx,fx> + ...) of
+    !   the interior point fluxes against the gradient of every basis mode
+    !------------------------------------------------------------
+    subroutine tp_int_grad(fx, fy, fz, R)
+        implicit none
+        real, dimension(nedge,nedge,nedge), intent(in) :: fx, fy, fz
+        real, dimension(nbasis), intent(out) :: R
+        real, dimension(nedge,nedge,nedge) :: V
+
+        R(:) = 0.
+        call tp_project(fx, dbf1d_w, bf1d_w, bf1d_w, V)
+        call tp_gather(dxi, V, R)
+        if (lact_y) then
+            call tp_project(fy, bf1d_w, dbf1d_w, bf1d_w, V)
+            call tp_gather(dyi, V, R)
+        end if
+        if (lact_z) then
+            call tp_project(fz, bf1d_w, bf1d_w, dbf1d_w, V)
+            call tp_gather(dzi, V, R)
+        end if
+        R(:) = 0.25*cbasis(1:nbasis)*R(:)
+    end subroutine tp_int_grad
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! tp_int_face : face integrals sum(wgt2d*(phi(+)*fp - phi(-)*fm)) of the
+    !   fluxes on the positive/negative ixyz-faces against every basis mode
+    !------------------------------------------------------------
+    subroutine tp_int_face(fp, fm, ixyz, R)
+        implicit none
+        real, dimension(nedge,nedge), intent(in) :: fp, fm
+        integer, intent(in) :: ixyz
+        real, dimension(nbasis), intent(out) :: R
+        real, dimension(nedge,nedge) :: Gp, Gm
+        integer a,b,c
+
+        ! G(m,n) = sum_p sum_q w(p)P_m(p) w(q)P_n(q) f(p,q)
+        Gp = matmul(transpose(bf1d_w), matmul(fp, bf1d_w))
+        Gm = matmul(transpose(bf1d_w), matmul(fm, bf1d_w))
+
+        do a = 1,nedge
+        do b = 1,nedge
+        do c = 1,nedge
+            select case(ixyz)
+            case(1)
+                R(imode3(c,b,a)) = bf1d_p(a)*Gp(b,c) - bf1d_m(a)*Gm(b,c)
+            case(2)
+                R(imode3(c,b,a)) = bf1d_p(b)*Gp(c,a) - bf1d_m(b)*Gm(c,a)
+            case(3)
+                R(imode3(c,b,a)) = bf1d_p(c)*Gp(a,b) - bf1d_m(c)*Gm(a,b)
+            end select
+        end do
+        end do
+        end do
+    end subroutine tp_int_face
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! tp_project : V(c,b,a) = sum_ix Ax(ix,a) sum_iy Ay(iy,b) sum_iz Az(iz,c) F(iz,iy,ix)
+    !------------------------------------------------------------
+    subroutine tp_project(F, Ax, Ay, Az, V)
+        implicit none
+        real, dimension(nedge,nedge,nedge), intent(in) :: F
+        real, dimension(nedge,nedge), intent(in) :: Ax, Ay, Az
+        real, dimension(nedge,nedge,nedge), intent(out) :: V
+        real, dimension(nedge,nedge,nedge) :: T
+        integer i1,i2,n
+
+        ! z: T(c,iy,ix)
+        do i1 = 1,nedge
+        do i2 = 1,nedge
+            T(:,i2,i1) = matmul(F(:,i2,i1), Az)
+        end do
+        end do
+        ! y: V(c,b,ix)
+        do i1 = 1,nedge
+            V(:,:,i1) = matmul(T(:,:,i1), Ay)
+        end do
+        ! x: T(c,b,a)
+        do n = 1,nedge
+            T(:,:,n) = Ax(1,n)*V(:,:,1)
+            do i1 = 2,nedge
+                T(:,:,n) = T(:,:,n) + Ax(i1,n)*V(:,:,i1)
+            end do
+        end do
+        V = T
+    end subroutine tp_project
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! tp_gather : add fac*V(c,b,a) to R at the mode index of P_a P_b P_c
+    !------------------------------------------------------------
+    subroutine tp_gather(fac, V, R)
+        implicit none
+        real, intent(in) :: fac
+        real, dimension(nedge,nedge,nedge), intent(in) :: V
+        real, dimension(nbasis), intent(inout) :: R
+        integer a,b,c
+
+        do a = 1,nedge
+        do b = 1,nedge
+        do c = 1,nedge
+            R(imode3(c,b,a)) = R(imode3(c,b,a)) + fac*V(c,b,a)
+        end do
+        end do
+        end do
+    end subroutine tp_gather
+    !---------------------------------------------------------------------------
+
 end module basis_funcs
@@ -559,8 +559,18 @@ module boundary_custom
     ! Masking params (for advanced or internal initial/boundary conditions)
     !------------------------------------------------------------
     real, dimension(ny,nz,nface,nQ) :: Qxlo_ext_def, Qxlo_ext_scale
-    real, dimension(nx,ny,nface,nQ) :: Qcyl_ext_c, Qcyl_ext
-    logical QMask(nx,ny,nz), MMask(nx,ny,nz)
+    logical MMask(nx,ny,nz)
+    !---------------------------------------------------------------------------
+
+    !===========================================================================
+    ! Immersed bodies (see add_cyl_body)
+    !------------------------------------------------------------
+    integer, parameter :: nbody_max = 16
+    integer :: nbody = 0
+    real, dimension(3,nbody_max) :: body_geo   ! x, y of the axis, radius
+    real, dimension(nbody_max) :: body_dn      ! density held in the body
+    integer :: nbcell = 0
+    integer, dimension(:,:), allocatable :: ibcell  ! (i,j,k, body) of masked cells
     !---------------------------------------------------------------------------
 
 contains
@@ -621,54 +631,107 @@ contains
     end subroutine set_xlobc_inflow
 
 
-    function cyl_in_2d_pipe_mask(xctr, yctr, rad)
-        real, intent(in) :: xctr, yctr, rad
-        real, dimension(nx,ny,nz) :: cyl_in_2d_pipe_mask
-        real :: mask(nx,ny,nz), cyl2, rad2
-        integer i,j
+    !===========================================================================
+    ! Immersed bodies: 2D cylinders (along z) held at rest with density dn
+    !   -- add_cyl_body records the geometry of a body, set_body_lists then
+    !      builds (once, at setup) the list of masked cells; bodies may overlap
+    !   -- apply_body_masks enforces the bodies on every stage and on each
+    !      new state (adaptive_update), on the masked cells only (zero
+    !      momenta, fixed density, no higher modes of either);
+    !      the faces between fluid and masked cells get the usual Riemann flux
+    !   -- clear_bodies removes all bodies (set_ic calls it before an initial
+    !      condition registers its own)
+    !------------------------------------------------------------
+    subroutine add_cyl_body(xctr, yctr, rad, dn)
+        real, intent(in) :: xctr, yctr, rad, dn
+
+        if (nbody == nbody_max) then
+            call mpi_print(iam, 'WARNING: too many immersed bodies, ignoring the last one')
+            return
+        end if
+        nbody = nbody + 1
+        body_geo(1:3,nbody) = (/ xctr, yctr, rad /)
+        body_dn(nbody) = dn
+    end subroutine add_cyl_body
 
-        mask(:,:,:) = .false.
-        rad2 = rad**2
 
+    subroutine clear_bodies
+        nbody = 0
+        nbcell = 0
+        if (allocated(ibcell)) deallocate(ibcell)
+    end subroutine clear_bodies
+
+
+    subroutine set_body_lists
+        integer, dimension(:,:), allocatable :: icell
+        integer i,j,k,ib
+        character(len=128) :: message
+
+        allocate(icell(4,nx*ny*nz))
+        nbcell = 0
+        do k = 1,nz
         do j = 1,ny
         do i = 1,nx
-            xp = xc(i) - xctr
-            yp = yc(j) - yctr
-            cyl2 = xp**2 + yp**2
-
-            if ( cyl2 <= rad2 ) then
-                mask(i,j,:) = .true.
+            ib = body_at(i,j,k)
+            if (ib > 0) then
+                nbcell = nbcell + 1
+                icell(:,nbcell) = (/ i, j, k, ib /)
             end if
         end do
         end do
+        end do
+
+        if (allocated(ibcell)) deallocate(ibcell)
+        allocate(ibcell(4,nbcell))
+        ibcell(:,:) = icell(:,1:nbcell)
+        deallocate(icell)
+
+        write(message,'(a,i0,a,i0,a)') 'Immersed bodies: ', nbody, ' bodies, ', &
+                                       nbcell, ' masked cells'
+        call mpi_print(iam, trim(message))
+    end subroutine set_body_lists
 
-        cyl_in_2d_pipe_mask(:,:,:) = mask(:,:,:)
-        return
-    end function cyl_in_2d_pipe_mask
 
+    subroutine apply_body_masks(Q_r)
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_r
+        integer i,j,k,ic
 
-    subroutine set_cyl_in_2d_pipe_boundaries(Qmask_i, ux_amb, den, pres, Qxlo_e_c, Qcyl_e_c)
-        logical, dimension(nx,ny,nz), intent(in) :: Qmask_i
+        do ic = 1,nbcell
+            i = ibcell(1,ic)
+            j = ibcell(2,ic)
+            k = ibcell(3,ic)
+            Q_r(i,j,k,rh,1) = body_dn(ibcell(4,ic))
+            Q_r(i,j,k,rh,2:nbasis) = 0.0
+            Q_r(i,j,k,mx:mz,:) = 0.0
+        end do
+    end subroutine apply_body_masks
+
+
+    ! First body containing the center of cell (i,j,k), 0 if none
+    integer function body_at(i, j, k)
+        integer, intent(in) :: i, j, k
+        integer ib
+
+        body_at = 0
+        do ib = 1,nbody
+            if ((xc(i) - body_geo(1,ib))**2 + (yc(j) - body_geo(2,ib))**2 <= body_geo(3,ib)**2) then
+                body_at = ib
+                return
+            end if
+        end do
+    end function body_at
+    !---------------------------------------------------------------------------
+
+
+    subroutine set_cyl_in_2d_pipe_boundaries(ux_amb, den, pres, Qxlo_e_c)
         real, intent(in) :: ux_amb, den, pres
         real, dimension(ny,nz,nface,nQ), intent(out) :: Qxlo_e_c
-        real, dimension(nx,ny,nface,nQ), intent(out) :: Qcyl_e_c
 
         real yp,yp0,vx
-        integer :: j,k,ieq,i4
+        integer :: j,k,i4
 
         yp0 = lyd  ! set zero-value of y-coordinate to domain bottom
 
-        ! apply no-slip BCs for cylinder (set all momenta to 0)
-        Qcyl_e_c(:,:,:,:) = 0.0
-        do ieq = rh,en
-            do i4 = 1,nface
-                Qcyl_e_c(:,:,i4,ieq) = Q_r0(:,:,1,i4,ieq)  ! Init to grid values
-                where ( Qmask_i(:,:,1) )
-                    Qcyl_e_c(:,:,i4,ieq) = 0.0             ! Set dens/momenta to 0
-                end where
-            end do
-        end do
-
         ! apply parabolic inflow BCs on lower x wall
         Qxlo_e_c(:,:,:,:) = 0.0
         do i4 = 1,nface
@@ -687,22 +750,6 @@ contains
         end do
     end subroutine set_cyl_in_2d_pipe_boundaries
 
-
-    subroutine apply_cyl_in_2d_pipe_boundaries(Qcyl_e_c, Qcyl_e)
-        real, dimension(nx,ny,nface,nQ), intent(in) :: Qcyl_e_c
-        real, dimension(nx,ny,nface,nQ), intent(inout) :: Qcyl_e  ! TODO: might wanna change
-
-        do ieq=1,nQ
-            where (Qmask(:,:,:))
-                Q_r0(:,:,:,rh,ieq) = 0.0
-                Q_r0(:,:,:,rh,1)   = 1.25
-                Q_r0(:,:,:,mx,ieq) = 0.0
-                Q_r0(:,:,:,my,ieq) = 0.0
-                Q_r0(:,:,:,mz,ieq) = 0.0
-            end where
-        end do
-    end subroutine apply_cyl_in_2d_pipe_boundaries
-
 end module boundary_custom
 
 
@@ -0,0 +1,139 @@
+!***** DIAGNOSTICS.F90 *******************************************************************
+!   In-situ reduced diagnostics written every ndiagstep steps to
+!   outdir/diagnostics.csv (one row per sample, written by rank 0):
+!
+!       step, t, dt, mass, x/y/z momentum, total energy, kinetic energy,
+!       enstrophy, min/max density, min/max pressure
+!
+!   Totals of the conserved variables are exact (cell average * cell volume).
+!   Kinetic energy, enstrophy (1/2 |curl v|^2) and the extrema use the
+!   interior Gauss quadrature points; the velocity gradients there come from
+!   the basis derivative tables.
+!*******************************************************************************
+module diagnostics
+
+use params
+use helpers
+use basis_funcs
+use eos
+
+integer :: ndiag_step = 0   ! number of calls to write_diagnostics so far
+
+contains
+
+    !===========================================================================
+    ! Call once per time step (and once at setup for step 0)
+    !------------------------------------------------------------
+    subroutine write_diagnostics(Q_r, tnow, dtnow)
+
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_r
+        real, intent(in) :: tnow, dtnow
+
+        double precision :: sums(7), mins(2), maxs(2), gsums(7), gmins(2), gmaxs(2)
+        integer :: istep, iu
+
+        istep = ndiag_step
+        ndiag_step = ndiag_step + 1
+        if (ndiagstep <= 0) return
+        if (mod(istep, max(ndiagstep,1)) /= 0) return
+
+        call compute_diagnostics(Q_r, sums, mins, maxs)
+
+        call MPI_REDUCE(sums, gsums, 7, MPI_DOUBLE_PRECISION, MPI_SUM, 0, cartcomm, ierr)
+        call MPI_REDUCE(mins, gmins, 2, MPI_DOUBLE_PRECISION, MPI_MIN, 0, cartcomm, ierr)
+        call MPI_REDUCE(maxs, gmaxs, 2, MPI_DOUBLE_PRECISION, MPI_MAX, 0, cartcomm, ierr)
+
+        if (iam /= 0) return
+
+        if (istep == 0 .and. iread == 0) then
+            open(newunit=iu, file=outdir//'/diagnostics.csv', status='replace', action='write')
+            write(iu,'(a)') 'step,t,dt,mass,momx,momy,momz,energy,kinetic,enstrophy,' // &
+                            'rho_min,rho_max,p_min,p_max'
+        else
+            open(newunit=iu, file=outdir//'/diagnostics.csv', position='append', action='write')
+        end if
+        write(iu,'(i0,13(",",es15.7e3))') istep, tnow, dtnow, gsums,               &
+                                         gmins(1), gmaxs(1), gmins(2), gmaxs(2)
+        close(iu)
+
+    end subroutine write_diagnostics
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Local (this rank) diagnostics:
+    !   sums      = (mass, x/y/z momentum, energy, kinetic energy, enstrophy)
+    !   mins/maxs = (density, pressure)
+    !------------------------------------------------------------
+    subroutine compute_diagnostics(Q_r, sums, mins, maxs)
+
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_r
+        double precision, intent(out) :: sums(7), mins(2), maxs(2)
+
+        real, dimension(npg,rh:en) :: Qp
+        real, dimension(npg,rh:mz) :: Gx, Gy, Gz
+        real, dimension(npg) :: P, cs, T
+        real :: dV, dn, dni, ke, vx, vy, vz, wx, wy, wz
+        double precision :: tot(rh:en), ekin, ens
+        integer :: i,j,k,ieq,ipg
+
+        tot = 0.d0
+        ekin = 0.d0
+        ens = 0.d0
+        mins = huge(1.d0)
+        maxs = -huge(1.d0)
+
+        do k=1,nz
+        do j=1,ny
+        do i=1,nx
+            dV = dxc(i)*dyc(j)*dzc(k)
+
+            ! Totals: only the constant mode has a nonzero cell integral
+            do ieq = rh,en
+                tot(ieq) = tot(ieq) + Q_r(i,j,k,ieq,1)*dV
+            end do
+
+            ! Kinetic energy, enstrophy and extrema at the interior quadrature points
+            do ieq = rh,en
+                Qp(:,ieq) = matmul(bfvals_int(1:npg,1:nbasis), Q_r(i,j,k,ieq,1:nbasis))
+            end do
+            do ieq = rh,mz
+                Gx(:,ieq) = 2.*dxci(i)*matmul(dbfvals_int(1:npg,1:nbasis,1), Q_r(i,j,k,ieq,1:nbasis))
+                Gy(:,ieq) = 2.*dyci(j)*matmul(dbfvals_int(1:npg,1:nbasis,2), Q_r(i,j,k,ieq,1:nbasis))
+                Gz(:,ieq) = 2.*dzci(k)*matmul(dbfvals_int(1:npg,1:nbasis,3), Q_r(i,j,k,ieq,1:nbasis))
+            end do
+            call eos_cons(npg, Qp, P, cs, T)
+            do ipg = 1,npg
+                dn  = Qp(ipg,rh)
+                dni = 1./dn
+                ke  = 0.5*(Qp(ipg,mx)**2 + Qp(ipg,my)**2 + Qp(ipg,mz)**2)*dni
+                ekin = ekin + 0.125*dV*wgt3d(ipg)*ke
+
+                ! d(m/rho) = (dm - v drho)/rho
+                vx = Qp(ipg,mx)*dni
+                vy = Qp(ipg,my)*dni
+                vz = Qp(ipg,mz)*dni
+                wx = ((Gy(ipg,mz) - vz*Gy(ipg,rh)) - (Gz(ipg,my) - vy*Gz(ipg,rh)))*dni
+                wy = ((Gz(ipg,mx) - vx*Gz(ipg,rh)) - (Gx(ipg,mz) - vz*Gx(ipg,rh)))*dni
+                wz = ((Gx(ipg,my) - vy*Gx(ipg,rh)) - (Gy(ipg,mx) - vx*Gy(ipg,rh)))*dni
+                ens = ens + 0.125*dV*wgt3d(ipg)*0.5*(wx**2 + wy**2 + wz**2)
+
+                mins(1) = min(mins(1), dble(dn))
+                maxs(1) = max(maxs(1), dble(dn))
+                mins(2) = min(mins(2), dble(P(ipg)))
+                maxs(2) = max(maxs(2), dble(P(ipg)))
+            end do
+        end do
+        end do
+        end do
+
+        sums(1:5) = tot(rh:en)
+        sums(6) = ekin
+        sums(7) = ens
+
+    end subroutine compute_diagnostics
+    !---------------------------------------------------------------------------
+
+end module diagnostics
@@ -0,0 +1,137 @@
+"""Ensemble runner for independent realizations (e.g. llns fluctuating hydro).
+
+The MPI world is split into groups of ``procs_per_member`` ranks. Each group
+runs its share of the N realizations one after another, reusing one
+initialized solver (see simulation.py), with a distinct seed per realization.
+Running means and variances of the selected cell-averaged fields are kept in
+memory (Welford's algorithm), merged across groups at the end, and only these
+statistics are written; no per-realization output is produced.
+
+    mpirun -n 8 python ensemble.py             # 8 single-rank members
+
+Each rank of the first group writes the statistics of its own subdomain to
+``<prefix>_rank<NNNN>.npz`` (arrays count, <field>_mean, <field>_var).
+"""
+import numpy as np
+from mpi4py import MPI
+
+from simulation import Simulation
+
+
+# Index of each conserved variable in the nQ dimension of Q
+FIELDS = {'rh': 0, 'mx': 1, 'my': 2, 'mz': 3, 'en': 4,
+          'pxx': 5, 'pyy': 6, 'pzz': 7, 'pxy': 8, 'pxz': 9, 'pyz': 10}
+
+
+class RunningStats(object):
+    """Running mean and variance of an array-valued sample (Welford)."""
+
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def push(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(x - self.mean)
+
+    def merge(self, count, mean, m2):
+        """Combine with the statistics of another set of samples (Chan et al.)."""
+        if count == 0:
+            return
+        n = self.count + count
+        delta = mean - self.mean
+        self.mean += delta*(float(count)/n)
+        self.m2 += m2 + delta**2*(float(self.count)*count/n)
+        self.count = n
+
+    @property
+    def var(self):
+        """Unbiased sample variance."""
+        if self.count < 2:
+            return np.zeros_like(self.m2)
+        return self.m2/(self.count - 1)
+
+
+def run_ensemble(nmembers, until, fields=('rh',), nx=50, ny=1, nz=1,
+                 ic=None, seed=1234, procs_per_member=1, sample_every=None,
+                 t_burn=0.0, prefix='ensemble', comm=None):
+    """Run ``nmembers`` realizations and write ensemble statistics.
+
+    nmembers         : number of realizations
+    until            : final time of each realization
+    fields           : names of the variables (keys of FIELDS) to accumulate
+    nx, ny, nz       : local grid size compiled into input.f90
+    ic               : initial condition id (None: icid in input.f90)
+    seed             : realization i uses seed + i
+    procs_per_member : MPI ranks per realization (must match mpi_nx*mpi_ny*mpi_nz)
+    sample_every     : if given, sample every this many steps once
+                       t >= t_burn (time averaging of a stationary state);
+                       otherwise only the final state of each member is used
+    prefix           : output file prefix
+
+    Returns the dict of RunningStats on the first group, None elsewhere.
+    """
+    comm = MPI.COMM_WORLD if comm is None else comm
+    rank = comm.Get_rank()
+    if comm.Get_size() % procs_per_member != 0:
+        raise ValueError('number of ranks must be a multiple of procs_per_member')
+
+    ngroups = comm.Get_size()//procs_per_member
+    group = rank//procs_per_member
+    # The solver builds its Cartesian topology without reordering, so the
+    # rank in member_comm is the rank (subdomain) in the solver's grid
+    member_comm = comm.Split(group, rank)               # ranks of one realization
+    across_comm = comm.Split(member_comm.Get_rank(), rank)  # same subdomain, all groups
+
+    sim = Simulation(nx, ny, nz, comm=member_comm, output=False)
+    stats = dict((name, RunningStats((nx, ny, nz))) for name in fields)
+
+    def sample(snap):
+        for name in fields:
+            stats[name].push(snap.cell_average(FIELDS[name]))
+
+    for imember in range(group, nmembers, ngroups):
+        sim.reseed(seed + imember)
+        ic_member = -1 if ic is None else ic
+        if sample_every:
+            # run() also yields the final state off the cadence: skip it so
+            # the samples stay evenly spaced
+            for snap in sim.run(until, every=sample_every, ic=ic_member):
+                if (snap.step > 0 and snap.step % sample_every == 0
+                        and snap.t >= t_burn):
+                    sample(snap)
+        else:
+            for snap in sim.run(until, ic=ic_member):
+                pass
+            sample(snap)
+        sim.finish()
+
+    # Merge the statistics of all groups into group 0
+    for name in fields:
+        s = stats[name]
+        parts = across_comm.gather((s.count, s.mean, s.m2), root=0)
+        if across_comm.Get_rank() == 0:
+            total = RunningStats(s.mean.shape)
+            for count, mean, m2 in parts:
+                total.merge(count, mean, m2)
+            stats[name] = total
+
+    if group != 0:
+        return None
+
+    out = {'count': stats[fields[0]].count}
+    for name in fields:
+        out[name + '_mean'] = stats[name].mean
+        out[name + '_var'] = stats[name].var
+    np.savez('{}_rank{:04d}.npz'.format(prefix, member_comm.Get_rank()), **out)
+    return stats
+
+
+if __name__ == '__main__':
+    from simulation import shutdown
+
+    run_ensemble(nmembers=16, until=7.0e-4, fields=('rh', 'en'))
+    shutdown()
@@ -0,0 +1,238 @@
+!***** EOS.F90 ***************************************************************************
+!   Equations of state, evaluated for a whole batch of states per call.
+!
+!   eos_state(n, dn, ei, P, cs, T) returns the pressure, sound speed and
+!   temperature (P/rho of the thermal part, code units) for n states given
+!   their densities dn and internal energy densities ei = E - rho*v^2/2.
+!   It points to one of the EOS below, chosen by select_eos at setup:
+!
+!       ieos = 1 : ideal gas        P = (gamma-1)*ei
+!       ieos = 2 : Tait + thermal   P = P_tait(rho) + (gamma-1)*ei
+!
+!   eos_cons does the same from the conserved variables (rho, m, E).
+!
+!   Fast evaluation of the Murnaghan-Tait EOS for water (ieos = 2):
+!
+!       P    = P_1*(rho**n_tm - 1) + P_base
+!       cs^2 = dP/drho = n_tm*P_1*rho**(n_tm-1)
+!
+!   Both are written in terms of h(rho) = rho**(n_tm-2):
+!
+!       P = P_1*(rho*rho*h - 1) + P_base,    cs^2 = n_tm*P_1*rho*h
+!
+!   and h is read from a table on [rh_tab_lo, rh_tab_hi] with cubic Hermite
+!   interpolation (h and dh/drho tabulated), so one lookup gives both values
+!   without the pow (log + exp) calls. Densities outside the table fall back to
+!   the exact form. eos_check reports the interpolation error against it.
+!*******************************************************************************
+module eos
+
+use params
+use helpers
+
+! Kept in double precision: P = P_1*(rho**n_tm - 1) cancels strongly near rho = 1
+double precision, dimension(0:ntab_eos) :: h_tab, dh_tab  ! h and dh/drho at the nodes
+double precision :: drh_tab, drh_tab_i
+
+    !===========================================================================
+    ! ABSTRACT INTERFACE to a batched equation of state
+    !-----------------------------------------------------------------
+    abstract interface
+        subroutine eos_ptr (n, dn, ei, P, cs, T)
+            integer, intent(in) :: n
+            real, dimension(n), intent(in)  :: dn, ei
+            real, dimension(n), intent(out) :: P, cs, T
+        end subroutine eos_ptr
+    end interface
+    !---------------------------------------------------------------------------
+
+    procedure (eos_ptr), pointer :: eos_state => null ()
+
+    ! Ratio of the signal speed get_min_dt uses to the EOS sound speed. The
+    ! cflm values of set_cflm were tuned with sqrt(gamma*e) for the ideal gas,
+    ! above its sound speed sqrt(gamma*(gamma-1)*e)
+    real :: cs_cfl = 1.
+
+contains
+
+    !===========================================================================
+    ! Select the equation of state (ieos) at runtime
+    !-----------------------------------------------------------------
+    subroutine select_eos(ieos_in, eos)
+        implicit none
+        integer, intent(in) :: ieos_in
+        procedure(eos_ptr), pointer :: eos
+
+        select case (ieos_in)
+            case (1)
+                call mpi_print(iam, 'Selected ideal gas EOS')
+                eos => eos_ideal
+                cs_cfl = 1./sqrt(aindm1)
+            case (2)
+                call mpi_print(iam, 'Selected Tait EOS (tabulated)')
+                eos => eos_tait
+                cs_cfl = 1.
+            case default
+                call mpi_print(iam, 'Defaulting to ideal gas EOS')
+                eos => eos_ideal
+                cs_cfl = 1./sqrt(aindm1)
+        end select
+    end subroutine select_eos
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! P, cs and T of n states given as conserved variables Qp(:,rh:en)
+    !------------------------------------------------------------
+    subroutine eos_cons(n, Qp, P, cs, T)
+        implicit none
+        integer, intent(in) :: n
+        real, dimension(n,rh:en), intent(in) :: Qp
+        real, dimension(n), intent(out) :: P, cs, T
+        real, dimension(n) :: ei
+
+        ei = Qp(:,en) - 0.5*(Qp(:,mx)**2 + Qp(:,my)**2 + Qp(:,mz)**2)/Qp(:,rh)
+        call eos_state(n, Qp(:,rh), ei, P, cs, T)
+    end subroutine eos_cons
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Batched equations of state (see eos_ptr)
+    !------------------------------------------------------------
+    subroutine eos_ideal(n, dn, ei, P, cs, T)
+        implicit none
+        integer, intent(in) :: n
+        real, dimension(n), intent(in)  :: dn, ei
+        real, dimension(n), intent(out) :: P, cs, T
+
+        P  = aindm1*ei
+        T  = P/dn
+        cs = sqrt(aindex*T)
+    end subroutine eos_ideal
+
+    subroutine eos_tait(n, dn, ei, P, cs, T)
+        implicit none
+        integer, intent(in) :: n
+        real, dimension(n), intent(in)  :: dn, ei
+        real, dimension(n), intent(out) :: P, cs, T
+        real, dimension(n) :: cs2
+
+        ! cold (Tait) part from the table, plus an ideal-gas thermal part
+        call tait_eos(dn, P, cs2)
+        T  = aindm1*ei/dn
+        P  = P + aindm1*ei
+        cs = sqrt(cs2 + aindex*max(T, 0.))
+    end subroutine eos_tait
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Fill the table (call once before any tait_* evaluation)
+    !------------------------------------------------------------
+    subroutine eos_init()
+        implicit none
+        integer :: itab
+        double precision :: rho
+
+        drh_tab   = dble(rh_tab_hi - rh_tab_lo)/ntab_eos
+        drh_tab_i = 1.d0/drh_tab
+
+        do itab = 0,ntab_eos
+            rho = rh_tab_lo + itab*drh_tab
+            h_tab(itab)  = rho**(n_tm - 2.d0)
+            dh_tab(itab) = (n_tm - 2.d0)*rho**(n_tm - 3.d0)
+        end do
+    end subroutine eos_init
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Pressure and squared sound speed of the Tait EOS at density dn
+    !------------------------------------------------------------
+    elemental subroutine tait_eos(dn, P, cs2)
+        implicit none
+        real, intent(in)  :: dn
+        real, intent(out) :: P, cs2
+        double precision :: h
+
+        h = tait_h(dn)
+        P   = real(P_1*(dble(dn)*dn*h - 1.d0) + P_base)
+        cs2 = real(n_tm*P_1*dn*h)
+    end subroutine tait_eos
+    !---------------------------------------------------------------------------
+
+    elemental real function tait_pressure(dn)
+        implicit none
+        real, intent(in) :: dn
+        tait_pressure = real(P_1*(dble(dn)*dn*tait_h(dn) - 1.d0) + P_base)
+    end function tait_pressure
+
+    elemental real function tait_cs2(dn)
+        implicit none
+        real, intent(in) :: dn
+        tait_cs2 = real(n_tm*P_1*dn*tait_h(dn))
+    end function tait_cs2
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Compare the tabulated EOS with the exact form on a grid 10x finer than
+    ! the table, and report the maximum relative errors
+    !------------------------------------------------------------
+    subroutine eos_check(mpi_id)
+        implicit none
+        integer, intent(in) :: mpi_id
+        integer :: i, n
+        real :: dn, P, cs2
+        double precision :: P_ex, cs2_ex, errP, errc
+        character(len=256) :: message
+
+        n = 10*ntab_eos
+        errP = 0.d0
+        errc = 0.d0
+        do i = 0,n
+            dn = rh_tab_lo + i*(rh_tab_hi - rh_tab_lo)/n
+            call tait_eos(dn, P, cs2)
+            P_ex   = P_1*(dble(dn)**n_tm - 1.d0) + P_base
+            cs2_ex = n_tm*P_1*dble(dn)**(n_tm - 1.d0)
+            errP = max(errP, abs(P - P_ex)/max(abs(P_ex), dble(P_base)))
+            errc = max(errc, abs(cs2 - cs2_ex)/cs2_ex)
+        end do
+
+        write(message,'(a,es9.2,a,es9.2)') 'Tabulated Tait EOS: max rel. error in P = ', &
+                                          errP, ', in cs^2 = ', errc
+        call mpi_print(mpi_id, trim(message))
+    end subroutine eos_check
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Internal helpers
+    !------------------------------------------------------------
+    ! h(rho) = rho**(n_tm-2) by cubic Hermite interpolation in the table
+    elemental double precision function tait_h(dn)
+        implicit none
+        real, intent(in) :: dn
+        double precision :: s, s2, s3
+        integer :: itab
+
+        if (dn < rh_tab_lo .or. dn >= rh_tab_hi) then
+            tait_h = dble(dn)**(n_tm - 2.d0)
+            return
+        end if
+
+        s = (dn - rh_tab_lo)*drh_tab_i
+        itab = min(int(s), ntab_eos-1)
+        s = s - itab
+        s2 = s*s
+        s3 = s2*s
+
+        tait_h = (2.d0*s3 - 3.d0*s2 + 1.d0)*h_tab(itab)                         &
+               + (s3 - 2.d0*s2 + s)*drh_tab*dh_tab(itab)                        &
+               + (3.d0*s2 - 2.d0*s3)*h_tab(itab+1)                              &
+               + (s3 - s2)*drh_tab*dh_tab(itab+1)
+    end function tait_h
+    !---------------------------------------------------------------------------
+
+end module eos
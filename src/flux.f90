@@ -4,9 +4,12 @@ module flux
 use params
 use helpers
 use basis_funcs
+use kernels
 
 use boundary
-! use random  ! TODO: commented to get working w/o MKL
+use activity
+use eos
+use random
 
 ! Only used by flux_calc (flux_cal) and glflux
 real, dimension(nface,1:nx+1,ny,nz,1:nQ) :: flux_x
@@ -20,25 +23,36 @@ real, dimension(nfe,nQ) :: fface_x,fface_y,fface_z  ! in CES's code, these are i
 contains
 
 !-------------------------------------------------------------------------------
-    subroutine flux_calc_pnts_r(Qpnts_r,fpnts_r,ixyz,npnts)
+    subroutine flux_calc_pnts_r(Qpnts_r,fpnts_r,ixyz,npnts,Rpnts_r)
         ! Calculate the flux "fpnts_r" in direction "ixyz" (x, y, or z) at a set of
         ! points corresponding to conserved quantities "Qpnts_r":
         !   ixyz = <1,2,3>: <x,y,z>-direction
+        ! With llns, "Rpnts_r" holds the random stresses and heat fluxes at the
+        ! points (pre-generated by random_forcing, see random.f90)
         implicit none
         integer ife,ixyz,npnts
         real, dimension(npnts,nQ) :: Qpnts_r, fpnts_r
+        real, dimension(nrnd,npnts), intent(in), optional :: Rpnts_r
         real dn,M_x,M_y,M_z,Ener, P_xx,P_yy,P_zz,P_xy,P_xz,P_yz
         real dni, vx,vy,vz,smsq, P,P_5,P_10
+        real, dimension(npnts) :: Ppnts, cspnts, Tpnts
 
-        real Spnts_r(npnts,3,3), Hpnts_r(npnts,3)
         real Sxx,Syy,Szz,Sxy,Sxz,Syz, Qx,Qy,Qz
 
         c2d3cv = c2d3*colvis  ! global vars declared in params.f90
         c4d3cv = c4d3*colvis  ! global vars declared in params.f90
 
-        Spnts_r(:,:,:) = 0.0
-        Hpnts_r(:,:) = 0.0
-        ! if (llns) call random_stresses_pnts_r(Spnts_r, npnts)  ! TODO: commented to get working w/o MKL
+        Sxx = 0.0
+        Syy = 0.0
+        Szz = 0.0
+        Sxy = 0.0
+        Sxz = 0.0
+        Syz = 0.0
+        Qx = 0.0
+        Qy = 0.0
+        Qz = 0.0
+
+        call eos_cons(npnts, Qpnts_r(:,rh:en), Ppnts, cspnts, Tpnts)
 
         do ife = 1,npnts
             dn   = Qpnts_r(ife,rh)
@@ -59,25 +73,26 @@ contains
             vz = M_z*dni
             smsq = M_x**2 + M_y**2 + M_z**2
 
-            P = aindm1*( Ener - 0.5*dni*smsq )
+            P = Ppnts(ife)
             P_10 = c1d3 * ( P_xx + P_yy + P_zz - dni*smsq )
-            if (ieos == 2) P = P_1*(dn**7.2 - 1.) + P_base + P
             if (P < P_floor) P = P_floor
             if (P_10 < P_floor) P_10 = P_floor
             P_5 = P
 
             ! NOTE: may not need all values since ixyz choose flux direction
             ! TODO: can use pxx thru pyz flags to specify the random stresses!
-            Sxx = Spnts_r(ife,1,1)
-            Syy = Spnts_r(ife,2,2)
-            Szz = Spnts_r(ife,3,3)
-            Sxy = Spnts_r(ife,1,2)
-            Sxz = Spnts_r(ife,1,3)
-            Syz = Spnts_r(ife,2,3)
-
-            Qx = Hpnts_r(ife,1)
-            Qy = Hpnts_r(ife,2)
-            Qz = Hpnts_r(ife,3)
+            if (present(Rpnts_r)) then
+                Sxx = Rpnts_r(1,ife)
+                Syy = Rpnts_r(2,ife)
+                Szz = Rpnts_r(3,ife)
+                Sxy = Rpnts_r(4,ife)
+                Sxz = Rpnts_r(5,ife)
+                Syz = Rpnts_r(6,ife)
+
+                Qx = Rpnts_r(7,ife)
+                Qy = Rpnts_r(8,ife)
+                Qz = Rpnts_r(9,ife)
+            end if
 
             select case(ixyz)
             case(1)
@@ -197,25 +212,36 @@ contains
     subroutine calc_flux_x(Q_r, flux_x)
         implicit none
         real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_r
-        real, dimension(nface,nx+1,ny,nz,nQ), intent(out) :: flux_x
+        real, dimension(nface,nx+1,ny,nz,nQ), intent(inout) :: flux_x
 
         ! real, dimension(nface,nQ) :: cfrx
         ! real, dimension(nfe,nQ) :: Qface_x,fface_x
 
-        integer i,j,k,ieq,iback,i4,i4p,ipnt
+        integer i,j,k,ieq,iback,i4,i4p,ipnt,itr
         real cwavex(nfe),fhllc_x(nface,5),qvin(nQ)
+        real Qtr_x(nface,nQ)  ! + trace of cell itr along x
 
         do k=1,nz
-            !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(iback,Qface_x,qvin) FIRSTPRIVATE(fface_x,cfrx,cwavex,fhllc_x)
+            !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(iback,itr,Qface_x,qvin,Qtr_x) FIRSTPRIVATE(fface_x,cfrx,cwavex,fhllc_x)
             do j=1,ny
+            itr = 0
             do i=1,nx+1
                 iback = i-1
+                ! Faces between two inactive cells are not needed
+                if (.not. (lcell_act(iback,j,k) .or. lcell_act(i,j,k))) cycle
 
                 if (i > 1) then
                     do ieq = 1,nQ
-                        do ipnt=1,nface
-                            Qface_x(ipnt,ieq) = sum(bfvals_xp(ipnt,1:nbasis)*Q_r(iback,j,k,ieq,1:nbasis))
-                        end do
+                        if (lkern) then
+                            call kern_eval_face(Q_r(iback,j,k,ieq,1:nbasis), 2, Qface_x(1:nface,ieq))
+                        else if (ltensor) then
+                            call tp_eval_face(Q_r(iback,j,k,ieq,1:nbasis), 1, bf1d_p, Qface_x(1:nface,ieq))
+                        else if (itr == iback) then
+                            ! + trace of cell i-1, from its face_trace_pair call
+                            Qface_x(1:nface,ieq) = Qtr_x(1:nface,ieq)
+                        else
+                            call face_trace(Q_r(iback,j,k,ieq,1:nbasis), 1, 1., Qface_x(1:nface,ieq))
+                        end if
                     end do
                 end if
                 if (i == 1) then
@@ -226,10 +252,15 @@ contains
 
                 if (i < nx+1) then
                     do ieq = 1,nQ
-                        do ipnt=1,nface
-                            Qface_x(ipnt+nface,ieq) = sum(bfvals_xm(ipnt,1:nbasis)*Q_r(i,j,k,ieq,1:nbasis))
-                        end do
+                        if (lkern) then
+                            call kern_eval_face(Q_r(i,j,k,ieq,1:nbasis), 1, Qface_x(nface+1:nfe,ieq))
+                        else if (ltensor) then
+                            call tp_eval_face(Q_r(i,j,k,ieq,1:nbasis), 1, bf1d_m, Qface_x(nface+1:nfe,ieq))
+                        else
+                            call face_trace_pair(Q_r(i,j,k,ieq,1:nbasis), 1, Qtr_x(1:nface,ieq), Qface_x(nface+1:nfe,ieq))
+                        end if
                     end do
+                    itr = i
                 end if
                 if (i == nx+1) then
                     do ieq = 1,nQ
@@ -237,7 +268,11 @@ contains
                     end do
                 end if
 
-                call flux_calc_pnts_r(Qface_x,fface_x,1,nfe)
+                if (llns) then
+                    call flux_calc_pnts_r(Qface_x,fface_x,1,nfe,Rflux_x(:,:,i,j,k))
+                else
+                    call flux_calc_pnts_r(Qface_x,fface_x,1,nfe)
+                end if
 
                 ! if (.not. ihllc) then
                 if (ivis == 2) then
@@ -282,7 +317,7 @@ contains
     subroutine calc_flux_y(Q_r, flux_y)
         implicit none
         real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_r
-        real, dimension(nface,nx,ny+1,nz,nQ), intent(out) :: flux_y
+        real, dimension(nface,nx,ny+1,nz,nQ), intent(inout) :: flux_y
 
         ! real, dimension(nface,nQ) :: cfry
         ! real, dimension(nfe,nQ) :: Qface_y,fface_y
@@ -295,12 +330,17 @@ contains
             do j=1,ny+1
             jleft = j-1
             do i=1,nx
+                if (.not. (lcell_act(i,jleft,k) .or. lcell_act(i,j,k))) cycle
 
                 if (j > 1) then
                     do ieq = 1,nQ
-                        do ipnt=1,nface
-                            Qface_y(ipnt,ieq) = sum(bfvals_yp(ipnt,1:nbasis)*Q_r(i,jleft,k,ieq,1:nbasis))
-                        end do
+                        if (lkern) then
+                            call kern_eval_face(Q_r(i,jleft,k,ieq,1:nbasis), 4, Qface_y(1:nface,ieq))
+                        else if (ltensor) then
+                            call tp_eval_face(Q_r(i,jleft,k,ieq,1:nbasis), 2, bf1d_p, Qface_y(1:nface,ieq))
+                        else
+                            call face_trace(Q_r(i,jleft,k,ieq,1:nbasis), 2, 1., Qface_y(1:nface,ieq))
+                        end if
                     end do
                 end if
                 if (j == 1) then
@@ -311,9 +351,13 @@ contains
 
                 if (j < ny+1) then
                     do ieq = 1,nQ
-                        do ipnt=1,nface
-                            Qface_y(ipnt+nface,ieq) = sum(bfvals_ym(ipnt,1:nbasis)*Q_r(i,j,k,ieq,1:nbasis))
-                        end do
+                        if (lkern) then
+                            call kern_eval_face(Q_r(i,j,k,ieq,1:nbasis), 3, Qface_y(nface+1:nfe,ieq))
+                        else if (ltensor) then
+                            call tp_eval_face(Q_r(i,j,k,ieq,1:nbasis), 2, bf1d_m, Qface_y(nface+1:nfe,ieq))
+                        else
+                            call face_trace(Q_r(i,j,k,ieq,1:nbasis), 2, -1., Qface_y(nface+1:nfe,ieq))
+                        end if
                     end do
                 end if
                 if (j == ny+1) then
@@ -322,7 +366,11 @@ contains
                     end do
                 end if
 
-                call flux_calc_pnts_r(Qface_y,fface_y,2,nfe)
+                if (llns) then
+                    call flux_calc_pnts_r(Qface_y,fface_y,2,nfe,Rflux_y(:,:,i,j,k))
+                else
+                    call flux_calc_pnts_r(Qface_y,fface_y,2,nfe)
+                end if
 
                 ! if (.not. ihllc) then
                 if (ivis == 2) then
@@ -367,7 +415,7 @@ contains
     subroutine calc_flux_z(Q_r, flux_z)
         implicit none
         real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_r
-        real, dimension(nface,nx,ny,nz+1,nQ), intent(out) :: flux_z
+        real, dimension(nface,nx,ny,nz+1,nQ), intent(inout) :: flux_z
 
         ! real, dimension(nface,nQ) :: cfrz
         ! real, dimension(nfe,nQ) :: Qface_z, fface_z
@@ -380,13 +428,17 @@ contains
             !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(Qface_z,qvin) FIRSTPRIVATE(fface_z,cfrz,cwavez,fhllc_z)
             do j=1,ny
             do i=1,nx
+                if (.not. (lcell_act(i,j,kdown) .or. lcell_act(i,j,k))) cycle
 
                 if (k > 1) then
                     do ieq = 1,nQ
-                        do ipnt=1,nface
-                            Qface_z(ipnt,ieq) = sum( bfvals_zp(ipnt,1:nbasis)   &
-                                                    *Q_r(i,j,kdown,ieq,1:nbasis))
-                        end do
+                        if (lkern) then
+                            call kern_eval_face(Q_r(i,j,kdown,ieq,1:nbasis), 6, Qface_z(1:nface,ieq))
+                        else if (ltensor) then
+                            call tp_eval_face(Q_r(i,j,kdown,ieq,1:nbasis), 3, bf1d_p, Qface_z(1:nface,ieq))
+                        else
+                            call face_trace(Q_r(i,j,kdown,ieq,1:nbasis), 3, 1., Qface_z(1:nface,ieq))
+                        end if
                     end do
                 end if
                 if (k == 1) then
@@ -397,10 +449,13 @@ contains
 
                 if (k < nz+1) then
                     do ieq = 1,nQ
-                        do ipnt=1,nface
-                            Qface_z(ipnt+nface,ieq) = sum( bfvals_zm(ipnt,1:nbasis) &
-                                                          *Q_r(i,j,k,ieq,1:nbasis))
-                        end do
+                        if (lkern) then
+                            call kern_eval_face(Q_r(i,j,k,ieq,1:nbasis), 5, Qface_z(nface+1:nfe,ieq))
+                        else if (ltensor) then
+                            call tp_eval_face(Q_r(i,j,k,ieq,1:nbasis), 3, bf1d_m, Qface_z(nface+1:nfe,ieq))
+                        else
+                            call face_trace(Q_r(i,j,k,ieq,1:nbasis), 3, -1., Qface_z(nface+1:nfe,ieq))
+                        end if
                     end do
                 end if
                 if (k == nz+1) then
@@ -409,7 +464,11 @@ contains
                     end do
                 end if
 
-                call flux_calc_pnts_r(Qface_z,fface_z,3,nfe)
+                if (llns) then
+                    call flux_calc_pnts_r(Qface_z,fface_z,3,nfe,Rflux_z(:,:,i,j,k))
+                else
+                    call flux_calc_pnts_r(Qface_z,fface_z,3,nfe)
+                end if
 
                 ! if (.not. ihllc) then
                 if (ivis == 2) then
@@ -476,7 +535,7 @@ contains
         real sm_num(nface),sm_den(nface),qtilde(nface,5),rtrho(nfe),rtrho_i(nface),qsq(nfe)
         real s_lr(nfe),ctilde(nface),hlr(nfe),cslr(nfe),ctsq(nface),Zi, mfact, csfac
         real aq(nfe),bq(nfe),Qstar(nfe,6),fstar(nfe,6),pstar(nface),s_m(nface)
-        real rhov(nfe),vlr(nfe,3),plr(nfe),rho_i
+        real rhov(nfe),vlr(nfe,3),plr(nfe),rho_i,csnd(nfe),Tlr(nfe)
         real qslr(nfe),sq_lr(nfe),slrm_i(nfe),B2(nfe),cf(nfe)
         integer ixyz,i4,i4p1,nr,jie,k,k2,ieq,iparr,iperp1,iperp2,ibatten
         integer rhj,mxj,myj,mzj,enj,psj,ivar(5),ipassive,nhll,ib1,ib2
@@ -522,20 +581,15 @@ contains
             vlr(k,2) = Qlr(k,iperp1)*rho_i        ! velocity in perpendicular direction 1
             vlr(k,3) = Qlr(k,iperp2)*rho_i        ! velocity in perpendicular direction 2
             qsq(k) = vlr(k,1)**2 + vlr(k,2)**2 + vlr(k,3)**2
-            plr(k) = aindm1*(Qlr(k,enj) - 0.5*rhov(k)*qsq(k))        ! pressure
-            if(ieos == 2) plr(k) = P_1*(rhov(k)**7.2 - 1.) + P_base + plr(k)
             rtrho(k) = sqrt(rhov(k))
         end do
 
+        call eos_cons(nfe, Qlr(:,rh:en), plr, csnd, Tlr)    ! pressure, sound speed
+
         do k=1,nface
             k2 = k + nface
-            if(ieos == 2)then
-                cslr(k) = vlr(k,1) - sqrt(7.2*P_1*rhov(k)**6.2 + plr(k)*rho_i)       ! lambda_M(Q_l)
-                cslr(k2) = vlr(k2,1) + sqrt(7.2*P_1*rhov(k2)**6.2 + plr(k2)*rho_i)       ! lambda_P(Q_r)
-            else
-                cslr(k) = vlr(k,1) - sqrt(aindex*plr(k)/rhov(k))       ! lambda_M(Q_l)
-                cslr(k2) = vlr(k2,1) + sqrt(aindex*plr(k2)/rhov(k2) )       ! lambda_P(Q_r)
-            end if
+            cslr(k) = vlr(k,1) - csnd(k)       ! lambda_M(Q_l)
+            cslr(k2) = vlr(k2,1) + csnd(k2)       ! lambda_P(Q_r)
         end do
 
         if (ibatten == 1) then  ! compute wave speeds using Roe averages following Batten, 1997
@@ -566,13 +620,8 @@ contains
         if (ibatten == 0) then
             do k=1,nface
                 k2 = k + nface
-                if(ieos == 2)then
-                    qslr(k) = vlr(k2,1) - sqrt(7.2*P_1*rhov(k2)**6.2 + plr(k2)*rho_i)       ! lambda_M(Q_r)
-                    qslr(k2) = vlr(k,1) + sqrt(7.2*P_1*rhov(k)**6.2 + plr(k)*rho_i)       ! lambda_P(Q_l)
-                else
-                    qslr(k) = vlr(k2,1) - sqrt(aindex*plr(k2)/rhov(k2))       ! lambda_M(Q_r)
-                    qslr(k2) = vlr(k,1) + sqrt(aindex*plr(k)/rhov(k))       ! lambda_P(Q_l)
-                    end if
+                qslr(k) = vlr(k2,1) - csnd(k2)       ! lambda_M(Q_r)
+                qslr(k2) = vlr(k,1) + csnd(k)       ! lambda_P(Q_l)
             end do
         end if
 
@@ -668,9 +717,15 @@ contains
                 end do
             end do
 
-            call flux_calc_pnts_r(Qinner,finner_x,1,npg)
-            call flux_calc_pnts_r(Qinner,finner_y,2,npg)
-            call flux_calc_pnts_r(Qinner,finner_z,3,npg)
+            if (llns) then
+                call flux_calc_pnts_r(Qinner,finner_x,1,npg,Rinner(:,:,i,j,k))
+                call flux_calc_pnts_r(Qinner,finner_y,2,npg,Rinner(:,:,i,j,k))
+                call flux_calc_pnts_r(Qinner,finner_z,3,npg,Rinner(:,:,i,j,k))
+            else
+                call flux_calc_pnts_r(Qinner,finner_x,1,npg)
+                call flux_calc_pnts_r(Qinner,finner_y,2,npg)
+                call flux_calc_pnts_r(Qinner,finner_z,3,npg)
+            end if
 
             do ieq = 1,nQ
 
@@ -754,165 +809,210 @@ contains
         real, dimension(npg,nQ)     :: Qinner, finner_x,finner_y,finner_z
         real, dimension(nbastot,nQ) :: int_r
         real sum1,sum2,sum3,sum4,sum5,sum6,sum7,sum8,sum9
-        integer i,j,k,ieq,ipg,ir
+        integer i,j,k,ic,ieq,ipg,ir,ia
 
         integral_r(:,:,:,:,:) = 0.
 
-        do k = 1,nz
-        !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(Qinner,integral_r,sum1,sum2,sum3,sum4,sum5,sum6,sum7,sum8,sum8) FIRSTPRIVATE(finner_x,finner_y,finner_z,int_r)
-        do j = 1,ny
-        do i = 1,nx
+        !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(i,j,k,Qinner,integral_r,sum1,sum2,sum3,sum4,sum5,sum6,sum7,sum8,sum8) FIRSTPRIVATE(finner_x,finner_y,finner_z,int_r)
+        do ic = 1,ncell_act
+            i = icell_act(1,ic)
+            j = icell_act(2,ic)
+            k = icell_act(3,ic)
 
             do ieq = 1,nQ
-                do ipg = 1,npg
-                    Qinner(ipg,ieq) = sum(bfvals_int(ipg,1:nbasis)*Q_r(i,j,k,ieq,1:nbasis))
-                end do
+                if (lkern) then
+                    call kern_eval_int(Q_r(i,j,k,ieq,1:nbasis), Qinner(:,ieq))
+                else if (ltensor) then
+                    call tp_eval_int(Q_r(i,j,k,ieq,1:nbasis), Qinner(:,ieq))
+                else
+                    do ipg = 1,npg
+                        Qinner(ipg,ieq) = sum( bfvals_int(ipg,ibas_act(1:nbas_act))   &
+                                              *Q_r(i,j,k,ieq,ibas_act(1:nbas_act)))
+                    end do
+                end if
             end do
 
-            call flux_calc_pnts_r(Qinner,finner_x,1,npg)
-            call flux_calc_pnts_r(Qinner,finner_y,2,npg)
-            call flux_calc_pnts_r(Qinner,finner_z,3,npg)
-
-            do ieq = 1,nQ
+            if (llns) then
+                call flux_calc_pnts_r(Qinner,finner_x,1,npg,Rinner(:,:,i,j,k))
+                if (lact_y) call flux_calc_pnts_r(Qinner,finner_y,2,npg,Rinner(:,:,i,j,k))
+                if (lact_z) call flux_calc_pnts_r(Qinner,finner_z,3,npg,Rinner(:,:,i,j,k))
+            else
+                call flux_calc_pnts_r(Qinner,finner_x,1,npg)
+                if (lact_y) call flux_calc_pnts_r(Qinner,finner_y,2,npg)
+                if (lact_z) call flux_calc_pnts_r(Qinner,finner_z,3,npg)
+            end if
+            ! Inactive directions carry no flux divergence
+            if (.not. lact_y) finner_y(:,:) = 0.
+            if (.not. lact_z) finner_z(:,:) = 0.
+            ! Stretched grids: the branches below apply the mean inverse widths
+            if (lstretch) then
+                finner_x(:,:) = (dxci(i)*dx)*finner_x(:,:)
+                finner_y(:,:) = (dyci(j)*dy)*finner_y(:,:)
+                finner_z(:,:) = (dzci(k)*dz)*finner_z(:,:)
+            end if
 
-                ! int_r(kx,ieq) = 0.25*cbasis(kx)*dxi*sum(wgt3d(1:npg)*finner_x(1:npg,ieq))
-                ! int_r(ky,ieq) = 0.25*cbasis(ky)*dyi*sum(wgt3d(1:npg)*finner_y(1:npg,ieq))
-                ! int_r(kz,ieq) = 0.25*cbasis(kz)*dzi*sum(wgt3d(1:npg)*finner_z(1:npg,ieq))
-                sum1 = 0.
-                sum2 = 0.
-                sum3 = 0.
-                do ipg=1,npg
-                    sum1 = sum1 + wgt3d(ipg)*finner_x(ipg,ieq)
-                    sum2 = sum2 + wgt3d(ipg)*finner_y(ipg,ieq)
-                    sum3 = sum3 + wgt3d(ipg)*finner_z(ipg,ieq)
+            if (lkern) then
+                do ieq = 1,nQ
+                    call kern_int_grad(finner_x(:,ieq), finner_y(:,ieq), finner_z(:,ieq), int_r(1:nbasis,ieq))
                 end do
-                int_r(kx,ieq) = 0.25*cbasis(kx)*dxi*sum1
-                int_r(ky,ieq) = 0.25*cbasis(ky)*dyi*sum2
-                int_r(kz,ieq) = 0.25*cbasis(kz)*dzi*sum3
-
-
-                if ( nbasis > 4 ) then
-
-                    if ( ibitri == 1 .or. iquad > 2 ) then
-                        sum1 = 0.
-                        sum2 = 0.
-                        sum3 = 0.
-                        sum4 = 0.
-                        sum5 = 0.
-                        sum6 = 0.
-                        do ipg=1,npg
-                            sum1 = sum1 + wgt3d(ipg)*bfvals_int(ipg,kz)*finner_y(ipg,ieq)
-                            sum2 = sum2 + wgt3d(ipg)*bfvals_int(ipg,ky)*finner_z(ipg,ieq)
-                            sum3 = sum3 + wgt3d(ipg)*bfvals_int(ipg,kz)*finner_x(ipg,ieq)
-                            sum4 = sum4 + wgt3d(ipg)*bfvals_int(ipg,kx)*finner_z(ipg,ieq)
-                            sum5 = sum5 + wgt3d(ipg)*bfvals_int(ipg,ky)*finner_x(ipg,ieq)
-                            sum6 = sum6 + wgt3d(ipg)*bfvals_int(ipg,kx)*finner_y(ipg,ieq)
-                        end do
-                        int_r(kyz,ieq) = 0.25*cbasis(kyz)*(dyi*sum1 + dzi*sum2)
-                        int_r(kzx,ieq) = 0.25*cbasis(kzx)*(dxi*sum3 + dzi*sum4)
-                        int_r(kxy,ieq) = 0.25*cbasis(kxy)*(dxi*sum5 + dyi*sum6)
-                    end if
+            else if (ltensor) then
+                do ieq = 1,nQ
+                    call tp_int_grad(finner_x(:,ieq), finner_y(:,ieq), finner_z(:,ieq), int_r(1:nbasis,ieq))
+                end do
+            else if (lgenbasis) then
+                ! Generated bases: weighted basis derivatives from set_generated_vals
+                do ieq = 1,nQ
+                    do ia = 1,nbas_act
+                        ir = ibas_act(ia)
+                        int_r(ir,ieq) = 0.25*cbasis(ir)*(                                   &
+                              dxi*sum(dbval_int_wgt(1:npg,ir,1)*finner_x(1:npg,ieq))        &
+                            + dyi*sum(dbval_int_wgt(1:npg,ir,2)*finner_y(1:npg,ieq))        &
+                            + dzi*sum(dbval_int_wgt(1:npg,ir,3)*finner_z(1:npg,ieq)) )
+                    end do
+                end do
+            else
+                int_r(1,1:nQ) = 0.  ! the cell average has no volume term
+                do ieq = 1,nQ
 
-                    if ( iquad > 2 ) then
-                        sum1 = 0.
-                        sum2 = 0.
-                        sum3 = 0.
-                        do ipg=1,npg
-                            sum1 = sum1 + wgt3d(ipg)*3.*bfvals_int(ipg,kx)*finner_x(ipg,ieq)
-                            sum2 = sum2 + wgt3d(ipg)*3.*bfvals_int(ipg,ky)*finner_y(ipg,ieq)
-                            sum3 = sum3 + wgt3d(ipg)*3.*bfvals_int(ipg,kz)*finner_z(ipg,ieq)
-                        end do
+                    ! int_r(kx,ieq) = 0.25*cbasis(kx)*dxi*sum(wgt3d(1:npg)*finner_x(1:npg,ieq))
+                    ! int_r(ky,ieq) = 0.25*cbasis(ky)*dyi*sum(wgt3d(1:npg)*finner_y(1:npg,ieq))
+                    ! int_r(kz,ieq) = 0.25*cbasis(kz)*dzi*sum(wgt3d(1:npg)*finner_z(1:npg,ieq))
+                    sum1 = 0.
+                    sum2 = 0.
+                    sum3 = 0.
+                    do ipg=1,npg
+                        sum1 = sum1 + wgt3d(ipg)*finner_x(ipg,ieq)
+                        sum2 = sum2 + wgt3d(ipg)*finner_y(ipg,ieq)
+                        sum3 = sum3 + wgt3d(ipg)*finner_z(ipg,ieq)
+                    end do
+                    int_r(kx,ieq) = 0.25*cbasis(kx)*dxi*sum1
+                    int_r(ky,ieq) = 0.25*cbasis(ky)*dyi*sum2
+                    int_r(kz,ieq) = 0.25*cbasis(kz)*dzi*sum3
+
+
+                    if ( nbasis > 4 ) then
+
+                        if ( ibitri == 1 .or. iquad > 2 ) then
+                            sum1 = 0.
+                            sum2 = 0.
+                            sum3 = 0.
+                            sum4 = 0.
+                            sum5 = 0.
+                            sum6 = 0.
+                            do ipg=1,npg
+                                sum1 = sum1 + wgt3d(ipg)*bfvals_int(ipg,kz)*finner_y(ipg,ieq)
+                                sum2 = sum2 + wgt3d(ipg)*bfvals_int(ipg,ky)*finner_z(ipg,ieq)
+                                sum3 = sum3 + wgt3d(ipg)*bfvals_int(ipg,kz)*finner_x(ipg,ieq)
+                                sum4 = sum4 + wgt3d(ipg)*bfvals_int(ipg,kx)*finner_z(ipg,ieq)
+                                sum5 = sum5 + wgt3d(ipg)*bfvals_int(ipg,ky)*finner_x(ipg,ieq)
+                                sum6 = sum6 + wgt3d(ipg)*bfvals_int(ipg,kx)*finner_y(ipg,ieq)
+                            end do
+                            int_r(kyz,ieq) = 0.25*cbasis(kyz)*(dyi*sum1 + dzi*sum2)
+                            int_r(kzx,ieq) = 0.25*cbasis(kzx)*(dxi*sum3 + dzi*sum4)
+                            int_r(kxy,ieq) = 0.25*cbasis(kxy)*(dxi*sum5 + dyi*sum6)
+                        end if
 
-                        int_r(kxx,ieq) = 0.25*cbasis(kxx)*(dxi*sum1)
-                        int_r(kyy,ieq) = 0.25*cbasis(kyy)*(dyi*sum2)
-                        int_r(kzz,ieq) = 0.25*cbasis(kzz)*(dzi*sum3)
-                    end if
+                        if ( iquad > 2 ) then
+                            sum1 = 0.
+                            sum2 = 0.
+                            sum3 = 0.
+                            do ipg=1,npg
+                                sum1 = sum1 + wgt3d(ipg)*3.*bfvals_int(ipg,kx)*finner_x(ipg,ieq)
+                                sum2 = sum2 + wgt3d(ipg)*3.*bfvals_int(ipg,ky)*finner_y(ipg,ieq)
+                                sum3 = sum3 + wgt3d(ipg)*3.*bfvals_int(ipg,kz)*finner_z(ipg,ieq)
+                            end do
+
+                            int_r(kxx,ieq) = 0.25*cbasis(kxx)*(dxi*sum1)
+                            int_r(kyy,ieq) = 0.25*cbasis(kyy)*(dyi*sum2)
+                            int_r(kzz,ieq) = 0.25*cbasis(kzz)*(dzi*sum3)
+                        end if
 
-                    if ( ibitri == 1 .or. iquad > 3 ) then
-                        sum7 = 0.
-                        sum8 = 0.
-                        sum9 = 0.
-                        do ipg=1,npg
-                            sum7 = sum7 + wgt3d(ipg)*bfvals_int(ipg,kyz)*finner_x(ipg,ieq)
-                            sum8 = sum8 + wgt3d(ipg)*bfvals_int(ipg,kzx)*finner_y(ipg,ieq)
-                            sum9 = sum9 + wgt3d(ipg)*bfvals_int(ipg,kxy)*finner_z(ipg,ieq)
-                        end do
-                        int_r(kxyz,ieq) = 0.25*cbasis(kxyz)*(dxi*sum7 + dyi*sum8 + dzi*sum9)
-                    end if
+                        if ( ibitri == 1 .or. iquad > 3 ) then
+                            sum7 = 0.
+                            sum8 = 0.
+                            sum9 = 0.
+                            do ipg=1,npg
+                                sum7 = sum7 + wgt3d(ipg)*bfvals_int(ipg,kyz)*finner_x(ipg,ieq)
+                                sum8 = sum8 + wgt3d(ipg)*bfvals_int(ipg,kzx)*finner_y(ipg,ieq)
+                                sum9 = sum9 + wgt3d(ipg)*bfvals_int(ipg,kxy)*finner_z(ipg,ieq)
+                            end do
+                            int_r(kxyz,ieq) = 0.25*cbasis(kxyz)*(dxi*sum7 + dyi*sum8 + dzi*sum9)
+                        end if
 
-                    if ( (ibitri == 1 .and. iquad > 2) .or. iquad > 3 ) then
-                        int_r(kyzz,ieq) =                                                                       &
-                            0.25*cbasis(kyzz)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzz)*finner_y(1:npg,ieq))   &
-                          + 0.25*cbasis(kyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyz)*finner_z(1:npg,ieq))
-                        int_r(kzxx,ieq) =                                                                       &
-                            0.25*cbasis(kzxx)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxx)*finner_z(1:npg,ieq))   &
-                          + 0.25*cbasis(kzxx)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzx)*finner_x(1:npg,ieq))
-                        int_r(kxyy,ieq) =                                                                       &
-                            0.25*cbasis(kxyy)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyy)*finner_x(1:npg,ieq))   &
-                          + 0.25*cbasis(kxyy)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxy)*finner_y(1:npg,ieq))
-                        int_r(kyyz,ieq) =                                                                       &
-                            0.25*cbasis(kyyz)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyy)*finner_z(1:npg,ieq))   &
-                          + 0.25*cbasis(kyyz)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyz)*finner_y(1:npg,ieq))
-                        int_r(kzzx,ieq) =                                                                       &
-                            0.25*cbasis(kzzx)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzz)*finner_x(1:npg,ieq))   &
-                          + 0.25*cbasis(kzzx)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzx)*finner_z(1:npg,ieq))
-                        int_r(kxxy,ieq) =                                                                       &
-                            0.25*cbasis(kxxy)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxx)*finner_y(1:npg,ieq))   &
-                          + 0.25*cbasis(kxxy)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxy)*finner_x(1:npg,ieq))
-                    end if
+                        if ( (ibitri == 1 .and. iquad > 2) .or. iquad > 3 ) then
+                            int_r(kyzz,ieq) =                                                                       &
+                                0.25*cbasis(kyzz)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzz)*finner_y(1:npg,ieq))   &
+                              + 0.25*cbasis(kyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyz)*finner_z(1:npg,ieq))
+                            int_r(kzxx,ieq) =                                                                       &
+                                0.25*cbasis(kzxx)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxx)*finner_z(1:npg,ieq))   &
+                              + 0.25*cbasis(kzxx)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzx)*finner_x(1:npg,ieq))
+                            int_r(kxyy,ieq) =                                                                       &
+                                0.25*cbasis(kxyy)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyy)*finner_x(1:npg,ieq))   &
+                              + 0.25*cbasis(kxyy)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxy)*finner_y(1:npg,ieq))
+                            int_r(kyyz,ieq) =                                                                       &
+                                0.25*cbasis(kyyz)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyy)*finner_z(1:npg,ieq))   &
+                              + 0.25*cbasis(kyyz)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyz)*finner_y(1:npg,ieq))
+                            int_r(kzzx,ieq) =                                                                       &
+                                0.25*cbasis(kzzx)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzz)*finner_x(1:npg,ieq))   &
+                              + 0.25*cbasis(kzzx)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzx)*finner_z(1:npg,ieq))
+                            int_r(kxxy,ieq) =                                                                       &
+                                0.25*cbasis(kxxy)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxx)*finner_y(1:npg,ieq))   &
+                              + 0.25*cbasis(kxxy)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxy)*finner_x(1:npg,ieq))
+                        end if
 
-                    if ( iquad > 3 ) then
-                        int_r(kxxx,ieq) = 0.25*cbasis(kxxx)*dxi *                                       &
-                            sum( wgt3d(1:npg)*(7.5*bfvals_int(1:npg,kx)**2 - 1.5)*finner_x(1:npg,ieq) )
-                        int_r(kyyy,ieq) = 0.25*cbasis(kyyy)*dyi *                                       &
-                            sum( wgt3d(1:npg)*(7.5*bfvals_int(1:npg,ky)**2 - 1.5)*finner_y(1:npg,ieq) )
-                        int_r(kzzz,ieq) = 0.25*cbasis(kzzz)*dzi *                                       &
-                            sum( wgt3d(1:npg)*(7.5*bfvals_int(1:npg,kz)**2 - 1.5)*finner_z(1:npg,ieq) )
-                    end if
+                        if ( iquad > 3 ) then
+                            int_r(kxxx,ieq) = 0.25*cbasis(kxxx)*dxi *                                       &
+                                sum( wgt3d(1:npg)*(7.5*bfvals_int(1:npg,kx)**2 - 1.5)*finner_x(1:npg,ieq) )
+                            int_r(kyyy,ieq) = 0.25*cbasis(kyyy)*dyi *                                       &
+                                sum( wgt3d(1:npg)*(7.5*bfvals_int(1:npg,ky)**2 - 1.5)*finner_y(1:npg,ieq) )
+                            int_r(kzzz,ieq) = 0.25*cbasis(kzzz)*dzi *                                       &
+                                sum( wgt3d(1:npg)*(7.5*bfvals_int(1:npg,kz)**2 - 1.5)*finner_z(1:npg,ieq) )
+                        end if
 
-                    if ( ibitri == 1 .and. iquad > 2 ) then
-                        int_r(kyyzz,ieq) =                                                                         &
-                            0.25*cbasis(kyyzz)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyzz)*finner_y(1:npg,ieq)) &
-                          + 0.25*cbasis(kyyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyyz)*finner_z(1:npg,ieq))
-                        int_r(kzzxx,ieq) =                                                                         &
-                            0.25*cbasis(kzzxx)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzxx)*finner_z(1:npg,ieq)) &
-                          + 0.25*cbasis(kzzxx)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzzx)*finner_x(1:npg,ieq))
-                        int_r(kxxyy,ieq) =                                                                         &
-                            0.25*cbasis(kxxyy)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyy)*finner_x(1:npg,ieq)) &
-                          + 0.25*cbasis(kxxyy)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxxy)*finner_y(1:npg,ieq))
-                        int_r(kyzxx,ieq) =                                                                         &
-                            0.25*cbasis(kyzxx)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyz)*finner_x(1:npg,ieq)) &
-                          + 0.25*cbasis(kyzxx)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzxx)*finner_y(1:npg,ieq))    &
-                          + 0.25*cbasis(kyzxx)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxxy)*finner_z(1:npg,ieq))
-                        int_r(kzxyy,ieq) =                                                                         &
-                            0.25*cbasis(kzxyy)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyz)*finner_y(1:npg,ieq)) &
-                          + 0.25*cbasis(kzxyy)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxyy)*finner_z(1:npg,ieq))    &
-                          + 0.25*cbasis(kzxyy)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyyz)*finner_x(1:npg,ieq))
-                        int_r(kxyzz,ieq) =                                                                         &
-                            0.25*cbasis(kxyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyz)*finner_z(1:npg,ieq)) &
-                          + 0.25*cbasis(kxyzz)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyzz)*finner_x(1:npg,ieq))    &
-                          + 0.25*cbasis(kxyzz)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzzx)*finner_y(1:npg,ieq))
-                        int_r(kxyyzz,ieq) =                                                                          &
-                            0.25*cbasis(kxyyzz)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyyzz)*finner_x(1:npg,ieq))    &
-                          + 0.25*cbasis(kxyyzz)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyzz)*finner_y(1:npg,ieq)) &
-                          + 0.25*cbasis(kxyyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzxyy)*finner_z(1:npg,ieq))
-                        int_r(kyzzxx,ieq) =                                                                          &
-                            0.25*cbasis(kyzzxx)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzzxx)*finner_y(1:npg,ieq))    &
-                          + 0.25*cbasis(kyzzxx)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyzxx)*finner_z(1:npg,ieq)) &
-                          + 0.25*cbasis(kyzzxx)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyzz)*finner_x(1:npg,ieq))
-                        int_r(kzxxyy,ieq) =                                                                          &
-                            0.25*cbasis(kzxxyy)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxxyy)*finner_z(1:npg,ieq))    &
-                          + 0.25*cbasis(kzxxyy)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzxyy)*finner_x(1:npg,ieq)) &
-                          + 0.25*cbasis(kzxxyy)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyzxx)*finner_y(1:npg,ieq))
-                        int_r(kxxyyzz,ieq) =                                                                           &
-                            0.25*cbasis(kxxyyzz)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyyzz)*finner_x(1:npg,ieq)) &
-                          + 0.25*cbasis(kxxyyzz)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyzzxx)*finner_y(1:npg,ieq)) &
-                          + 0.25*cbasis(kxxyyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzxxyy)*finner_z(1:npg,ieq))
-                    end if
+                        if ( ibitri == 1 .and. iquad > 2 ) then
+                            int_r(kyyzz,ieq) =                                                                         &
+                                0.25*cbasis(kyyzz)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyzz)*finner_y(1:npg,ieq)) &
+                              + 0.25*cbasis(kyyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyyz)*finner_z(1:npg,ieq))
+                            int_r(kzzxx,ieq) =                                                                         &
+                                0.25*cbasis(kzzxx)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzxx)*finner_z(1:npg,ieq)) &
+                              + 0.25*cbasis(kzzxx)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzzx)*finner_x(1:npg,ieq))
+                            int_r(kxxyy,ieq) =                                                                         &
+                                0.25*cbasis(kxxyy)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyy)*finner_x(1:npg,ieq)) &
+                              + 0.25*cbasis(kxxyy)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxxy)*finner_y(1:npg,ieq))
+                            int_r(kyzxx,ieq) =                                                                         &
+                                0.25*cbasis(kyzxx)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyz)*finner_x(1:npg,ieq)) &
+                              + 0.25*cbasis(kyzxx)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzxx)*finner_y(1:npg,ieq))    &
+                              + 0.25*cbasis(kyzxx)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxxy)*finner_z(1:npg,ieq))
+                            int_r(kzxyy,ieq) =                                                                         &
+                                0.25*cbasis(kzxyy)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyz)*finner_y(1:npg,ieq)) &
+                              + 0.25*cbasis(kzxyy)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxyy)*finner_z(1:npg,ieq))    &
+                              + 0.25*cbasis(kzxyy)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyyz)*finner_x(1:npg,ieq))
+                            int_r(kxyzz,ieq) =                                                                         &
+                                0.25*cbasis(kxyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyz)*finner_z(1:npg,ieq)) &
+                              + 0.25*cbasis(kxyzz)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyzz)*finner_x(1:npg,ieq))    &
+                              + 0.25*cbasis(kxyzz)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzzx)*finner_y(1:npg,ieq))
+                            int_r(kxyyzz,ieq) =                                                                          &
+                                0.25*cbasis(kxyyzz)*dxi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kyyzz)*finner_x(1:npg,ieq))    &
+                              + 0.25*cbasis(kxyyzz)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyzz)*finner_y(1:npg,ieq)) &
+                              + 0.25*cbasis(kxyyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzxyy)*finner_z(1:npg,ieq))
+                            int_r(kyzzxx,ieq) =                                                                          &
+                                0.25*cbasis(kyzzxx)*dyi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kzzxx)*finner_y(1:npg,ieq))    &
+                              + 0.25*cbasis(kyzzxx)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyzxx)*finner_z(1:npg,ieq)) &
+                              + 0.25*cbasis(kyzzxx)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyzz)*finner_x(1:npg,ieq))
+                            int_r(kzxxyy,ieq) =                                                                          &
+                                0.25*cbasis(kzxxyy)*dzi*sum(wgt3d(1:npg)*bfvals_int(1:npg,kxxyy)*finner_z(1:npg,ieq))    &
+                              + 0.25*cbasis(kzxxyy)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzxyy)*finner_x(1:npg,ieq)) &
+                              + 0.25*cbasis(kzxxyy)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyzxx)*finner_y(1:npg,ieq))
+                            int_r(kxxyyzz,ieq) =                                                                           &
+                                0.25*cbasis(kxxyyzz)*dxi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kxyyzz)*finner_x(1:npg,ieq)) &
+                              + 0.25*cbasis(kxxyyzz)*dyi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kyzzxx)*finner_y(1:npg,ieq)) &
+                              + 0.25*cbasis(kxxyyzz)*dzi*sum(wgt3d(1:npg)*3.*bfvals_int(1:npg,kzxxyy)*finner_z(1:npg,ieq))
+                        end if
 
-                end if
+                    end if
 
-            end do
+                end do
+            end if
 
             do ieq = 1,nQ
                 do ir=1,nbasis
@@ -920,10 +1020,8 @@ contains
                 end do
             end do
 
-        end do
         end do
         !$OMP END PARALLEL DO
-        end do
 
     end subroutine innerintegral2
 !-------------------------------------------------------------------------------
@@ -932,7 +1030,14 @@ contains
     subroutine glflux(Q_r)
         implicit none
         real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_r
-        integer i,j,k,ieq,ir
+        real, dimension(nbasis) :: gfx, gfy, gfz
+        integer i,j,k,ic,ieq,ir,ia
+
+        !#########################################################
+        ! Step 0: Find the active cells (see activity.f90)
+        !   --> lcell_act, icell_act
+        !---------------------------------------------------------
+        call set_active_cells(Q_r)
 
         !#########################################################
         ! Step 1: Calculate fluxes for boundaries of each cell
@@ -940,8 +1045,8 @@ contains
         !---------------------------------------------------------
         ! call flux_calc(Q_r)
         call calc_flux_x(Q_r, flux_x)
-        call calc_flux_y(Q_r, flux_y)
-        call calc_flux_z(Q_r, flux_z)
+        if (lact_y) call calc_flux_y(Q_r, flux_y)
+        if (lact_z) call calc_flux_z(Q_r, flux_z)
 
         !#########################################################
         ! Step 2: Calc inner integral for each cell
@@ -953,29 +1058,84 @@ contains
         !#########################################################
         ! Step 3: Calc (total) "Gauss-Legendre flux" for each cell
         !   --> glflux_r  (used by advance_time_level_gl)
-        !   --
+        !   -- only the active modes are evolved, and the face terms of
+        !      inactive directions are skipped (see set_active_basis)
+        !   -- tensor-product bases are integrated direction by direction
+        !   -- the unrolled kernels of kernels.f90 fold in 0.25*cbasis
+        !   -- otherwise the face integrals share the tangential sums of
+        !      the + and - faces (see face_trace_int)
+        !   -- inactive cells have a zero residual
         !---------------------------------------------------------
-        do ieq = 1,nQ
-        do k = 1,nz                        !FIRSTPRIVATE(flux_x,flux_y,flux_z)
-        !$OMP PARALLEL DO DEFAULT(SHARED)
-        do j = 1,ny
-        do i = 1,nx
-           glflux_r(i,j,k,ieq,1) = 0.25*(dxi*sum(wgt2d(1:nface)*(flux_x(1:nface,i+1,j,k,ieq) - flux_x(1:nface,i,j,k,ieq))) &
-                                       + dyi*sum(wgt2d(1:nface)*(flux_y(1:nface,i,j+1,k,ieq) - flux_y(1:nface,i,j,k,ieq))) &
-                                       + dzi*sum(wgt2d(1:nface)*(flux_z(1:nface,i,j,k+1,ieq) - flux_z(1:nface,i,j,k,ieq))))
+        if (ncell_act < nx*ny*nz) then
+            do k = 1,nz
+            do j = 1,ny
+            do i = 1,nx
+                if (.not. lcell_act(i,j,k)) glflux_r(i,j,k,:,:) = 0.
+            end do
+            end do
+            end do
+        end if
+
+        if (nbas_act < nbasis) then
             do ir=2,nbasis
-                glflux_r(i,j,k,ieq,ir) = 0.25*cbasis(ir)*(  &
-                    dxi*sum(wgt2d(1:nface)*(bfvals_xp(1:nface,ir)*flux_x(1:nface,i+1,j,k,ieq) - bfvals_xm(1:nface,ir)*flux_x(1:nface,i,j,k,ieq))) &
-                  + dyi*sum(wgt2d(1:nface)*(bfvals_yp(1:nface,ir)*flux_y(1:nface,i,j+1,k,ieq) - bfvals_ym(1:nface,ir)*flux_y(1:nface,i,j,k,ieq))) &
-                  + dzi*sum(wgt2d(1:nface)*(bfvals_zp(1:nface,ir)*flux_z(1:nface,i,j,k+1,ieq) - bfvals_zm(1:nface,ir)*flux_z(1:nface,i,j,k,ieq))) &
-                  ) - integral_r(i,j,k,ieq,ir)
+                if (.not. lbas_act(ir)) glflux_r(:,:,:,:,ir) = 0.
             end do
+        end if
 
-        end do
+        if (lkern) then
+            !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(i,j,k,ieq,gfx,gfy,gfz)
+            do ic = 1,ncell_act
+            i = icell_act(1,ic)
+            j = icell_act(2,ic)
+            k = icell_act(3,ic)
+            do ieq = 1,nQ
+                call kern_int_face(flux_x(:,i+1,j,k,ieq), flux_x(:,i,j,k,ieq), 1, gfx)
+                call kern_int_face(flux_y(:,i,j+1,k,ieq), flux_y(:,i,j,k,ieq), 2, gfy)
+                call kern_int_face(flux_z(:,i,j,k+1,ieq), flux_z(:,i,j,k,ieq), 3, gfz)
+                glflux_r(i,j,k,ieq,1:nbasis) = dxci(i)*gfx + dyci(j)*gfy + dzci(k)*gfz - integral_r(i,j,k,ieq,1:nbasis)
+            end do
+            end do
+            !$OMP END PARALLEL DO
+            return
+        end if
+
+        if (ltensor) then
+            !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(i,j,k,ieq,gfx,gfy,gfz)
+            do ic = 1,ncell_act
+            i = icell_act(1,ic)
+            j = icell_act(2,ic)
+            k = icell_act(3,ic)
+            do ieq = 1,nQ
+                call tp_int_face(flux_x(:,i+1,j,k,ieq), flux_x(:,i,j,k,ieq), 1, gfx)
+                call tp_int_face(flux_y(:,i,j+1,k,ieq), flux_y(:,i,j,k,ieq), 2, gfy)
+                call tp_int_face(flux_z(:,i,j,k+1,ieq), flux_z(:,i,j,k,ieq), 3, gfz)
+                glflux_r(i,j,k,ieq,1:nbasis) = 0.25*cbasis(1:nbasis)*(dxci(i)*gfx + dyci(j)*gfy + dzci(k)*gfz)  &
+                                             - integral_r(i,j,k,ieq,1:nbasis)
+            end do
+            end do
+            !$OMP END PARALLEL DO
+            return
+        end if
+
+        !$OMP PARALLEL DO DEFAULT(SHARED) PRIVATE(i,j,k,ieq,ir,gfx,gfy,gfz)
+        do ic = 1,ncell_act
+        i = icell_act(1,ic)
+        j = icell_act(2,ic)
+        k = icell_act(3,ic)
+        do ieq = 1,nQ
+            call face_trace_int(flux_x(:,i+1,j,k,ieq), flux_x(:,i,j,k,ieq), 1, gfx)
+            gfy(:) = 0.
+            gfz(:) = 0.
+            if (lact_y) call face_trace_int(flux_y(:,i,j+1,k,ieq), flux_y(:,i,j,k,ieq), 2, gfy)
+            if (lact_z) call face_trace_int(flux_z(:,i,j,k+1,ieq), flux_z(:,i,j,k,ieq), 3, gfz)
+            do ia=1,nbas_act
+                ir = ibas_act(ia)
+                glflux_r(i,j,k,ieq,ir) = 0.25*cbasis(ir)*(dxci(i)*gfx(ir) + dyci(j)*gfy(ir) + dzci(k)*gfz(ir))  &
+                                       - integral_r(i,j,k,ieq,ir)
+            end do
         end do
         end do
         !$OMP END PARALLEL DO
-        end do
 
         ! NOTE: This was the original code before newCES
         ! do ieq = 1,nQ
@@ -1031,7 +1191,7 @@ contains
         real, dimension(nQ), intent(in) :: Qcf
         integer, intent(in) :: cases
 
-        real dn,dni, vx,vy,vz, P, cs
+        real dn,dni, vx,vy,vz, ei(1), P(1), cs(1), T(1)
 
         dn = Qcf(rh)
         dni = 1./dn
@@ -1039,34 +1199,29 @@ contains
         vy = Qcf(my)*dni
         vz = Qcf(mz)*dni
 
-        !--- pressure -----------------
+        !--- internal energy ----------
         select case(ivis)
             case(0)
-                P = aindm1*(Qcf(en) - 0.5*dn*(vx**2 + vy**2 + vz**2))
+                ei = Qcf(en) - 0.5*dn*(vx**2 + vy**2 + vz**2)
             case(1)
-                P = aindm1*(Qcf(en) - 0.5*dn*(vx**2 + vy**2 + vz**2))
-            case(2)
-                P = c1d3 * ( Qcf(pxx) + Qcf(pyy) + Qcf(pzz) - dn*(vx**2 + vy**2 + vz**2) )
+                ei = Qcf(en) - 0.5*dn*(vx**2 + vy**2 + vz**2)
+            case(2)  ! from the isotropic part of the 10-moment pressure
+                ei = c1d3 * ( Qcf(pxx) + Qcf(pyy) + Qcf(pzz) - dn*(vx**2 + vy**2 + vz**2) )/aindm1
         end select
 
         !--- sound speed --------------
-        select case(ieos)
-            case(1)
-                cs = sqrt(aindex*P*dni)
-            case(2)
-                cs = sqrt(7.2*P_1*dn**6.2)
-        end select
+        call eos_state(1, Qcf(rh:rh), ei, P, cs, T)
 
         !--- freezing speed -----------
         select case(cases)
             case(1) !freezing speed in x direction for fluid variable
-                cfcal = abs(vx) + cs
+                cfcal = abs(vx) + cs(1)
 
             case(2) !freezing speed in y direction for fluid variable
-                cfcal = abs(vy) + cs
+                cfcal = abs(vy) + cs(1)
 
             case(3) !freezing speed in z direction for fluid variable
-                cfcal = abs(vz) + cs
+                cfcal = abs(vz) + cs(1)
         end select
 
     end function cfcal
@@ -1080,7 +1235,8 @@ contains
         integer i, j, k, ieq, ipge, minindex, ir
         real, dimension(nx,ny,nz,nQ,nbasis) :: Q_r
         real Qedge(npge,nQ),theta,Qmin(nQ), deltaQ(nQ)
-        real epsi, Qrhmin, QPmin, P(npge), Pave, dn, dni, epsiP, thetaj
+        real epsi, Qrhmin, QPmin, P(npge), Pave(1), epsiP, thetaj
+        real cs(npge), T(npge)
         real*8 a, b, c
 
         epsi = rh_floor
@@ -1115,12 +1271,11 @@ contains
 
                 end if
 
-                Pave = aindm1*(Q_r(i,j,k,en,1)                                  &
-                        - 0.5*( Q_r(i,j,k,mx,1)**2                              &
-                              + Q_r(i,j,k,my,1)**2                              &
-                              + Q_r(i,j,k,mz,1)**2 ) / Q_r(i,j,k,rh,1) )
+                ! positivity of the thermal pressure rho*T (= P for an ideal gas)
+                call eos_cons(1, Q_r(i,j,k,rh:en,1:1), P, cs, T)
+                Pave(1) = Q_r(i,j,k,rh,1)*T(1)
 
-                if (Pave < epsiP) then
+                if (Pave(1) < epsiP) then
                     do ir=2,nbasis
                         Q_r(i,j,k,rh:en,ir) = 0.0
                     end do
@@ -1130,17 +1285,14 @@ contains
                         do ieq = rh,en
                             Qedge(ipge,ieq) = sum(bf_faces(ipge,1:nbasis)*Q_r(i,j,k,ieq,1:nbasis))
                         end do
+                    end do
+                    call eos_cons(npge, Qedge(:,rh:en), P, cs, T)
+                    P = Qedge(:,rh)*T
 
-                        dn = Qedge(ipge,rh)
-                        dni = 1./dn
-                        P(ipge) = aindm1*(Qedge(ipge,en)                        &
-                                - 0.5*dni*( Qedge(ipge,mx)**2                   &
-                                          + Qedge(ipge,my)**2                   &
-                                          + Qedge(ipge,mz)**2) )
-
+                    do ipge = 1,npge
                         if (P(ipge) < epsiP) then
-                            if (Pave .ne. P(ipge)) then
-                                thetaj = (Pave - epsiP)/(Pave - P(ipge))
+                            if (Pave(1) .ne. P(ipge)) then
+                                thetaj = (Pave(1) - epsiP)/(Pave(1) - P(ipge))
                                 theta = min(theta,thetaj)
                             end if
                         end if
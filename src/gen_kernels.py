@@ -0,0 +1,357 @@
+"""Generate unrolled DG kernels (kernels.f90) for the configured basis.
+
+The volume and surface operators of flux.f90 (innerintegral2, glflux and the
+face evaluations of calc_flux_x/y/z) loop over the dense basis tables of
+basis_funcs.f90. This script reads iquad and nbasis from input.f90, builds
+the same tables (Legendre products P_a(x)P_b(y)P_c(z) at the Gauss-Legendre
+points, in the mode order of set_mode_degrees) and writes them out as
+straight-line Fortran: every trip count is fixed, the weights, cbasis and
+the factor 0.25 are folded into the coefficients and the zero entries of the
+tables are dropped.
+
+    python gen_kernels.py input.f90 kernels.f90
+
+It is run by the Makefile and CMake builds whenever input.f90 changes. The
+generated module also carries the mode degrees it was built for, so a stale
+kernels.f90 is detected at startup (see initialize.f90) instead of silently
+giving wrong results.
+"""
+import math
+import re
+import sys
+
+
+# Terms per continuation line of the generated sums
+TERMS_PER_LINE = 4
+
+# Table entries below this magnitude are treated as exact zeros
+ZERO_TOL = 1.e-13
+
+
+def read_input(path):
+    """Return (iquad, nbasis) from the parameters in input.f90."""
+    src = open(path).read()
+    vals = {}
+    for name in ('iquad', 'nbasis'):
+        m = re.search(r'parameter\s*::\s*%s\s*=\s*(\d+)' % name, src, re.I)
+        if m is None:
+            raise ValueError('%s not found in %s' % (name, path))
+        vals[name] = int(m.group(1))
+    return vals['iquad'], vals['nbasis']
+
+
+def set_ibitri(iquad, nbasis):
+    """Basis family: 1 for tensor product, 0 for total degree (initialize.f90)."""
+    if nbasis == iquad**3:
+        return 1
+    if nbasis == iquad*(iquad + 1)*(iquad + 2)//6 and iquad > 1:
+        return 0
+    raise ValueError('no basis family with iquad = %d, nbasis = %d' % (iquad, nbasis))
+
+
+def named_modes(ibitri):
+    """Slots of the named modes, as set by set_basis_function_flags."""
+    k = {'1': 1, 'x': 2, 'y': 3, 'z': 4, 'yz': 5, 'zx': 6, 'xy': 7}
+    klim = 7
+    if ibitri == 1:
+        k['xyz'] = klim = 8
+    k['xx'], k['yy'], k['zz'] = klim + 1, klim + 2, klim + 3
+    if ibitri == 0:
+        k['xyz'] = klim = klim + 4
+    if ibitri == 1:
+        klim = k['zz']
+    for i, name in enumerate(('yzz', 'zxx', 'xyy', 'yyz', 'zzx', 'xxy')):
+        k[name] = klim + 1 + i
+    if ibitri == 1:
+        klim = k['xxy']
+    if ibitri == 0:
+        k['xxx'], k['yyy'], k['zzz'] = klim + 7, klim + 8, klim + 9
+        klim = k['zzz']
+    for i, name in enumerate(('yyzz', 'zzxx', 'xxyy', 'yzxx', 'zxyy', 'xyzz',
+                              'xyyzz', 'yzzxx', 'zxxyy', 'xxyyzz')):
+        k[name] = klim + 1 + i
+    if ibitri == 1:
+        klim = k['xxyyzz']
+        k['xxx'], k['yyy'], k['zzz'] = klim + 1, klim + 2, klim + 3
+    return k
+
+
+def mode_degrees(iquad, nbasis, ibitri):
+    """Legendre degrees (a, b, c) of each mode, as set by set_mode_degrees."""
+    nedge = iquad
+    nbastot = max(30, nbasis)
+
+    def in_family(a, b, c):
+        if ibitri == 1:
+            return max(a, b, c) < nedge
+        return a + b + c < nedge
+
+    ideg = [(0, 0, 0)]*(nbastot + 1)
+    lnamed = [False]*(nbastot + 1)
+    for name, ir in named_modes(ibitri).items():
+        if ir > nbastot:
+            continue
+        deg = (0, 0, 0) if name == '1' else tuple(name.count(d) for d in 'xyz')
+        ideg[ir] = deg
+        lnamed[ir] = in_family(*deg)
+
+    if iquad >= 4:
+        have = set(ideg[ir] for ir in range(1, nbasis + 1) if lnamed[ir])
+        family = [(a, b, c) for ntot in range(3*(nedge - 1) + 1)
+                  for a in range(nedge) for b in range(nedge) for c in range(nedge)
+                  if a + b + c == ntot and in_family(a, b, c) and (a, b, c) not in have]
+        free = [ir for ir in range(1, nbasis + 1) if not lnamed[ir]]
+        for ir, deg in zip(free, family):
+            ideg[ir] = deg
+    return ideg[1:nbasis + 1]
+
+
+def legendre(nmax, x):
+    """P_n(x) and P_n'(x) for n = 0..nmax."""
+    pn, dpn = [1., x], [0., 1.]
+    for n in range(1, nmax):
+        pn.append(((2*n + 1)*x*pn[n] - n*pn[n - 1])/(n + 1))
+        dpn.append(dpn[n - 1] + (2*n + 1)*pn[n])
+    return pn[:nmax + 1], dpn[:nmax + 1]
+
+
+def gauss_legendre(n):
+    """n-point Gauss-Legendre nodes (ascending) and weights on [-1,1]."""
+    xq, wq = [], []
+    for i in range(1, n + 1):
+        x = -math.cos(math.pi*(i - 0.25)/(n + 0.5))
+        for _ in range(100):
+            pn, dpn = legendre(n, x)
+            dx = pn[n]/dpn[n]
+            x -= dx
+            if abs(dx) < 1.e-16:
+                break
+        pn, dpn = legendre(n, x)
+        xq.append(x)
+        wq.append(2./((1. - x*x)*dpn[n]**2))
+    return xq, wq
+
+
+class Basis(object):
+    """Basis values at the quadrature points of basis_funcs.f90."""
+
+    def __init__(self, iquad, nbasis):
+        self.iquad = iquad
+        self.nbasis = nbasis
+        self.ideg = mode_degrees(iquad, nbasis, set_ibitri(iquad, nbasis))
+        self.xq, self.wq = gauss_legendre(iquad)
+        self.cbasis = [(2*a + 1)*(2*b + 1)*(2*c + 1) for a, b, c in self.ideg]
+
+    def values(self, pnt, ider=0):
+        """Basis values (ider = 0) or d/dx_ider at the point pnt = (x, y, z)."""
+        tabs = [legendre(self.iquad, x) for x in pnt]
+        out = []
+        for deg in self.ideg:
+            v = 1.
+            for idir in range(3):
+                v *= tabs[idir][1 if idir + 1 == ider else 0][deg[idir]]
+            out.append(v)
+        return out
+
+    def interior(self):
+        """Interior points and weights, ordered (z,y,x) fastest first."""
+        xq, wq = self.xq, self.wq
+        return [((xq[i], xq[j], xq[k]), wq[i]*wq[j]*wq[k])
+                for i in range(self.iquad) for j in range(self.iquad)
+                for k in range(self.iquad)]
+
+    def face(self, ixyz, side):
+        """Face points and weights: (y,z) on x-faces, (z,x) on y-faces,
+        (x,y) on z-faces, the first one varying fastest."""
+        xq, wq = self.xq, self.wq
+        pnts = []
+        for i in range(self.iquad):
+            for j in range(self.iquad):
+                if ixyz == 1:
+                    p = (side, xq[j], xq[i])
+                elif ixyz == 2:
+                    p = (xq[i], side, xq[j])
+                else:
+                    p = (xq[j], xq[i], side)
+                pnts.append((p, wq[i]*wq[j]))
+        return pnts
+
+
+def fnum(c):
+    """Fortran literal for a (non-negative) table coefficient."""
+    s = repr(float(c))
+    return s if ('.' in s or 'e' in s) else s + '.'
+
+
+def linear_sum(lhs, terms, indent):
+    """Fortran assignment lhs = sum(coef*operand), dropping the zero terms."""
+    parts = []
+    for coef, operand in terms:
+        if abs(coef) < ZERO_TOL:
+            continue
+        sign = '-' if coef < 0 else '+'
+        if abs(abs(coef) - 1.) < ZERO_TOL:
+            parts.append((sign, operand))
+        else:
+            parts.append((sign, '%s*%s' % (fnum(abs(coef)), operand)))
+    if not parts:
+        return ['%s%s = 0.' % (indent, lhs)]
+    first = ('-' if parts[0][0] == '-' else '') + parts[0][1]
+    body = [first] + ['%s %s' % p for p in parts[1:]]
+    lines = []
+    for i in range(0, len(body), TERMS_PER_LINE):
+        lines.append(' '.join(body[i:i + TERMS_PER_LINE]))
+    pad = indent + ' '*(len(lhs) + 3)
+    out = ['%s%s = %s' % (indent, lhs, lines[0])]
+    out += ['%s%s' % (pad, l) for l in lines[1:]]
+    return [l + ' &' for l in out[:-1]] + [out[-1]]
+
+
+def kern_eval_int(basis):
+    ind = ' '*8
+    out = ['    subroutine kern_eval_int(Qc, Qp)',
+           '        real, dimension(kern_nbasis), intent(in) :: Qc',
+           '        real, dimension(kern_npg), intent(out) :: Qp',
+           '']
+    for ipg, (pnt, _) in enumerate(basis.interior()):
+        bf = basis.values(pnt)
+        out += linear_sum('Qp(%d)' % (ipg + 1),
+                          [(bf[ir], 'Qc(%d)' % (ir + 1)) for ir in range(basis.nbasis)], ind)
+    out += ['    end subroutine kern_eval_int']
+    return out
+
+
+def kern_eval_face(basis):
+    ind = ' '*12
+    out = ['    subroutine kern_eval_face(Qc, iface, Qf)',
+           '        real, dimension(kern_nbasis), intent(in) :: Qc',
+           '        integer, intent(in) :: iface',
+           '        real, dimension(kern_nface), intent(out) :: Qf',
+           '',
+           '        select case (iface)']
+    iface = 0
+    for ixyz in (1, 2, 3):
+        for side in (-1., 1.):
+            iface += 1
+            out += ['        case (%d)  ! %s%s' % (iface, 'xyz'[ixyz - 1], 'm' if side < 0 else 'p')]
+            for ip, (pnt, _) in enumerate(basis.face(ixyz, side)):
+                bf = basis.values(pnt)
+                out += linear_sum('Qf(%d)' % (ip + 1),
+                                  [(bf[ir], 'Qc(%d)' % (ir + 1)) for ir in range(basis.nbasis)], ind)
+    out += ['        end select',
+            '    end subroutine kern_eval_face']
+    return out
+
+
+def kern_int_grad(basis):
+    ind = ' '*8
+    pnts = basis.interior()
+    dbf = [[basis.values(p, ider) for p, _ in pnts] for ider in (1, 2, 3)]
+    out = ['    subroutine kern_int_grad(fx, fy, fz, R)',
+           '        real, dimension(kern_npg), intent(in) :: fx, fy, fz',
+           '        real, dimension(kern_nbasis), intent(out) :: R',
+           '        real gx, gy, gz',
+           '']
+    for ir in range(basis.nbasis):
+        c = 0.25*basis.cbasis[ir]
+        terms = {}
+        for idir, (name, f) in enumerate((('gx', 'fx'), ('gy', 'fy'), ('gz', 'fz'))):
+            terms[name] = [(c*w*dbf[idir][ipg][ir], '%s(%d)' % (f, ipg + 1))
+                           for ipg, (_, w) in enumerate(pnts)]
+        used = [n for n in ('gx', 'gy', 'gz') if any(abs(t[0]) >= ZERO_TOL for t in terms[n])]
+        for n in used:
+            out += linear_sum(n, terms[n], ind)
+        rhs = ' + '.join('d%si*%s' % (n[1], n) for n in used) or '0.'
+        out += ['%sR(%d) = %s' % (ind, ir + 1, rhs)]
+    out += ['    end subroutine kern_int_grad']
+    return out
+
+
+def kern_int_face(basis):
+    ind = ' '*12
+    out = ['    subroutine kern_int_face(fp, fm, ixyz, R)',
+           '        real, dimension(kern_nface), intent(in) :: fp, fm',
+           '        integer, intent(in) :: ixyz',
+           '        real, dimension(kern_nbasis), intent(out) :: R',
+           '',
+           '        select case (ixyz)']
+    for ixyz in (1, 2, 3):
+        out += ['        case (%d)' % ixyz]
+        pp, pm = basis.face(ixyz, 1.), basis.face(ixyz, -1.)
+        bfp = [basis.values(p) for p, _ in pp]
+        bfm = [basis.values(p) for p, _ in pm]
+        for ir in range(basis.nbasis):
+            c = 0.25*basis.cbasis[ir]
+            terms = [(c*w*bfp[ip][ir], 'fp(%d)' % (ip + 1)) for ip, (_, w) in enumerate(pp)]
+            terms += [(-c*w*bfm[ip][ir], 'fm(%d)' % (ip + 1)) for ip, (_, w) in enumerate(pm)]
+            out += linear_sum('R(%d)' % (ir + 1), terms, ind)
+    out += ['        end select',
+            '    end subroutine kern_int_face']
+    return out
+
+
+def banner(doc):
+    return ['', '', '    !' + '='*75] + ['    ! ' + l for l in doc] + ['    !' + '-'*60]
+
+
+def generate(iquad, nbasis):
+    basis = Basis(iquad, nbasis)
+    ideg = ', '.join('%d,%d,%d' % d for d in basis.ideg)
+    out = ['!' + '*'*79,
+           '! kernels.f90: unrolled volume and surface kernels for iquad = %d, nbasis = %d' % (iquad, nbasis),
+           '!   GENERATED by gen_kernels.py from input.f90 -- do not edit',
+           '!' + '*'*79,
+           'module kernels',
+           '',
+           'use params, only : iquad, nbasis, dxi, dyi, dzi',
+           'use basis_funcs, only : ideg, nbas_act, ltensor',
+           '',
+           'implicit none',
+           '',
+           'integer, parameter :: kern_iquad  = %d' % iquad,
+           'integer, parameter :: kern_nbasis = %d' % nbasis,
+           'integer, parameter :: kern_nface  = %d' % iquad**2,
+           'integer, parameter :: kern_npg    = %d' % iquad**3,
+           '',
+           '! Legendre degrees of each mode the kernels were generated for',
+           'integer, dimension(3,kern_nbasis), parameter :: kern_ideg = reshape( (/ &']
+    chunks = ideg.split(', ')
+    for i in range(0, len(chunks), 8):
+        last = i + 8 >= len(chunks)
+        out.append('    ' + ', '.join(chunks[i:i + 8]) + (' /), (/ 3,kern_nbasis /) )' if last else ', &'))
+    out += ['',
+            '! Use the kernels in flux.f90 (set by set_kernels)',
+            'logical :: lkern = .false.',
+            '',
+            'contains']
+    out += banner(['set_kernels : enable the kernels if they match the configured basis',
+                   '  (all modes active, same iquad, nbasis and mode degrees). Beyond',
+                   '  iquad = 3 the sum-factorized tensor kernels do less work.'])
+    out += ['    subroutine set_kernels(lgk)',
+            '        logical, intent(in) :: lgk',
+            '',
+            '        lkern = lgk .and. kern_iquad == iquad .and. kern_nbasis == nbasis',
+            '        if (lkern) lkern = nbas_act == nbasis .and. all(kern_ideg == ideg(:,1:nbasis))',
+            '        if (lkern .and. ltensor) lkern = iquad <= 3',
+            '    end subroutine set_kernels']
+    out += banner(['kern_eval_int : solution at the interior quadrature points'])
+    out += kern_eval_int(basis)
+    out += banner(['kern_eval_face : solution at the face quadrature points',
+                                     '  (iface = 1..6 for xm, xp, ym, yp, zm, zp)'])
+    out += kern_eval_face(basis)
+    out += banner(['kern_int_grad : volume integral of the flux against the basis',
+                                    '  gradient, 0.25*cbasis*(dxi*fx.dphi/dx + dyi*... + dzi*...)'])
+    out += kern_int_grad(basis)
+    out += banner(['kern_int_face : surface integral of the face fluxes along ixyz,',
+                                    '  0.25*cbasis*sum(wgt2d*(phi_p*fp - phi_m*fm))'])
+    out += kern_int_face(basis)
+    out += ['    !' + '-'*75, '', 'end module kernels', '']
+    return '\n'.join(out)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python gen_kernels.py input.f90 kernels.f90')
+    iquad, nbasis = read_input(sys.argv[1])
+    with open(sys.argv[2], 'w') as f:
+        f.write(generate(iquad, nbasis))
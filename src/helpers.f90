@@ -22,6 +22,7 @@ contains
     ! Print a message from the MPI rank with ID mpi_id
     !------------------------------------------------------------
     subroutine mpi_print(mpi_id, message)
+        use params, only : print_mpi
         integer, intent(in) :: mpi_id
         character(*) :: message
         if (mpi_id == print_mpi) then
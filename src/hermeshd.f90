@@ -2,7 +2,7 @@
 module hermeshd
 
 use input!, only : nx,ny,nz
-use params!, only : nQ,nbasis,Q_r0,Q_r1,Q_r2,Q_r3
+use params!, only : nQ,nbasis,Q_r0,Q_r1,Q_r2
 use helpers!, only : xc,yc,zc,get_clock_time
 
 use integrator
@@ -15,10 +15,22 @@ use initialize
 
 use prepare_step
 use sources
-use random  ! TODO: commented to get working w/o MKL
+use random
+use activity
 use flux
 use output
+use output_hdf5
+use diagnostics
 
+! Only the driver interface is exported, so the f90wrap wrappers (which use
+! the whole module) do not clash with the names of the solver modules
+private
+public :: main, step, setup, init, reset, set_boundaries, set_output, reseed, &
+          finish, shutdown, cleanup, generate_output
+public :: initialized, loutput
+
+logical :: initialized = .false.  ! set by init, cleared by shutdown
+logical :: loutput = .true.       ! write the initial output in reset (see set_output)
 
 contains
 
@@ -37,7 +49,8 @@ contains
         !-----------------------------
         do while( t < tf )
             call step(Q_r0, Q_r1, Q_r2, t, dt)
-            call generate_output(Q_r0, t, dt, t1, dtout, nout)  ! determines when output should be generated
+            ! determines when output should be generated
+            call generate_output(Q_r0, t, dt, t1, dtout, nout)
         end do
 
         !#############################
@@ -57,28 +70,82 @@ contains
         real, intent(inout) :: t, dt
 
         dt = get_min_dt(Q_io)
-        call update(Q_io, Q_1, Q_2, dt)
+        call adaptive_update(Q_io, Q_1, Q_2, dt)
         t = t + dt
+        call write_diagnostics(Q_io, t, dt)
     end subroutine step
     !---------------------------------------------------------------------------
 
 
     !===========================================================================
+    ! Lifecycle for running several simulations in one process:
+    !
+    !   call init(comm)                            ! once: MPI topology, basis, RNG
+    !   call reset(Q_io, t, ..., ic)  ... step ... ! any number of runs
+    !   call finish(t_start)                       ! end of each run
+    !   call shutdown()                            ! once: finalize MPI
+    !
+    ! setup = init + reset(icid) and cleanup = finish + shutdown, which is the
+    ! single-run sequence used by main.
+    !------------------------------------------------------------
     subroutine setup(Q_io, t, dt, t1, t_start, dtout, nout, comm)
-        use integrator, only: select_integrator, update
-        use boundary, only: apply_xlobc, apply_ylobc, apply_zlobc,              &
-                            apply_xhibc, apply_yhibc, apply_zhibc,              &
-                            select_x_boundaries, select_y_boundaries, select_z_boundaries
-
         implicit none
         real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
         real, intent(inout) :: t, dt, t1, t_start, dtout
         integer, intent(inout) :: nout, comm
 
+        call init(comm)
+        call reset(Q_io, t, dt, t1, t_start, dtout, nout, icid)
+
+    end subroutine setup
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! One-time initialization (MPI topology, grid, basis tables, RNG).
+    !   Subsequent calls do nothing.
+    !------------------------------------------------------------
+    subroutine init(comm)
+        implicit none
+        integer, intent(inout) :: comm
+        real :: t, dt
+        integer :: nout
+
+        if (initialized) return
+
+        call initializer(t, dt, nout, comm)
+        if (lhdf5) call h5_check(iam)
+        initialized = .true.
+
+    end subroutine init
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Start a new run from initial condition ic (see set_ic; ic < 0 selects
+    ! icid from input.f90) without repeating the one-time initialization.
+    ! Boundary conditions are reset to the values in input.f90 (use
+    ! set_boundaries afterwards to change them).
+    !------------------------------------------------------------
+    subroutine reset(Q_io, t, dt, t1, t_start, dtout, nout, ic)
+        use integrator, only: select_integrator, update, dt_fac
+
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, intent(inout) :: t, dt, t1, t_start, dtout
+        integer, intent(inout) :: nout
+        integer, intent(in) :: ic
+
+        if (.not. initialized) then
+            call mpi_print(iam, 'reset: init must be called first')
+            return
+        end if
+
         !-------------------------------------------------
-        ! 1. Initialize general simulation variables
+        ! 1. Reset time, output and diagnostics counters
         !-------------------------------------------------
-        call initializer(t, dt, nout, comm)
+        call init_temporal_params(t, dt, nout)
+        ndiag_step = 0
 
         t_start = get_clock_time()  ! start timer for wall time
         dtout = tf/ntout  ! TODO: move this to a more sensible place once output scheme is improved!
@@ -87,39 +154,122 @@ contains
         ! 2. Select and set initial conditions
         !-------------------------------------------------
         if (iread == 0) then
-            call set_ic(Q_io, icid)
+            if (ic < 0) then
+                call set_ic(Q_io, icid)
+            else
+                call set_ic(Q_io, ic)
+            end if
         else
             call set_ic_from_file(Q_io, t, dt, dtout, nout)
         endif
+        call zero_inactive_modes(Q_io)  ! only modes along active directions evolve
 
         !-------------------------------------------------
         ! 3. Select integration method
         !-------------------------------------------------
         call select_integrator(iname, update)
+        dt_fac = 1.
 
         !-------------------------------------------------
         ! 4. Select boundary conditions
         !-------------------------------------------------
-        call select_x_boundaries(xlobc, xhibc, apply_xlobc, apply_xhibc)
-        call select_y_boundaries(ylobc, yhibc, apply_ylobc, apply_yhibc)
-        call select_z_boundaries(zlobc, zhibc, apply_zlobc, apply_zhibc)
+        call set_boundaries(xlobc, xhibc, ylobc, yhibc, zlobc, zhibc)
 
         t1 = get_clock_time()
 
         !-------------------------------------------------
         ! 5. Generate initial output
         !-------------------------------------------------
-        call output_vtk(Q_io, nout, iam)
+        if (loutput) then
+            call output_vtk(Q_io, nout, iam, t)
+            if (lhdf5) call output_h5(Q_io, nout, t, dt)
+        end if
+        call write_diagnostics(Q_io, t, dt)
 
-    end subroutine setup
+    end subroutine reset
     !---------------------------------------------------------------------------
 
 
     !===========================================================================
-    subroutine cleanup(t_start)
+    ! Select the boundary conditions for the following steps. Periodicity is
+    ! part of the MPI Cartesian topology created by init, so a change to or
+    ! from 'periodic' is refused.
+    !------------------------------------------------------------
+    subroutine set_boundaries(xlo, xhi, ylo, yhi, zlo, zhi)
+        use boundary, only: apply_xlobc, apply_ylobc, apply_zlobc,              &
+                            apply_xhibc, apply_yhibc, apply_zhibc,              &
+                            select_x_boundaries, select_y_boundaries, select_z_boundaries
+
+        implicit none
+        character(*), intent(in) :: xlo, xhi, ylo, yhi, zlo, zhi
+
+        integer, dimension(3) :: dims, periods, coords
+        logical :: newper(3)
+
+        call MPI_CART_GET(cartcomm, 3, dims, periods, coords, ierr)
+        newper = (/ xhi == 'periodic', yhi == 'periodic', zhi == 'periodic' /)
+        if (any(newper .neqv. (periods == 1))) then
+            call mpi_print(iam, 'set_boundaries: cannot change periodicity after init')
+            return
+        end if
+
+        call select_x_boundaries(xlo, xhi, apply_xlobc, apply_xhibc)
+        call select_y_boundaries(ylo, yhi, apply_ylobc, apply_yhibc)
+        call select_z_boundaries(zlo, zhi, apply_zlobc, apply_zhibc)
+
+    end subroutine set_boundaries
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Turn the initial VTK/HDF5 output written by reset on (ion /= 0) or off.
+    !   Output during the run is driven by the caller through generate_output.
+    !------------------------------------------------------------
+    subroutine set_output(ion)
+        implicit none
+        integer, intent(in) :: ion
+        loutput = (ion /= 0)
+    end subroutine set_output
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Restart the random numbers from a new seed, e.g. for independent
+    ! realizations of a fluctuating hydrodynamics (llns) run. The noise is
+    ! keyed by global cell/face index, so all ranks use the same seed.
+    !------------------------------------------------------------
+    subroutine reseed(seed)
+        implicit none
+        integer, intent(in) :: seed
+
+        call random_init(seed)
+    end subroutine reseed
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! End of a run: report its wall time. MPI stays up for the next reset.
+    !------------------------------------------------------------
+    subroutine finish(t_start)
         implicit none
         real, intent(in) :: t_start
         real :: t_stop
+
+        t_stop = get_clock_time()
+        call report_wall_time(iam, t_stop-t_start)
+    end subroutine finish
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Final shutdown: release the RNG and finalize MPI. Call once per process.
+    !------------------------------------------------------------
+    subroutine shutdown()
+        implicit none
+        logical :: finalized
+
+        if (.not. initialized) return
+
         !-------------------------------------------------
         ! 1. De-allocate system resources for RNG
         !-------------------------------------------------
@@ -128,13 +278,20 @@ contains
         !-------------------------------------------------
         ! 2. MPI cleanup
         !-------------------------------------------------
-        call MPI_Finalize(ierr)
+        call MPI_Finalized(finalized, ierr)
+        if (.not. finalized) call MPI_Finalize(ierr)
+        initialized = .false.
+    end subroutine shutdown
+    !---------------------------------------------------------------------------
 
-        !-------------------------------------------------
-        ! 3. Report simulation wall time
-        !-------------------------------------------------
-        t_stop = get_clock_time()  ! start timer for wall time
-        call report_wall_time(iam, t_stop-t_start)
+
+    !===========================================================================
+    subroutine cleanup(t_start)
+        implicit none
+        real, intent(in) :: t_start
+
+        call finish(t_start)
+        call shutdown()
     end subroutine cleanup
     !---------------------------------------------------------------------------
 
@@ -148,12 +305,15 @@ contains
 
         real dt_min,dt_val(numprocs-1),tt,cfl,vmax,vmag,valf,vmag0,valf0
         real vex,vey,vez,vem,vem0,dni,dn,vx,vy,vz,Pr,sqdni,vacc,vacc0,cs
+        real, dimension(nx,ny,nz) :: Pc, csc, Tc
         integer :: i,j,k,main_proc=0,mpi_size=1
         integer :: loc_reqs(numprocs-1),loc_stats(MPI_STATUS_SIZE,numprocs-1)
         ! NOTE: uses the global variable cflm (set in initialize.f90)
 
         vmag = 0.
 
+        call eos_cons(nx*ny*nz, Q_r(:,:,:,rh:en,1), Pc, csc, Tc)
+
         do k=1,nz
         do j=1,ny
         do i=1,nx
@@ -162,17 +322,21 @@ contains
             vx = Q_r(i,j,k,mx,1)*dni
             vy = Q_r(i,j,k,my,1)*dni
             vz = Q_r(i,j,k,mz,1)*dni
-            if (ieos == 1) cs = sqrt(aindex*(Q_r(i,j,k,en,1)*dni - 0.5*(vx**2 + vy**2 + vz**2)))
-            if (ieos == 2) cs = sqrt(7.2*P_1*dn**6.2 + T_floor)
+            ! signal speed the cflm values of set_cflm were tuned with (see cs_cfl)
+            cs = cs_cfl*csc(i,j,k)
 
             vmag0 = max( abs(vx)+cs, abs(vy)+cs, abs(vz)+cs )
+            ! stretched axes: signal speed relative to the width of this cell
+            if (lstretch) vmag0 = max( (abs(vx)+cs)*merge(dxci(i)*dx, 1., xstretch > 0.),  &
+                                       (abs(vy)+cs)*merge(dyci(j)*dx, 1., ystretch > 0.),  &
+                                       (abs(vz)+cs)*merge(dzci(k)*dx, 1., zstretch > 0.) )
             if (vmag0 > vmag .and. dn > rh_mult*rh_floor) vmag = vmag0  ! NOTE: from newCES (excluded dn thing)
         end do
         end do
         end do
 
         vmax = (vmag + cs)*dxi  ! NOTE: from newCES  (was vmag*dxi)
-        dt_min = cflm/vmax  ! time step determined by maximum flow + sound speed in the domain
+        dt_min = dt_mult*cflm/vmax  ! time step determined by maximum flow + sound speed in the domain
 
         call MPI_BARRIER(cartcomm,ierr)
         if (iam == main_proc) then
@@ -239,11 +403,13 @@ contains
                 print *, '   t = ',t*100.,'         dt= ',dt
                 t2 = 0!get_clock_time()
                 print *, '  >> Iteration time', (t2-t1), 'seconds'
+                if (lactcell) print *, '  >> Active cells', ncell_act, 'of', nx*ny*nz
                 t1 = t2
             end if
 
             call MPI_BARRIER(cartcomm,ierr)
-            call output_vtk(Q_r,nout,iam)
+            call output_vtk(Q_r,nout,iam,t)
+            if (lhdf5) call output_h5(Q_r,nout,t,dt)
 
             ! write checkpoint files; assign an odd/even id to ensure last two sets are kept
             if (iwrite == 1) then
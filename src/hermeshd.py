@@ -1,88 +1,159 @@
+from __future__ import print_function, absolute_import, division
 import _hermeshd
 import f90wrap.runtime
 import logging
+import numpy
+import warnings
+import weakref
 
 class Hermeshd(f90wrap.runtime.FortranModule):
     """
     Module hermeshd
-    
-    
-    Defined at hermeshd.f90 lines 2-267
-    
+    Defined at hermeshd.f90 lines 2-349
     """
     @staticmethod
-    def main(comm):
+    def main(comm, interface_call=False):
         """
-        main(comm)
-        
+        -----------------------------
         
-        Defined at hermeshd.f90 lines 26-47
+        main(comm)
+        Defined at hermeshd.f90 lines 30-47
         
         Parameters
         ----------
-        comm : int
-        
-        -----------------------------
+        comm : int32
         """
-        _hermeshd.f90wrap_main(comm=comm)
+        _hermeshd.f90wrap_hermeshd__main(comm=comm)
     
     @staticmethod
-    def step(q_io, q_1, q_2, t, dt):
+    def step(q_io, q_1, q_2, t, dt, interface_call=False):
         """
         step(q_io, q_1, q_2, t, dt)
-        
-        
-        Defined at hermeshd.f90 lines 53-61
+        Defined at hermeshd.f90 lines 51-59
         
         Parameters
         ----------
         q_io : float array
         q_1 : float array
         q_2 : float array
-        t : float
-        dt : float
-        
+        t : float32
+        dt : float32
         """
-        _hermeshd.f90wrap_step(q_io=q_io, q_1=q_1, q_2=q_2, t=t, dt=dt)
+        _hermeshd.f90wrap_hermeshd__step(q_io=q_io, q_1=q_1, q_2=q_2, t=t, dt=dt)
     
     @staticmethod
-    def setup(q_io, t, dt, t1, t_start, dtout, nout, comm):
+    def setup(q_io, t, dt, t1, t_start, dtout, nout, comm, interface_call=False):
         """
         setup(q_io, t, dt, t1, t_start, dtout, nout, comm)
-        
-        
-        Defined at hermeshd.f90 lines 67-113
+        Defined at hermeshd.f90 lines 73-79
         
         Parameters
         ----------
         q_io : float array
-        t : float
-        dt : float
-        t1 : float
-        t_start : float
-        dtout : float
-        nout : int
-        comm : int
+        t : float32
+        dt : float32
+        t1 : float32
+        t_start : float32
+        dtout : float32
+        nout : int32
+        comm : int32
+        """
+        _hermeshd.f90wrap_hermeshd__setup(q_io=q_io, t=t, dt=dt, t1=t1, t_start=t_start, \
+            dtout=dtout, nout=nout, comm=comm)
+    
+    @staticmethod
+    def init(comm, interface_call=False):
+        """
+        init(comm)
+        Defined at hermeshd.f90 lines 86-94
         
+        Parameters
+        ----------
+        comm : int32
+        """
+        _hermeshd.f90wrap_hermeshd__init(comm=comm)
+    
+    @staticmethod
+    def reset(q_io, t, dt, t1, t_start, dtout, nout, ic, interface_call=False):
+        """
         -------------------------------------------------
-         1. Initialize general simulation variables
+         1. Reset time, output and diagnostics counters
         -------------------------------------------------
+        
+        reset(q_io, t, dt, t1, t_start, dtout, nout, ic)
+        Defined at hermeshd.f90 lines 103-151
+        
+        Parameters
+        ----------
+        q_io : float array
+        t : float32
+        dt : float32
+        t1 : float32
+        t_start : float32
+        dtout : float32
+        nout : int32
+        ic : int32
         """
-        _hermeshd.f90wrap_setup(q_io=q_io, t=t, dt=dt, t1=t1, t_start=t_start, \
-            dtout=dtout, nout=nout, comm=comm)
+        _hermeshd.f90wrap_hermeshd__reset(q_io=q_io, t=t, dt=dt, t1=t1, t_start=t_start, \
+            dtout=dtout, nout=nout, ic=ic)
     
     @staticmethod
-    def cleanup(t_start):
+    def set_boundaries(xlo, xhi, ylo, yhi, zlo, zhi, interface_call=False):
         """
-        cleanup(t_start)
+        set_boundaries(xlo, xhi, ylo, yhi, zlo, zhi)
+        Defined at hermeshd.f90 lines 159-175
         
+        Parameters
+        ----------
+        xlo : str
+        xhi : str
+        ylo : str
+        yhi : str
+        zlo : str
+        zhi : str
+        """
+        _hermeshd.f90wrap_hermeshd__set_boundaries(xlo=xlo, xhi=xhi, ylo=ylo, yhi=yhi, \
+            zlo=zlo, zhi=zhi)
+    
+    @staticmethod
+    def set_output(ion, interface_call=False):
+        """
+        set_output(ion)
+        Defined at hermeshd.f90 lines 182-185
         
-        Defined at hermeshd.f90 lines 119-137
+        Parameters
+        ----------
+        ion : int32
+        """
+        _hermeshd.f90wrap_hermeshd__set_output(ion=ion)
+    
+    @staticmethod
+    def reseed(seed, interface_call=False):
+        """
+        reseed(seed)
+        Defined at hermeshd.f90 lines 193-196
         
         Parameters
         ----------
-        t_start : float
+        seed : int32
+        """
+        _hermeshd.f90wrap_hermeshd__reseed(seed=seed)
+    
+    @staticmethod
+    def finish(t_start, interface_call=False):
+        """
+        finish(t_start)
+        Defined at hermeshd.f90 lines 202-207
         
+        Parameters
+        ----------
+        t_start : float32
+        """
+        _hermeshd.f90wrap_hermeshd__finish(t_start=t_start)
+    
+    @staticmethod
+    def shutdown(interface_call=False):
+        """
         -------------------------------------------------
          1. De-allocate system resources for RNG
         -------------------------------------------------
@@ -90,29 +161,87 @@ class Hermeshd(f90wrap.runtime.FortranModule):
         -------------------------------------------------
          2. MPI cleanup
         -------------------------------------------------
+        
+        shutdown()
+        Defined at hermeshd.f90 lines 213-226
+        
         """
-        _hermeshd.f90wrap_cleanup(t_start=t_start)
+        _hermeshd.f90wrap_hermeshd__shutdown()
     
     @staticmethod
-    def generate_output(q_r, t, dt, t1, dtout, nout):
+    def cleanup(t_start, interface_call=False):
         """
-        generate_output(q_r, t, dt, t1, dtout, nout)
-        
+        cleanup(t_start)
+        Defined at hermeshd.f90 lines 230-234
         
-        Defined at hermeshd.f90 lines 206-265
+        Parameters
+        ----------
+        t_start : float32
+        """
+        _hermeshd.f90wrap_hermeshd__cleanup(t_start=t_start)
+    
+    @staticmethod
+    def generate_output(q_r, t, dt, t1, dtout, nout, interface_call=False):
+        """
+        generate_output(q_r, t, dt, t1, dtout, nout)
+        Defined at hermeshd.f90 lines 298-348
         
         Parameters
         ----------
         q_r : float array
-        t : float
-        dt : float
-        t1 : float
-        dtout : float
-        nout : int
-        
+        t : float32
+        dt : float32
+        t1 : float32
+        dtout : float32
+        nout : int32
+        """
+        _hermeshd.f90wrap_hermeshd__generate_output(q_r=q_r, t=t, dt=dt, t1=t1, \
+            dtout=dtout, nout=nout)
+    
+    @property
+    def initialized(self):
+        """
+        Element initialized ftype=logical pytype=bool
+        Defined at hermeshd.f90 line 26
         """
-        _hermeshd.f90wrap_generate_output(q_r=q_r, t=t, dt=dt, t1=t1, dtout=dtout, \
-            nout=nout)
+        return _hermeshd.f90wrap_hermeshd__get__initialized()
+    
+    @initialized.setter
+    def initialized(self, initialized):
+        _hermeshd.f90wrap_hermeshd__set__initialized(initialized)
+    
+    def get_initialized(self):
+        return self.initialized
+    
+    def set_initialized(self, value):
+        self.initialized = value
+    
+    @property
+    def loutput(self):
+        """
+        Element loutput ftype=logical pytype=bool
+        Defined at hermeshd.f90 line 27
+        """
+        return _hermeshd.f90wrap_hermeshd__get__loutput()
+    
+    @loutput.setter
+    def loutput(self, loutput):
+        _hermeshd.f90wrap_hermeshd__set__loutput(loutput)
+    
+    def get_loutput(self):
+        return self.loutput
+    
+    def set_loutput(self, value):
+        self.loutput = value
+    
+    def __str__(self):
+        ret = ['<hermeshd>{\n']
+        ret.append('    initialized : ')
+        ret.append(repr(self.initialized))
+        ret.append(',\n    loutput : ')
+        ret.append(repr(self.loutput))
+        ret.append('}')
+        return ''.join(ret)
     
     _dt_array_initialisers = []
     
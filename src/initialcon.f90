@@ -35,8 +35,8 @@ contains
         Q_r(:,:,:,:,:)  = 0.0
         Q_r(:,:,:,rh,1) = rh_floor
         Q_r(:,:,:,en,1) = T_floor*rh_floor/aindm1
-        ! QMask(:,:,:) = .false.
         ! MMask(:,:,:) = .false.
+        call clear_bodies  ! drop bodies of a previous initial condition
 
         select case(id)
             ! case(0)
@@ -298,7 +298,6 @@ contains
 
         implicit none
         real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_r
-        ! logical, dimension(nx,ny,nz) :: Qmask
         integer i,j,k,ieq,version
         real dn,pr,te,vx,vy,vz,ux_amb,xp0,yp0,cyl_x0,cyl_y0,cyl_rad
 
@@ -343,20 +342,16 @@ contains
         end do
 
         !-------------------------------------------------------
-        ! Generate cylinder mask --> zero out grid quantities in mask
-        !   NOTE: might be an offset b/c mask is constructed at faces, not cells
-        ! Qmask(:,:,:) = cyl_in_2d_pipe_mask(cyl_x0, cyl_y0, cyl_rad)
-
-        ! where (Qmask(:,:,:))
-        !     Q_r(:,:,:,rh,1) = 1.25
-        !     Q_r(:,:,:,mx,1) = 0.0
-        !     Q_r(:,:,:,my,1) = 0.0
-        !     Q_r(:,:,:,mz,1) = 0.0
-        ! end where
-
-        ! NOTE: Qxlow_ext_custom, Qcyl_ext, and QMask should already be initialized!
+        ! Immersed cylinder: masked cells are listed once here,
+        ! and the mask is applied every step (see apply_body_masks)
+        !   NOTE: cells are masked by their centers
+        call add_cyl_body(cyl_x0, cyl_y0, cyl_rad, 1.25)
+        call set_body_lists
+        call apply_body_masks(Q_r)
+
+        ! NOTE: Qxlow_ext_custom should already be initialized!
         ! call add_custom_boundaries(icname)
-        call set_cyl_in_2d_pipe_boundaries(Qmask, ux_amb, dn, pr, Qxlo_ext_def, Qcyl_ext_c)
+        call set_cyl_in_2d_pipe_boundaries(ux_amb, dn, pr, Qxlo_ext_def)
 
     end subroutine pipe_cylinder_2d
     !---------------------------------------------------------------------------
@@ -5,9 +5,12 @@ use input
 use params
 use helpers
 use basis_funcs!, only: wgt1d, wgt2d, wgt3d, ibitri, cbasis, set_bfvals_3D
+use kernels
+use amr
 
 use initialcon
-use random  ! TODO: commented to get working w/o MKL
+use eos
+use random
 
 implicit none
 
@@ -52,9 +55,23 @@ contains
 
         call init_bf_weights(bval_int_wgt, wgtbf_xmp, wgtbf_ymp, wgtbf_zmp)
 
+        ! Detect degenerate directions (one periodic cell) for 1D/2D runs
+        call set_active_basis(                                                  &
+            ldimred .and. ny*mpi_ny == 1 .and. ylobc == 'periodic' .and. yhibc == 'periodic', &
+            ldimred .and. nz*mpi_nz == 1 .and. zlobc == 'periodic' .and. zhibc == 'periodic')
+        call set_face_traces
+        call set_tensor_ops(lsumfac)
+        call set_kernels(lgenkern)
+        if (lgenkern .and. (kern_iquad /= iquad .or. kern_nbasis /= nbasis))     &
+            call mpi_print(iam, 'kernels.f90 does not match iquad/nbasis: rerun gen_kernels.py')
+
+        call eos_init
+        call select_eos(ieos, eos_state)
+        if (ieos == 2) call eos_check(iam)
+
         ! call init_random_seed(iam, iseed)
 
-        call random_init(iseed)  ! initialize MKL random number generator
+        call random_init(iseed)  ! set the key of the counter-based random number generator
 
         call print_startup_info
 
@@ -89,12 +106,11 @@ contains
         implicit none
         integer, intent(in) :: iquad, nbasis
 
-        if (iquad == 2 .and. nbasis == 4 ) set_ibitri = 0
-        if (iquad == 3 .and. nbasis == 10) set_ibitri = 0
-        if (iquad == 4 .and. nbasis == 20) set_ibitri = 0
-        if (iquad == 2 .and. nbasis == 8 ) set_ibitri = 1
-        if (iquad == 3 .and. nbasis == 27) set_ibitri = 1
-        if (iquad == 4 .and. nbasis == 64) set_ibitri = 1
+        ! Tensor-product {P_a(x)P_b(y)P_c(z) : a,b,c < iquad} or total-degree
+        ! {P_a(x)P_b(y)P_c(z) : a+b+c < iquad} basis
+        set_ibitri = -1
+        if (nbasis == iquad**3) set_ibitri = 1
+        if (nbasis == iquad*(iquad+1)*(iquad+2)/6 .and. iquad > 1) set_ibitri = 0
         return
     end function set_ibitri
     !---------------------------------------------------------------------------
@@ -118,6 +134,8 @@ contains
         	    if (iquad == 3) set_cflm = 0.08
         	    if (iquad == 4) set_cflm = 0.05
         end select
+        ! Generated bases: follow the 1/(2p+1) scaling of the table above
+        if (iquad > 4) set_cflm = 0.42/(2*iquad - 1)
         return
     end function set_cflm
     !---------------------------------------------------------------------------
@@ -201,20 +219,16 @@ contains
         integer, intent(in) :: ibitri
         real, dimension(nbastot) :: set_cbasis_3D
         real, dimension(nbastot) :: cbasis
+        integer ir
 
         call set_basis_function_flags(ibitri)
-        cbasis(1)             = 1.   ! basis func coeff   {1}
-        cbasis(kx:kz)         = 3.   ! basis funcs coeffs {x,y,z}
-        cbasis(kyz:kxy)       = 9.   ! basis funcs coeffs {yz,zx,xy}
-        cbasis(kxyz)          = 27.  ! basis func coeff   {xyz}
-        cbasis(kxx:kzz)       = 5.   ! basis funcs coeffs {P2(x),   P2(y),  P2(z)}
-        cbasis(kyzz:kxyy)     = 15.  ! basis funcs coeffs {yP2(z), zP2(x), xP2(y)}
-        cbasis(kyyz:kxxy)     = 15.  ! basis funcs coeffs {P2(y)z, P2(z)y, P2(z)x}
-        cbasis(kyyzz:kxxyy)   = 25.  ! basis funcs coeffs {P2(y)P2(z), P2(z)P2(x), P2(x)P2(y)}
-        cbasis(kyzxx:kxyzz)   = 45.  ! basis funcs coeffs {yzP_2(x),   zxP_2(y),   xyP_2(z)}
-        cbasis(kxyyzz:kzxxyy) = 75.  ! basis funcs coeffs {xP2(y)P2(z),yP2(z)P2(x),zP2(x)P2(y)}
-        cbasis(kxxyyzz)       = 125. ! basis funcs coeffs {P2(x)P2(y)P2(z)}
-        cbasis(kxxx:kzzz)     = 7.   ! basis funcs coeffs {P3(x), P3(y), P3(z)}
+        call set_mode_degrees()
+
+        ! Legendre normalization (2a+1)(2b+1)(2c+1) of P_a(x)P_b(y)P_c(z),
+        ! e.g. 3 for {x,y,z}, 5 for {P2(x),...}, 27 for {xyz}, 125 for {P2(x)P2(y)P2(z)}
+        do ir = 1,nbastot
+            cbasis(ir) = product(2*ideg(:,ir) + 1)
+        end do
         set_cbasis_3D(:) = cbasis(:)
         return
     end function set_cbasis_3D
@@ -234,7 +248,7 @@ contains
         integer reorder
 
         ! NOTE: USES the following global parameters
-        !   * MPI_COMM_WORLD, numprocs, ierr, cartcomm, nbrs
+        !   * numprocs, ierr, cartcomm, nbrs
         !   * EAST, WEST, NORTH, SOUTH, UP, DOWN
         !   * mpi_nx, mpi_ny (set by user)
         !   * clt, tf, ntout, xhibc, yhibc, zhibc (set by user)
@@ -261,9 +275,11 @@ contains
         if (zhibc == 'periodic') then
             periods(3) = 1
         end if
-        reorder = 1
+        ! Keep the ranks of comm: rank r holds the same subdomain in every
+        ! communicator set up this way (ensemble.py relies on it)
+        reorder = 0
 
-        call MPI_CART_CREATE(MPI_COMM_WORLD, 3, dims, periods, reorder,cartcomm, ierr)
+        call MPI_CART_CREATE(comm, 3, dims, periods, reorder,cartcomm, ierr)
         call MPI_COMM_RANK (cartcomm, iam, ierr )
         call MPI_CART_COORDS(cartcomm, iam, 3, coords, ierr)
 
@@ -299,12 +315,14 @@ contains
         implicit none
         real, intent(out) :: dx,dy,dz, dxi,dyi,dzi
         real, intent(out) :: loc_lxd, loc_lyd, loc_lzd
+        integer i
 
         ! NOTE: USES the following global parameters
         !   * lx, ly, lz (set by user)
         !   * mpi_nx, mpi_ny, mpi_nz, mpi_P, mpi_Q, mpi_R (depends on setup_MPI)
         ! NOTE: SETS the following global parameters
-        !   * dx,dy,dz, dxi,dyi,dzi
+        !   * dx,dy,dz, dxi,dyi,dzi (mean cell widths on a stretched axis)
+        !   * dxc,dyc,dzc, dxci,dyci,dzci
         !   * loc_lxd, loc_lyd, loc_lzd
 
         lxd = -(lx/2.0)
@@ -324,6 +342,32 @@ contains
         loc_lxd = lxd + (mpi_P-1)*(lxu-lxd)/mpi_nx
         loc_lyd = lyd + (mpi_Q-1)*(lyu-lyd)/mpi_ny
         loc_lzd = lzd + (mpi_R-1)*(lzu-lzd)/mpi_nz
+
+        ! Cell widths (the face coordinates xn etc. need lxd..lzu and mpi_P..R)
+        dxc(:) = dx
+        dyc(:) = dy
+        dzc(:) = dz
+        dxci(:) = dxi
+        dyci(:) = dyi
+        dzci(:) = dzi
+        if (xstretch > 0.) then
+            do i = 1,nx
+                dxc(i) = xn(i) - xn(i-1)
+            end do
+            dxci(:) = 1./dxc(:)
+        end if
+        if (ystretch > 0.) then
+            do i = 1,ny
+                dyc(i) = yn(i) - yn(i-1)
+            end do
+            dyci(:) = 1./dyc(:)
+        end if
+        if (zstretch > 0.) then
+            do i = 1,nz
+                dzc(i) = zn(i) - zn(i-1)
+            end do
+            dzci(:) = 1./dzc(:)
+        end if
     end subroutine init_spatial_params
     !---------------------------------------------------------------------------
 
@@ -334,13 +378,18 @@ contains
         real, intent(out) :: t, dt
         integer, intent(out) :: nout
         ! NOTE: USES the following global parameters
-        !   * dx (set by init_spatial_params)
+        !   * dx, lxd..lzu (set by init_spatial_params)
         !   * cflm (set by set_cflm)
         !   * clt, ntout (set by user)
         ! NOTE: SETS the following global parameters
         !   * t, dt, nout
         t = 0.0
         dt = cflm*dx/clt
+        ! the narrowest cells of a stretched grid are the end cells of the box
+        if (lstretch) dt = cflm*min(dx,                                           &
+            merge((lxu-lxd)*grid_map(1./(nx*mpi_nx), xstretch), dx, xstretch > 0.), &
+            merge((lyu-lyd)*grid_map(1./(ny*mpi_ny), ystretch), dx, ystretch > 0.), &
+            merge((lzu-lzd)*grid_map(1./(nz*mpi_nz), zstretch), dx, zstretch > 0.))/clt
         nout = 0
     end subroutine init_temporal_params
     !---------------------------------------------------------------------------
@@ -401,10 +450,25 @@ contains
 
         real t_p,dt_p,dtout_p
         integer nout_p,mpi_nx_p,mpi_ny_p,mpi_nz_p
+        real, dimension(:,:,:,:,:), allocatable :: Q_c
         ! This applies only if the initial data are being read from an input file.
         ! - If resuming a run, keep the previous clock (i.e., t at nout) running.
         ! - If not resuming a run, treat input as initial conditions at t=0, nout=0.
-        call readQ(fpre,iam,iread,Q_r,t_p,dt_p,nout_p,mpi_nx_p,mpi_ny_p,mpi_nz_p)
+        ! - With lrefine_read, the file holds the state on a grid twice as
+        !   coarse, which is refined onto this one (see amr.f90).
+        if (lrefine_read) then
+            call set_amr_prol
+            if (any(mod((/ nx, ny, nz /), nref) /= 0) .or. lstretch) then
+                call mpi_print(iam, 'Bad restart, lrefine_read needs a uniform grid with even nx, ny, nz (or 1)')
+                call exit(-1)
+            end if
+            allocate(Q_c(nx/nref(1),ny/nref(2),nz/nref(3),nQ,nbasis))
+            call readQ(fpre,iam,iread,Q_c,t_p,dt_p,nout_p,mpi_nx_p,mpi_ny_p,mpi_nz_p)
+            call amr_refine(Q_c, Q_r)
+            deallocate(Q_c)
+        else
+            call readQ(fpre,iam,iread,Q_r,t_p,dt_p,nout_p,mpi_nx_p,mpi_ny_p,mpi_nz_p)
+        end if
 
         if (resuming) then
             t = t_p
@@ -456,6 +520,11 @@ contains
             write(*,'(A13,ES10.3)')    ' dx is     = ', ly/(ny*mpi_ny)*L0
             write(*,'(A13,I10)')       ' iquad is  = ', iquad
             write(*,'(A13,I10)')       ' nbasis is = ', nbasis
+            write(*,'(A13,I10,L7,L7)') ' active    = ', nbas_act, lact_y, lact_z
+            write(*,'(A13,L10)')       ' sumfac is = ', ltensor
+            write(*,'(A13,L10)')       ' kernels   = ', lkern
+            write(*,'(A13,L10,ES10.2)') ' actcell   = ', lactcell .and. .not. llns, act_tol
+            if (lstretch) write(*,'(A13,3F10.3)') ' stretch   = ', xstretch, ystretch, zstretch
             print *, '----------------------------------------------'
             write(*,'(A16,A8,A13,A8)') ' X BC:  lower = ', xlobc, '  |  upper = ', xhibc
             write(*,'(A16,A8,A13,A8)') ' Y BC:  lower = ', ylobc, '  |  upper = ', yhibc
@@ -520,12 +589,13 @@ contains
 
 
     !===========================================================================
-    ! Read a checkpoint file (set iread to nonzero integer)
+    ! Read a checkpoint file (set iread to nonzero integer); Qin may be on a
+    ! coarser grid than nx,ny,nz (lrefine_read)
     !------------------------------------------------------------
     subroutine readQ(fprefix,irank,iddump,Qin,tnow,dtnow,noutnow,               &
                      mpi_nxnow,mpi_nynow,mpi_nznow)
         implicit none
-        real :: Qin(nx,ny,nz,nQ,nbasis),tnow,dtnow
+        real :: Qin(:,:,:,:,:),tnow,dtnow
         integer :: irank,iddump,noutnow,mpi_nxnow,mpi_nynow,mpi_nznow,nump,numd,qq,k,j,i,ir
         character (4) :: fprefix,pname,dname
         character (5) :: pname1,dname1
@@ -551,9 +621,9 @@ contains
 
         do ir=1,nbasis
         do qq=1,nQ
-            do k=1,nz
-                do j=1,ny
-                    read(3,*) (Qin(i,j,k,qq,ir),i=1,nx)
+            do k=1,size(Qin,3)
+                do j=1,size(Qin,2)
+                    read(3,*) (Qin(i,j,k,qq,ir),i=1,size(Qin,1))
                 enddo
             enddo
         enddo
@@ -20,6 +20,14 @@ module input
     integer, parameter :: iquad  = 2
     integer, parameter :: nbasis = 8
 
+    ! Apply the tensor-product bases (nbasis = iquad**3) direction by direction
+    ! (sum factorization) instead of through the dense basis tables
+    logical, parameter :: lsumfac = .true.
+
+    ! Use the unrolled kernels that gen_kernels.py writes for this (iquad, nbasis)
+    ! into kernels.f90; they take precedence over sum factorization for iquad <= 3
+    logical, parameter :: lgenkern = .true.
+
     ! Grid cell dimensions per MPI domain
     integer, parameter :: nx = 2
     integer, parameter :: ny = 2
@@ -29,12 +37,37 @@ module input
     integer :: mpi_nx = 4
     integer :: mpi_ny = 4
 
+    ! Grid stretching per direction (0 for a uniform grid): beta > 0 clusters
+    ! the cells toward both ends of the box with faces at
+    !   x = lxd + lx*(1 + tanh(beta*(2*s - 1))/tanh(beta))/2,  s = 0..1
+    ! (end cells ~cosh(beta)**2 narrower than the middle ones), for walls
+    real, parameter :: xstretch = 0.0
+    real, parameter :: ystretch = 0.0
+    real, parameter :: zstretch = 0.0
+
     ! Temporal integration order
     !   * 2 or 'heun' for 2nd-order RK
     !   * 3 or 'shu-osher' for 3rd-order RK
+    !   * 'ssp43'  for low-storage SSP(4,3)  (2x larger time steps)
+    !   * 'ssp104' for low-storage SSP(10,4) (6x larger time steps, 4th order)
+    !   * 'ssp54'  for SSP(5,4)              (1.5x larger time steps, 4th order,
+    !                                          3N storage: no memory saving)
+    !   * 'ars222', 'imex-ssp2' or 'imex-ssp3' for IMEX RK with implicit
+    !     stress relaxation (time step independent of coll, any ivis)
     integer, parameter :: iorder = 3
     character(*), parameter :: iname = 'shu-osher'
 
+    ! Adaptive time stepping (see adaptive_update in integrator.f90): rollback
+    ! only, there is no embedded error estimate. A step that gives a NaN, a
+    ! non-positive cell-average density/thermal pressure, or a relative change
+    ! in a cell average of rh or en above dq_tol is rolled back and redone with
+    ! the time step reduced by dt_shrink. After each accepted step the time
+    ! step grows back by dt_grow, but never beyond the CFL time step.
+    logical, parameter :: ladapt = .false.
+    real, parameter :: dq_tol = 0.5
+    real, parameter :: dt_shrink = 0.5, dt_grow = 1.05
+    integer, parameter :: nreject_max = 8
+
     ! Fluctuating hydrodynamics
     logical, parameter :: llns = .false.
 
@@ -50,6 +83,17 @@ module input
     character(*), parameter :: zlobc = 'periodic'
     character(*), parameter :: zhibc = 'periodic'
 
+    ! Skip the y/z direction in the flux kernels (and evolve only the basis
+    ! modes constant along it) when it holds a single periodic cell
+    logical, parameter :: ldimred = .true.
+
+    ! Evaluate the flux residual only in active cells (see activity.f90):
+    ! uniform cells with uniform neighbours, to within a relative act_tol,
+    ! get a zero residual. Opt-in: with act_tol > 0 the skip is lossy (set
+    ! act_tol = 0 to skip only exactly uniform regions)
+    logical, parameter :: lactcell = .false.
+    real, parameter :: act_tol = 1.0e-6
+
     ! Simulation time
     real, parameter :: tf = 1.0e2
 
@@ -64,6 +108,11 @@ module input
     !   * 2 for Murnaghan-Tait for water
     integer, parameter :: ieos = 1
 
+    ! Murnaghan-Tait EOS table (see eos.f90): ntab_eos intervals covering
+    ! densities [rh_tab_lo, rh_tab_hi]; the exact form is used outside
+    integer, parameter :: ntab_eos = 512
+    real, parameter :: rh_tab_lo = 0.5, rh_tab_hi = 2.0
+
     ! Thermodynamic, constitutive, and transport parameters
     real, parameter :: TK     = 94.4    ! in Kelvin
     real, parameter :: mu     = 39.948   ! AMU per molecule
@@ -84,6 +133,8 @@ module input
     character (*), parameter :: outname = "test000"
     character (*), parameter :: outdir  = trim(basedir//"/"//datadir//"/"//outname)
 
+    ! Number of outputs of each field over the run (0 to disable the field);
+    ! fields are written at every (ntout/nst*out)-th output event
     integer, parameter :: nstdout  = ntout ! density
     integer, parameter :: nstldout = 0     ! log density
     integer, parameter :: nstvout  = ntout ! velocity
@@ -95,12 +146,34 @@ module input
     integer, parameter :: nststout = 0     ! stress components
     integer, parameter :: nstvrout = 0     ! vorticity
 
+    ! Output aggregation: each group of nioagg ranks adjacent in x sends its
+    ! fields to the first rank of the group, which writes them as one .vtr
+    ! piece (1 for one file per rank; must divide mpi_nx)
+    integer, parameter :: nioagg = 1
+
+    ! HDF5 output of Q and the reconstructed fields, one file per output time
+    ! (needs a build with HDF5 support, see Makefile); gzip level 0 disables
+    ! compression, and the shuffle filter is only used together with gzip
+    logical, parameter :: lhdf5      = .false.
+    integer, parameter :: h5_gzip    = 0
+    logical, parameter :: h5_shuffle = .true.
+
+    ! In-situ diagnostics (conserved totals, kinetic energy, enstrophy,
+    ! density/pressure extrema) appended to outdir/diagnostics.csv every
+    ! ndiagstep time steps (0 to disable)
+    integer, parameter :: ndiagstep = 0
+
     ! Checkpointing
     !   set iread to 1 or 2 (when using the odd/even scheme)
     integer, parameter :: iread  = 0
     integer, parameter :: iwrite = 0
     logical, parameter :: resuming = .false.
     character (4), parameter :: fpre = 'Qout'
+    !   with lrefine_read, the checkpoint read was written on a grid twice as
+    !   coarse along every direction with nx, ny or nz > 1 (same mpi_nx, ...);
+    !   each of its cells is split by L2 projection (see amr.f90). Uniform
+    !   grids only: a stretched grid is not a bisection of its coarse version
+    logical, parameter :: lrefine_read = .false.
 
     ! Basis function testing
     logical, parameter :: test_basis = .false.
@@ -2,12 +2,14 @@
 module integrator
 
     use input!, only : nx,ny,nz
-    use params!, only : nQ,nbasis,Q_r0,Q_r1,Q_r2,Q_r3
+    use params!, only : nQ,nbasis,Q_r0,Q_r1,Q_r2
     use helpers
 
     use prepare_step
     use sources
     use flux
+    use random, only: random_forcing
+    use eos, only: eos_cons
 
     !===========================================================================
     ! ABSTRACT INTERFACE to subroutine for temporal integration
@@ -29,6 +31,36 @@ module integrator
     ! Initialize pointer to temporal integration subroutine
     !-----------------------------------------------------------------
     procedure (update_ptr), pointer :: update => null ()
+
+    ! SSP coefficient of the selected method relative to that of Shu-Osher RK3
+    ! (the scheme cflm is set for); get_min_dt scales the time step by it
+    real :: dt_mult = 1.
+
+    ! True if the selected method needs Q_2 (otherwise Q_2 holds the state
+    ! saved for rollback by adaptive_update)
+    logical :: uses_q2 = .false.
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Adaptive time stepping (see adaptive_update)
+    !-----------------------------------------------------------------
+    real :: dt_fac = 1.                ! current multiple of the CFL time step
+    logical :: step_failed = .false.   ! set by advance_time_level on a NaN
+    real, dimension(:,:,:,:,:), allocatable :: Q_save  ! rollback copy if uses_q2
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! IMEX Runge-Kutta tableaux (set by set_imex) and stage storage:
+    ! explicit (flux) terms F_stage for all variables, implicit (relaxation)
+    ! terms G_stage for the stress variables pxx:pyz only
+    !-----------------------------------------------------------------
+    integer, parameter :: nstage_max = 4
+    integer :: nstage = 0
+    real, dimension(nstage_max,nstage_max) :: a_ex, a_im
+    real, dimension(nstage_max) :: b_ex, b_im
+    real, dimension(:,:,:,:,:,:), allocatable :: F_stage, G_stage
     !---------------------------------------------------------------------------
 
 contains
@@ -41,16 +73,50 @@ contains
         character(*), intent(in) :: name
         procedure(update_ptr), pointer :: integrator
 
+        uses_q2 = .false.
+
         select case (name)
             case ('heun')
                 call mpi_print(iam, 'Selected 2nd-order Runga-Kutta (Heun) integration')
                 integrator => RK2
+                dt_mult = 1.
             case ('shu-osher')
                 call mpi_print(iam, 'Selected 3rd-order Runga-Kutta (Shu-Osher) integration')
                 integrator => RK3
+                dt_mult = 1.
+            case ('ssp43')
+                call mpi_print(iam, 'Selected low-storage SSP(4,3) Runga-Kutta integration')
+                integrator => SSPRK43
+                dt_mult = 2.
+            case ('ssp104')
+                call mpi_print(iam, 'Selected low-storage SSP(10,4) Runga-Kutta integration')
+                integrator => SSPRK104
+                dt_mult = 6.
+            case ('ssp54')
+                ! NOTE: not low-storage: needs Q_2 (3N), plus Q_save under ladapt
+                call mpi_print(iam, 'Selected SSP(5,4) Runga-Kutta integration (3N storage)')
+                integrator => SSPRK54
+                dt_mult = 1.508
+                uses_q2 = .true.
+            case ('ars222')
+                call mpi_print(iam, 'Selected IMEX ARS(2,2,2) integration (implicit relaxation)')
+                integrator => IMEX
+                call set_imex(name)
+                dt_mult = 1.
+            case ('imex-ssp2')
+                call mpi_print(iam, 'Selected IMEX-SSP2(2,2,2) integration (implicit relaxation)')
+                integrator => IMEX
+                call set_imex(name)
+                dt_mult = 1.
+            case ('imex-ssp3')
+                call mpi_print(iam, 'Selected IMEX-SSP3(4,3,3) integration (implicit relaxation)')
+                integrator => IMEX
+                call set_imex(name)
+                dt_mult = 1.
             case default
                 call mpi_print(iam, 'Defaulting to 2nd-order Runga-Kutta (Heun) integration')
                 integrator => RK2
+                dt_mult = 1.
         end select
     end subroutine
     !---------------------------------------------------------------------------
@@ -58,6 +124,26 @@ contains
 
     !===========================================================================
     ! Temporal integration subroutines (subject to change!)
+    !
+    ! All stages are done in place by euler_step (Q <- Q + dt*L(Q)), so the
+    ! schemes below are written in low-storage form: every method except
+    ! SSP(5,4) only uses Q_io and Q_1 (2N storage), and never touches Q_2.
+    ! SSP(5,4) gives no memory saving: it needs Q_2 as a third register, and
+    ! adaptive_update then keeps its rollback copy in a fourth (Q_save).
+    ! The first stage (first_stage) limits Q_io itself, so the convex
+    ! combinations with Q_io use the limited state, as before the rewrite.
+    ! SSP coefficient C (per step) and effective CFL C/stages, relative to
+    ! forward Euler:
+    !
+    !   heun       SSP(2,2)   C = 1    C_eff = 0.5
+    !   shu-osher  SSP(3,3)   C = 1    C_eff = 0.33
+    !   ssp43      SSP(4,3)   C = 2    C_eff = 0.5
+    !   ssp104     SSP(10,4)  C = 6    C_eff = 0.6   (Ketcheson 2008)
+    !   ssp54      SSP(5,4)   C = 1.51 C_eff = 0.30  (Spiteri & Ruuth 2002, 3N)
+    !
+    ! cflm is set for shu-osher, so get_min_dt scales it by C (dt_mult).
+    !
+    ! The IMEX schemes (ars222, imex-ssp2, imex-ssp3) are further below.
     !-----------------------------------------------------------------
     subroutine RK2(Q_io, Q_1, Q_2, dt)
         implicit none
@@ -65,9 +151,9 @@ contains
         real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_1, Q_2
         real, intent(inout) :: dt
 
-        call euler_step(Q_io, Q_1, dt)
-        call euler_step(Q_1, Q_2, dt)
-        Q_io = 0.5 * ( Q_io + Q_2 )
+        call first_stage(Q_io, Q_1, dt)
+        call euler_step(Q_1, dt)
+        Q_io = 0.5 * ( Q_io + Q_1 )
     end subroutine RK2
 
     !----------------------------------------------------
@@ -77,36 +163,372 @@ contains
         real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_1, Q_2
         real, intent(inout) :: dt
 
-        call euler_step(Q_io, Q_1, dt)
-        call euler_step(Q_1, Q_2, dt)
-        Q_1 = 0.75*Q_io + 0.25*Q_2
+        call first_stage(Q_io, Q_1, dt)
+        call euler_step(Q_1, dt)
+        Q_1 = 0.75*Q_io + 0.25*Q_1
 
-        call euler_step(Q_1, Q_2, dt)  ! re-use the second array
-        Q_io = c1d3*Q_io + c2d3*Q_2
+        call euler_step(Q_1, dt)
+        Q_io = c1d3*Q_io + c2d3*Q_1
     end subroutine RK3
+
+    !----------------------------------------------------
+    subroutine SSPRK43(Q_io, Q_1, Q_2, dt)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_1, Q_2
+        real, intent(inout) :: dt
+        real dts
+
+        dts = 0.5*dt
+        call first_stage(Q_io, Q_1, dts)
+        call euler_step(Q_1, dts)
+        call euler_step(Q_1, dts)
+        Q_1 = c2d3*Q_io + c1d3*Q_1
+
+        call euler_step(Q_1, dts)
+        Q_io = Q_1
+    end subroutine SSPRK43
+
+    !----------------------------------------------------
+    subroutine SSPRK104(Q_io, Q_1, Q_2, dt)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_1, Q_2
+        real, intent(inout) :: dt
+        real dts
+        integer istage
+
+        ! Q_io holds u, then the 1/25 u + 9/25 u_5 combination (Ketcheson 2008)
+        dts = dt/6.
+        call first_stage(Q_io, Q_1, dts)
+        do istage = 2,5
+            call euler_step(Q_1, dts)
+        end do
+        Q_io = 0.04*Q_io + 0.36*Q_1
+        Q_1 = 15.*Q_io - 5.*Q_1
+
+        do istage = 6,9
+            call euler_step(Q_1, dts)
+        end do
+        call euler_step(Q_1, dts)
+        Q_io = Q_io + 0.6*Q_1
+    end subroutine SSPRK104
+
+    !----------------------------------------------------
+    subroutine SSPRK54(Q_io, Q_1, Q_2, dt)
+        ! Shu-Osher form of SSP(5,4); stages 3-4 and 4-5 share a coefficient
+        ! ratio, so the final combination is accumulated in Q_1 as we go
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_1, Q_2
+        real, intent(inout) :: dt
+
+        call first_stage(Q_io, Q_1, 0.391752226571890*dt)               ! u_1
+        call euler_step(Q_1, 0.663050807850946*dt)
+        Q_1 = 0.444370493651235*Q_io + 0.555629506348765*Q_1            ! u_2
+
+        Q_2 = Q_1
+        call euler_step(Q_2, 0.663050807850946*dt)
+        Q_2 = 0.620101851488403*Q_io + 0.379898148511597*Q_2            ! u_3
+
+        call euler_step(Q_2, 0.663050807850946*dt)                      ! u_3 + c dt L(u_3)
+        Q_1 = 0.517231671970585*Q_1 + 0.096059710526147*Q_2
+        Q_2 = 0.178079954393132*Q_io + 0.821920045606868*Q_2            ! u_4
+
+        call euler_step(Q_2, 0.584438703993959*dt)
+        Q_io = Q_1 + 0.386708617503269*Q_2
+    end subroutine SSPRK54
     !---------------------------------------------------------------------------
 
 
     !===========================================================================
-    ! Explicit Euler integration step
+    ! IMEX Runge-Kutta: the flux (and llns noise) is explicit, the relaxation
+    ! of the stress variables towards equilibrium is implicit, so the time
+    ! step is set by the hyperbolic CFL condition whatever coll is:
+    !
+    !   Q_i = Q^n + dt*sum_{j<i} a_ex(i,j)*F(Q_j) + dt*sum_{j<=i} a_im(i,j)*G(Q_j)
+    !   Q^{n+1} = Q^n + dt*sum_i b_ex(i)*F(Q_i) + dt*sum_i b_im(i)*G(Q_i)
+    !
+    ! with F = -glflux_r and G the relaxation term for the current ivis
+    ! (see relax_rhs). Q_1 holds the stage value; Q_2 is not used.
     !-----------------------------------------------------------------
-    subroutine euler_step(Q_in, Q_out, dt)
+    subroutine IMEX(Q_io, Q_1, Q_2, dt)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_1, Q_2
+        real, intent(inout) :: dt
+        integer is, js
+
+        do is = 1,nstage
+            Q_1 = Q_io
+            do js = 1,is-1
+                if (a_ex(is,js) /= 0.) Q_1 = Q_1 + dt*a_ex(is,js)*F_stage(:,:,:,:,:,js)
+                if (a_im(is,js) /= 0.)                                          &
+                    Q_1(:,:,:,pxx:pyz,:) = Q_1(:,:,:,pxx:pyz,:) + dt*a_im(is,js)*G_stage(:,:,:,:,:,js)
+            end do
+            if (a_im(is,is) /= 0.) call relax_solve(Q_1, dt*a_im(is,is))
+
+            ! Only evaluate the terms that a later stage or the update uses
+            if (b_ex(is) /= 0. .or. any(a_ex(is+1:nstage,is) /= 0.)) then
+                call random_forcing()
+                call prep_advance(Q_1)
+                call glflux(Q_1)
+                F_stage(:,:,:,:,:,is) = -glflux_r
+            end if
+            if (b_im(is) /= 0. .or. any(a_im(is+1:nstage,is) /= 0.)) then
+                call relax_rhs(Q_1, G_stage(:,:,:,:,:,is))
+            end if
+        end do
+
+        do is = 1,nstage
+            if (b_ex(is) /= 0.) Q_io = Q_io + dt*b_ex(is)*F_stage(:,:,:,:,:,is)
+            if (b_im(is) /= 0.)                                                 &
+                Q_io(:,:,:,pxx:pyz,:) = Q_io(:,:,:,pxx:pyz,:) + dt*b_im(is)*G_stage(:,:,:,:,:,is)
+        end do
+
+        call check_nans(Q_io)
+    end subroutine IMEX
+
+    !----------------------------------------------------
+    subroutine set_imex(name)
+        ! ARS(2,2,2): Ascher, Ruuth & Spiteri (1997), stiffly accurate
+        ! IMEX-SSP2(2,2,2), IMEX-SSP3(4,3,3): Pareschi & Russo (2005)
+        implicit none
+        character(*), intent(in) :: name
+        real gam, del, alp, bet, eta
+
+        a_ex = 0.
+        a_im = 0.
+        b_ex = 0.
+        b_im = 0.
+
+        select case (name)
+            case ('ars222')
+                gam = 1. - 1./sqrt(2.)
+                del = 1. - 1./(2.*gam)
+                nstage = 3
+                a_ex(2,1) = gam
+                a_ex(3,1:2) = (/ del, 1.-del /)
+                b_ex(1:3) = (/ del, 1.-del, 0. /)
+                a_im(2,2) = gam
+                a_im(3,2:3) = (/ 1.-gam, gam /)
+                b_im(1:3) = (/ 0., 1.-gam, gam /)
+            case ('imex-ssp2')
+                gam = 1. - 1./sqrt(2.)
+                nstage = 2
+                a_ex(2,1) = 1.
+                b_ex(1:2) = 0.5
+                a_im(1,1) = gam
+                a_im(2,1:2) = (/ 1.-2.*gam, gam /)
+                b_im(1:2) = 0.5
+            case ('imex-ssp3')
+                alp = 0.24169426078821
+                bet = 0.06042356519705
+                eta = 0.12915286960590
+                nstage = 4
+                a_ex(3,2) = 1.
+                a_ex(4,2:3) = 0.25
+                b_ex(1:4) = (/ 0., 1./6., 1./6., 2./3. /)
+                a_im(1,1) = alp
+                a_im(2,1:2) = (/ -alp, alp /)
+                a_im(3,2:3) = (/ 1.-alp, alp /)
+                a_im(4,1:4) = (/ bet, eta, 0.5-bet-eta-alp, alp /)
+                b_im(1:4) = (/ 0., 1./6., 1./6., 2./3. /)
+        end select
+
+        if (allocated(F_stage)) deallocate(F_stage, G_stage)
+        allocate(F_stage(nx,ny,nz,nQ,nbasis,nstage))
+        allocate(G_stage(nx,ny,nz,pxx:pyz,nbasis,nstage))
+    end subroutine set_imex
+
+    !----------------------------------------------------
+    subroutine relax_rhs(Q_in, G)
+        ! Relaxation term G(Q) of the stress variables:
+        !   ivis = 0,1 : -coll*P_ij                       (deviatoric stress)
+        !   ivis = 2   : -coll*dev(P_ij - rho*v_i*v_j)    (10-moment, the
+        !                rho*v*v part is projected by source_calc)
         implicit none
         real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_in
-        real, dimension(nx,ny,nz,nQ,nbasis), intent(out) :: Q_out
+        real, dimension(nx,ny,nz,pxx:pyz,nbasis), intent(out) :: G
+        real, dimension(nx,ny,nz,nbasis) :: trc
+        integer ieq
+
+        G = -coll*Q_in(:,:,:,pxx:pyz,:)
+        if (ivis == 2) then
+            call source_calc(Q_in)
+            trc = c1d3*(Q_in(:,:,:,pxx,:) + Q_in(:,:,:,pyy,:) + Q_in(:,:,:,pzz,:))
+            do ieq = pxx,pzz
+                G(:,:,:,ieq,:) = G(:,:,:,ieq,:) + coll*trc
+            end do
+            G = G + source_r(:,:,:,pxx:pyz,:)
+        end if
+    end subroutine relax_rhs
+
+    !----------------------------------------------------
+    subroutine relax_solve(Q_io, gdt)
+        ! Solve X = R + gdt*G(X) in place (R = Q_io on entry). rho and m are
+        ! not relaxed, so the rho*v*v term of ivis = 2 is known from R and
+        ! the solve is exact: the trace of P is conserved and its deviatoric
+        ! part decays by 1/(1 + gdt*coll).
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, intent(in) :: gdt
+        real, dimension(nx,ny,nz,nbasis) :: trc
+        real fac
+        integer ieq
+
+        fac = 1./(1. + gdt*coll)
+        if (ivis == 2) then
+            call source_calc(Q_io)
+            trc = c1d3*(Q_io(:,:,:,pxx,:) + Q_io(:,:,:,pyy,:) + Q_io(:,:,:,pzz,:))
+            do ieq = pxx,pzz
+                Q_io(:,:,:,ieq,:) = trc + fac*( Q_io(:,:,:,ieq,:) - trc         &
+                                              + gdt*source_r(:,:,:,ieq,:) )
+            end do
+            do ieq = pxy,pyz
+                Q_io(:,:,:,ieq,:) = fac*( Q_io(:,:,:,ieq,:) + gdt*source_r(:,:,:,ieq,:) )
+            end do
+        else
+            Q_io(:,:,:,pxx:pyz,:) = fac*Q_io(:,:,:,pxx:pyz,:)
+        end if
+    end subroutine relax_solve
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Take one step of the selected method, starting from the CFL time step dt
+    ! (from get_min_dt); on return dt is the time step actually taken.
+    !
+    ! With ladapt, the step is checked afterwards (step_ok) and, if it failed,
+    ! rolled back and redone with dt_fac reduced by dt_shrink, up to
+    ! nreject_max times. Each accepted step lets dt_fac grow by dt_grow, up to
+    ! 1 (the CFL time step). This only guards against failed steps: there is
+    ! no embedded error estimate, so dt is never raised above the CFL limit.
+    ! The rollback copy lives in Q_2 unless the method needs it.
+    !
+    ! The immersed-body masks are applied to every stage (prep_advance) and
+    ! again to the new state, which the output, diagnostics and next step use.
+    !-----------------------------------------------------------------
+    subroutine adaptive_update(Q_io, Q_1, Q_2, dt)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_1, Q_2
         real, intent(inout) :: dt
 
-        call prep_advance(Q_in)
-        call calc_rhs(Q_in)
-        call advance_time_level(Q_in, Q_out, dt)
+        real dt_cfl
+        integer ntry
+        character(len=128) :: message
+
+        if (.not. ladapt) then
+            call update(Q_io, Q_1, Q_2, dt)
+            if (nbcell > 0) call apply_body_masks(Q_io)
+            return
+        end if
+
+        if (uses_q2 .and. .not. allocated(Q_save)) allocate(Q_save(nx,ny,nz,nQ,nbasis))
+
+        dt_cfl = dt
+        do ntry = 0,nreject_max
+            dt = dt_fac*dt_cfl
+            if (uses_q2) then
+                Q_save = Q_io
+            else
+                Q_2 = Q_io
+            end if
+
+            step_failed = .false.
+            call update(Q_io, Q_1, Q_2, dt)
+
+            if (uses_q2) then
+                if (step_ok(Q_io, Q_save)) exit
+                Q_io = Q_save
+            else
+                if (step_ok(Q_io, Q_2)) exit
+                Q_io = Q_2
+            end if
+
+            dt_fac = dt_shrink*dt_fac
+            write(message,'(a,es10.3,a,es10.3)') 'Step rejected at dt =', dt,    &
+                                                 ', retrying with dt =', dt_fac*dt_cfl
+            call mpi_print(iam, trim(message))
+        end do
+
+        if (ntry > nreject_max) then
+            call mpi_print(iam, 'Too many rejected steps. Bailing out...')
+            call exit(-1)
+        end if
+
+        dt_fac = min(dt_grow*dt_fac, 1.)
+        if (nbcell > 0) call apply_body_masks(Q_io)
+    end subroutine adaptive_update
+
+    !----------------------------------------------------
+    logical function step_ok(Q_new, Q_old)
+        ! Accept a step (on all ranks) unless it produced a NaN, a cell average
+        ! with density below rh_floor or negative thermal pressure, or changed
+        ! the cell average of rh or en by more than dq_tol (relative)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_new, Q_old
+        real, dimension(nx,ny,nz) :: P, cs, T
+        real dq
+        logical bad, any_bad
+
+        bad = step_failed
+        if (.not. bad) bad = minval(Q_new(:,:,:,rh,1)) < rh_floor
+        if (.not. bad) then
+            call eos_cons(nx*ny*nz, Q_new(:,:,:,rh:en,1), P, cs, T)
+            bad = minval(T) < 0.
+        end if
+        if (.not. bad) then
+            dq = max( maxval(abs(Q_new(:,:,:,rh,1) - Q_old(:,:,:,rh,1))/abs(Q_old(:,:,:,rh,1))), &
+                      maxval(abs(Q_new(:,:,:,en,1) - Q_old(:,:,:,en,1))/abs(Q_old(:,:,:,en,1))) )
+            bad = .not. (dq <= dq_tol)   ! also catches a NaN in dq
+        end if
+
+        call MPI_ALLREDUCE(bad, any_bad, 1, MPI_LOGICAL, MPI_LOR, cartcomm, ierr)
+        step_ok = .not. any_bad
+    end function step_ok
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Explicit Euler integration step (in place)
+    !-----------------------------------------------------------------
+    subroutine euler_step(Q_io, dt)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, intent(in) :: dt
+
+        call random_forcing()  ! new stage: bulk llns noise for all points
+        call prep_advance(Q_io)
+        call calc_rhs(Q_io)
+        call advance_time_level(Q_io, dt)
     end subroutine euler_step
 
 
+    !----------------------------------------------------
+    subroutine first_stage(Q_io, Q_out, dt)
+        ! Euler step from Q_io into Q_out. Q_io is limited in place, as the
+        ! stage combinations of the explicit schemes reuse it.
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_out
+        real, intent(in) :: dt
+
+        call random_forcing()
+        call prep_advance(Q_io)
+        call calc_rhs(Q_io)
+        Q_out = Q_io
+        call advance_time_level(Q_out, dt)
+    end subroutine first_stage
+
+
     !----------------------------------------------------
     subroutine prep_advance(Q_io)
         implicit none
         real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
 
+        if (nbcell > 0) call apply_body_masks(Q_io)
         if (ieos == 1 .or. ieos == 2) call limiter(Q_io)
         call exchange_flux(Q_io)
         call apply_boundaries
@@ -122,11 +544,11 @@ contains
     end subroutine calc_rhs
 
     !----------------------------------------------------
-    subroutine advance_time_level(Q_in, Q_out, dt)
+    subroutine advance_time_level(Q_io, dt)
+        ! Update Q_io in place (every point only depends on its own old value)
         implicit none
-        real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_in
-        real, dimension(nx,ny,nz,nQ,nbasis), intent(out) :: Q_out
-        real, intent(inout) :: dt
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(inout) :: Q_io
+        real, intent(in) :: dt
 
         real P_xx,P_yy,P_zz,P_xy,P_xz,P_yz
         real glf_pxx,glf_pyy,glf_pzz,glf_pxy,glf_pxz,glf_pyz
@@ -144,8 +566,8 @@ contains
                 do k = 1,nz
                 do j = 1,ny
                 do i = 1,nx
-                    Q_out(i,j,k,ieq,ir) =                                       &
-                        Q_in(i,j,k,ieq,ir) - dt*( glflux_r(i,j,k,ieq,ir)        &
+                    Q_io(i,j,k,ieq,ir) =                                       &
+                        Q_io(i,j,k,ieq,ir) - dt*( glflux_r(i,j,k,ieq,ir)        &
                                                 - source_r(i,j,k,ieq,ir) )
                 end do
                 end do
@@ -160,18 +582,18 @@ contains
                 do j = 1,ny
                 do i = 1,nx
                     !--- Separate ----------
-                    ! Q_out(i,j,k,rh:en,ir) =     Q_in(i,j,k,rh:en,ir)            &
+                    ! Q_io(i,j,k,rh:en,ir) =     Q_io(i,j,k,rh:en,ir)            &
                     !                     - ( glflux_r(i,j,k,rh:en,ir)            &
                     !                       - source_r(i,j,k,rh:en,ir) ) * dt
-                    ! Q_out(i,j,k,pxx:pyz,ir) = ( Q_in(i,j,k,pxx:pyz,ir)          &
+                    ! Q_io(i,j,k,pxx:pyz,ir) = ( Q_io(i,j,k,pxx:pyz,ir)          &
                     !                    - dt*glflux_r(i,j,k,pxx:pyz,ir)          &
                     !                    + dt*source_r(i,j,k,pxx:pyz,ir) ) * faci
 
                     !--- Combo -------------
-                    Q_out(i,j,k,1:nQ,ir) =                                      &
-                        Q_in(i,j,k,1:nQ,ir) - dt*( glflux_r(i,j,k,1:nQ,ir)      &
+                    Q_io(i,j,k,1:nQ,ir) =                                      &
+                        Q_io(i,j,k,1:nQ,ir) - dt*( glflux_r(i,j,k,1:nQ,ir)      &
                                                  - source_r(i,j,k,1:nQ,ir) )
-                    Q_out(i,j,k,pxx:pyz,ir) = faci * Q_out(i,j,k,pxx:pyz,ir)
+                    Q_io(i,j,k,pxx:pyz,ir) = faci * Q_io(i,j,k,pxx:pyz,ir)
                 end do
                 end do
                 end do
@@ -183,12 +605,12 @@ contains
                 do k = 1,nz
                 do j = 1,ny
                 do i = 1,nx
-                    P_xx = Q_in(i,j,k,pxx,ir)
-                    P_yy = Q_in(i,j,k,pyy,ir)
-                    P_zz = Q_in(i,j,k,pzz,ir)
-                    P_xy = Q_in(i,j,k,pxy,ir)
-                    P_xz = Q_in(i,j,k,pxz,ir)
-                    P_yz = Q_in(i,j,k,pyz,ir)
+                    P_xx = Q_io(i,j,k,pxx,ir)
+                    P_yy = Q_io(i,j,k,pyy,ir)
+                    P_zz = Q_io(i,j,k,pzz,ir)
+                    P_xy = Q_io(i,j,k,pxy,ir)
+                    P_xz = Q_io(i,j,k,pxz,ir)
+                    P_yz = Q_io(i,j,k,pyz,ir)
 
                     glf_pxx = glflux_r(i,j,k,pxx,ir)
                     glf_pyy = glflux_r(i,j,k,pyy,ir)
@@ -208,17 +630,17 @@ contains
                     glf_sum = coll*dt**2*( glf_pxx + glf_pyy + glf_pzz )*c1d3
                     src_sum = coll*dt**2*( src_pxx + src_pyy + src_pzz )*c1d3
 
-                    Q_out(i,j,k,pxx,ir) = faci * ( P_xx - dt*glf_pxx + dt*src_pxx &
+                    Q_io(i,j,k,pxx,ir) = faci * ( P_xx - dt*glf_pxx + dt*src_pxx &
                                                  + Q_sum -   glf_sum +    src_sum )
 
-                    Q_out(i,j,k,pyy,ir) = faci * ( P_yy - dt*glf_pyy + dt*src_pyy &
+                    Q_io(i,j,k,pyy,ir) = faci * ( P_yy - dt*glf_pyy + dt*src_pyy &
                                                  + Q_sum -   glf_sum +    src_sum )
 
-                    Q_out(i,j,k,pzz,ir) = faci * ( P_zz - dt*glf_pzz + dt*src_pzz &
+                    Q_io(i,j,k,pzz,ir) = faci * ( P_zz - dt*glf_pzz + dt*src_pzz &
                                                  + Q_sum -   glf_sum +    src_sum )
 
                     do ieq = pxy,nQ
-                        Q_out(i,j,k,ieq,ir) = ( Q_in(i,j,k,ieq,ir)              &
+                        Q_io(i,j,k,ieq,ir) = ( Q_io(i,j,k,ieq,ir)              &
                                            - dt*glflux_r(i,j,k,ieq,ir)          &
                                            + dt*source_r(i,j,k,ieq,ir) ) * faci
                     end do
@@ -229,13 +651,24 @@ contains
 
         end select
 
-        !-----------------------------------------------------------------------
-        ! Check for NaNs; bail out with info.
+        call check_nans(Q_io)
+
+    end subroutine advance_time_level
+
+    !----------------------------------------------------
+    subroutine check_nans(Q_io)
+        ! Check for NaNs; bail out with info (flag the step with ladapt)
+        implicit none
+        real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_io
+        integer i,j,k,ieq
+
         do ieq = 1,nQ
         do k = 1,nz
         do j = 1,ny
         do i = 1,nx
-          if ( Q_out(i,j,k,ieq,1) /= Q_out(i,j,k,ieq,1) ) then
+          if ( Q_io(i,j,k,ieq,1) /= Q_io(i,j,k,ieq,1) ) then
+            step_failed = .true.
+            if (ladapt) return  ! rejected and redone by adaptive_update
             print *,'------------------------------------------------'
             print *,'NaN. Bailing out...'
             write(*,'(A7,I9,A7,I9,A7,I9)')          '   i = ',   i, '   j = ',    j, '   k = ',k
@@ -249,7 +682,7 @@ contains
         end do
         end do
 
-    end subroutine advance_time_level
+    end subroutine check_nans
     !---------------------------------------------------------------------------
 
 end module integrator
@@ -2,7 +2,7 @@
 program main
 
 use input!, only : nx,ny,nz
-use params!, only : nQ,nbasis,Q_r0,Q_r1,Q_r2,Q_r3
+use params!, only : nQ,nbasis,Q_r0,Q_r1,Q_r2
 use helpers!, only : xc,yc,zc,get_clock_time
 
 use integrator
@@ -16,8 +16,11 @@ use initialize
 use prepare_step
 use sources
 use random
+use activity
 use flux
 use output
+use output_hdf5
+use diagnostics
 
 integer :: nout, comm
 
@@ -30,6 +33,7 @@ integer :: nout, comm
 !-------------------------------------------------
 call MPI_Init ( ierr )
 call initializer(t, dt, nout, MPI_COMM_WORLD)
+if (lhdf5) call h5_check(iam)
 
 t_start = get_clock_time()  ! start timer for wall time
 dtout = tf/ntout  ! TODO: move this to a more sensible place once output scheme is improved!
@@ -42,6 +46,7 @@ if (iread == 0) then
 else
     call set_ic_from_file(Q_r0, t, dt, dtout, nout)
 endif
+call zero_inactive_modes(Q_r0)  ! only modes along active directions evolve
 
 !-------------------------------------------------
 ! 3. Select integration method
@@ -60,7 +65,9 @@ t1 = get_clock_time()
 !-------------------------------------------------
 ! 5. Generate initial output
 !-------------------------------------------------
-call output_vtk(Q_r0, nout, iam)
+call output_vtk(Q_r0, nout, iam, t)
+if (lhdf5) call output_h5(Q_r0, nout, t, dt)
+call write_diagnostics(Q_r0, t, dt)
 
 !-------------------------------------------------------------------------------
 
@@ -71,8 +78,9 @@ call output_vtk(Q_r0, nout, iam)
 do while( t < tf )
 
     dt = get_min_dt(Q_r0)
-    call update(Q_r0, Q_r1, Q_r2, dt)
+    call adaptive_update(Q_r0, Q_r1, Q_r2, dt)
     t = t + dt
+    call write_diagnostics(Q_r0, t, dt)
 
     call generate_output(Q_r0, t, nout)  ! determines when output should be generated
 
@@ -114,11 +122,14 @@ contains
 
         real dt_min,dt_val(numprocs-1),tt,cfl,vmax,vmag,valf,vmag0,valf0
         real vex,vey,vez,vem,vem0,dni,dn,vx,vy,vz,Pr,sqdni,vacc,vacc0,cs
+        real, dimension(nx,ny,nz) :: Pc, csc, Tc
         integer :: i,j,k,main_proc=0,mpi_size=1
         integer :: loc_reqs(numprocs-1),loc_stats(MPI_STATUS_SIZE,numprocs-1)
 
         vmag = 0.
 
+        call eos_cons(nx*ny*nz, Q_r(:,:,:,rh:en,1), Pc, csc, Tc)
+
         do k=1,nz
         do j=1,ny
         do i=1,nx
@@ -127,17 +138,21 @@ contains
             vx = Q_r(i,j,k,mx,1)*dni
             vy = Q_r(i,j,k,my,1)*dni
             vz = Q_r(i,j,k,mz,1)*dni
-            if (ieos == 1) cs = sqrt(aindex*(Q_r(i,j,k,en,1)*dni - 0.5*(vx**2 + vy**2 + vz**2)))
-            if (ieos == 2) cs = sqrt(7.2*P_1*dn**6.2 + T_floor)
+            ! signal speed the cflm values of set_cflm were tuned with (see cs_cfl)
+            cs = cs_cfl*csc(i,j,k)
 
             vmag0 = max( abs(vx)+cs, abs(vy)+cs, abs(vz)+cs )
+            ! stretched axes: signal speed relative to the width of this cell
+            if (lstretch) vmag0 = max( (abs(vx)+cs)*merge(dxci(i)*dx, 1., xstretch > 0.),  &
+                                       (abs(vy)+cs)*merge(dyci(j)*dx, 1., ystretch > 0.),  &
+                                       (abs(vz)+cs)*merge(dzci(k)*dx, 1., zstretch > 0.) )
             if (vmag0 > vmag .and. dn > rh_mult*rh_floor) vmag = vmag0  ! NOTE: from newCES (excluded dn thing)
         end do
         end do
         end do
 
         vmax = (vmag + cs)*dxi  ! NOTE: from newCES  (was vmag*dxi)
-        dt_min = cflm/vmax  ! time step determined by maximum flow + sound speed in the domain
+        dt_min = dt_mult*cflm/vmax  ! time step determined by maximum flow + sound speed in the domain
 
         call MPI_BARRIER(cartcomm,ierr)
         if (iam.eq.main_proc) then
@@ -203,11 +218,13 @@ contains
                 print *, '   t = ',t*100.,'         dt= ',dt
                 t2 = get_clock_time()
                 print *, '  >> Iteration time', (t2-t1), 'seconds'
+                if (lactcell) print *, '  >> Active cells', ncell_act, 'of', nx*ny*nz
                 t1 = t2
             end if
 
             call MPI_BARRIER(cartcomm,ierr)
-            call output_vtk(Q_r,nout,iam)
+            call output_vtk(Q_r,nout,iam,t)
+            if (lhdf5) call output_h5(Q_r,nout,t,dt)
 
             ! write checkpoint files; assign an odd/even id to ensure last two sets are kept
             if (iwrite == 1) then
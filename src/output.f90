@@ -2,20 +2,39 @@
 module output
 
 use LIB_VTK_IO
+use vtr_io
 
 use params
 use helpers
 use basis_funcs
+use eos
 
 integer(I4P), parameter :: nnx=nx*nvtk, nny=ny*nvtk, nnz=nz*nvtk
 
+! Output aggregation (set up on the first call to output_vtk)
+!   nagg     : number of ranks per output group (effective value of nioagg)
+!   aggcomm  : communicator of this rank's group, ordered by mpi_P
+!   agg_rank : rank within aggcomm (0 is the aggregator that writes the file)
+integer :: nagg = 0, aggcomm, agg_rank
+
+! Per-field output cadence. Field ifld is written at every output event
+! nout that is a multiple of ntout/nstfld(ifld), i.e. nstfld(ifld) times per
+! run (never more often than every event; 0 turns the field off)
+integer, parameter :: fld_dn=1, fld_ldn=2, fld_v=3, fld_T=4, fld_ei=5,         &
+                      fld_en=6, fld_es=7, fld_P=8, fld_st=9, fld_vr=10
+integer, parameter :: nvtkfld = 10
+integer, parameter :: nstfld(nvtkfld) = (/ nstdout, nstldout, nstvout, nsttout, &
+                                           nsteiout, nstenout, nstesout,        &
+                                           nstpout, nststout, nstvrout /)
+
 contains
 
-    subroutine output_vtk(Qin,nout,iam)
+    subroutine output_vtk(Qin,nout,iam,tnow)
 
         implicit none
         real Qin(nx,ny,nz,nQ,nbasis)
         integer nout
+        real tnow
         integer(I4P), parameter :: nb=1*ngu,sprd=0*1
         ! integer(I4P), parameter :: nnx=nx*nvtk, nny=ny*nvtk, nnz=nz*nvtk
         real(R4P), dimension(nnx+1) :: x_xml_rect
@@ -26,57 +45,71 @@ contains
         real(R4P), dimension(nnx*nny*nnz) :: var_xml_val_z
         real(R4P), dimension(nnx,nny,nnz,nQ) :: qvtk
         real(R4P), dimension(nnx,nny,nnz) :: qvtk_dxvy,qvtk_dyvx
+        real, dimension(nnx-2*nb,nny-2*nb,nnz-2*nb) :: Pvtk,csvtk,Tvtk
         real dn,dni, vx,vy,vz, U,P, dxrh,dyrh,dxmy,dymx
-        integer(I4P):: E_IO,i,j,k,l,num,iam,igrid,ir,jr,kr,ib,jb,kb,ieq
+        integer(I4P):: i,j,k,l,iam,igrid,ir,jr,kr,ib,jb,kb,ieq
         character (70) :: out_name
-        character (4) :: tname
-        character (5) :: tname1
-        character (4) :: pname
-        character (5) :: pname1
-
-        num=nout+10000
-
-        write(tname1,'(i5)')num
-        tname=tname1(2:5)
-        tname = trim(tname)
-        tname = adjustr(tname)
+        character (32) :: names(nvtkfld)
+        integer :: ncomps(nvtkfld), nfld, neq, ieqs(nQ)
+        logical :: due(nvtkfld), need(nQ)
+
+        ! Only write (and reconstruct the variables for) fields due at this event
+        call fields_due(nout, due)
+        if (.not. any(due)) return
+
+        need = .false.
+        if (due(fld_dn) .or. due(fld_ldn)) need(rh) = .true.
+        if (due(fld_v) .or. due(fld_vr)) need((/rh,mx,my,mz/)) = .true.
+        if (due(fld_T) .or. due(fld_ei) .or. due(fld_es) .or. due(fld_P)) need(rh:en) = .true.
+        if (due(fld_en)) need(en) = .true.
+        if (due(fld_st)) need((/pxx,pyy,pzz/)) = .true.
+        neq = 0
+        do ieq = 1,nQ
+            if (need(ieq)) then
+                neq = neq + 1
+                ieqs(neq) = ieq
+            end if
+        end do
 
-        num=iam+10000
-
-        write(pname1,'(i5)')num
-        pname=pname1(2:5)
-        pname = trim(pname)
-        pname = adjustr(pname)
+        if (nagg == 0) call init_output_aggregation()
 
         ! "outdir" is a global variable specifying the output directory
-        out_name=''//outdir//'/perseus_p'//pname//'_t'//tname//'.vtr'
+        out_name=''//outdir//'/'//trim(vtk_piece_name(iam,nout))
 
         if (iam .eq. print_mpi) print *, '  Data written to:  ', out_name
-        out_name = trim(out_name)
-        out_name = adjustr(out_name)
-
-        E_IO = VTK_INI_XML(output_format = 'BINARY',              &
-                           filename      = out_name, &
-                           mesh_topology = 'RectilinearGrid',     &
-                           nx1=1,nx2=nnx+1,ny1=1,ny2=nny+1,nz1=1,nz2=nnz+1)
 
         ! NOTE: SLS removed the 1e-3 to get the units right
         do i=1+nb,nnx-nb+1
-            x_xml_rect(i-nb)=(xvtk(i) - 0.5*dxvtk) !*1e-3
+            x_xml_rect(i-nb)=xvtk_node(i) !*1e-3
         enddo
         do j=1+nb,nny-nb+1
-            y_xml_rect(j-nb)=(yvtk(j) - 0.5*dyvtk) !*1e-3
+            y_xml_rect(j-nb)=yvtk_node(j) !*1e-3
         enddo
         do k=1+nb,nnz-nb+1
-            z_xml_rect(k-nb)=(zvtk(k) - 0.5*dzvtk) !*1e-3
+            z_xml_rect(k-nb)=zvtk_node(k) !*1e-3
         enddo
 
 
-        E_IO = VTK_GEO_XML(nx1=1,nx2=nnx+1,ny1=1,ny2=nny+1,nz1=1,nz2=nnz+1, &
-                             X=x_xml_rect,Y=y_xml_rect,Z=z_xml_rect)
-
-        E_IO = VTK_DAT_XML(var_location     = 'cell', &
-                           var_block_action = 'OPEN')
+        ! Declare the fields up front so the appended-data offsets are known
+        nfld = 0
+        if (due(fld_dn)) call add_vtk_field(names, ncomps, nfld, 'Density', 1)
+        if (due(fld_ldn)) call add_vtk_field(names, ncomps, nfld, 'Log density', 1)
+        if (due(fld_v))  call add_vtk_field(names, ncomps, nfld, 'Velocity', 3)
+        if (due(fld_T))  call add_vtk_field(names, ncomps, nfld, 'Temperature', 1)
+        if (due(fld_ei)) call add_vtk_field(names, ncomps, nfld, 'Internal energy density', 1)
+        if (due(fld_en)) call add_vtk_field(names, ncomps, nfld, 'Total energy density', 1)
+        if (due(fld_es)) call add_vtk_field(names, ncomps, nfld, 'Entropy density', 1)
+        if (due(fld_P))  call add_vtk_field(names, ncomps, nfld, 'Pressure', 1)
+        if (due(fld_st)) call add_vtk_field(names, ncomps, nfld, 'Isotropic stress', 3)
+        if (due(fld_vr)) call add_vtk_field(names, ncomps, nfld, 'Vorticity', 1)
+
+        ! Extents are in global point indices so the pieces line up in the .pvtr
+        if (agg_rank == 0) then
+            call vtr_open(out_name, piece_extent(mpi_P,mpi_Q,mpi_R),            &
+                          (/ (xvtk_node(i+nb), i=1,nagg*nnx+1) /),            &
+                          y_xml_rect, z_xml_rect, names(1:nfld), ncomps(1:nfld), &
+                          whole_extent())
+        end if
 
 
         do i=1+nb,nnx-nb
@@ -106,21 +139,36 @@ contains
                         kr = kr - 1
                     end if
                     igrid = nvtk2*(ib-1) + nvtk*(jb-1) + kb
-                    do ieq=1,nQ
+                    do l=1,neq
+                        ieq = ieqs(l)
                         qvtk(i,j,k,ieq) = sum(bfvtk(igrid,1:nbasis)*Qin(ir,jr,kr,ieq,1:nbasis))
                     end do
 
+                    if (.not. due(fld_vr)) cycle
                     dxrh = sum(bfvtk_dx(igrid,1:nbasis)*Qin(ir,jr,kr,rh,1:nbasis))
                     dyrh = sum(bfvtk_dy(igrid,1:nbasis)*Qin(ir,jr,kr,rh,1:nbasis))
                     dxmy = sum(bfvtk_dx(igrid,1:nbasis)*Qin(ir,jr,kr,my,1:nbasis))
                     dymx = sum(bfvtk_dy(igrid,1:nbasis)*Qin(ir,jr,kr,mx,1:nbasis))
+                    ! the field below is scaled by dxi: rescale to the cell widths
+                    if (lstretch) then
+                        dxrh = (dxci(ir)*dx)*dxrh
+                        dxmy = (dxci(ir)*dx)*dxmy
+                        dyrh = (dyci(jr)*dx)*dyrh
+                        dymx = (dyci(jr)*dx)*dymx
+                    end if
                     qvtk_dxvy(i,j,k) = (qvtk(i,j,k,rh)*dxmy - qvtk(i,j,k,my)*dxrh)/qvtk(i,j,k,rh)**2
                     qvtk_dyvx(i,j,k) = (qvtk(i,j,k,rh)*dymx - qvtk(i,j,k,mx)*dyrh)/qvtk(i,j,k,rh)**2
                 end do
             end do
         end do
 
-        if (nstdout /= 0) then
+        ! Pressure and temperature of all the output points in one EOS call
+        if (due(fld_T) .or. due(fld_P)) then
+            call eos_cons(size(Pvtk), qvtk(1+nb:nnx-nb,1+nb:nny-nb,1+nb:nnz-nb,rh:en), &
+                          Pvtk, csvtk, Tvtk)
+        end if
+
+        if (due(fld_dn)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
@@ -129,13 +177,11 @@ contains
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz, &
-                               varname = 'Density',                    &
-                               var     = var_xml_val_x)
+            call output_scalar(var_xml_val_x)
         end if
 
         !------------------------------------------------------------
-        if (nstldout /= 0) then
+        if (due(fld_ldn)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
@@ -144,14 +190,12 @@ contains
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz, &
-                               varname = 'Log density',                    &
-                               var     = var_xml_val_x)
+            call output_scalar(var_xml_val_x)
 
         end if
 
         !------------------------------------------------------------
-        if (nstvout /= 0) then
+        if (due(fld_v)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
@@ -162,35 +206,24 @@ contains
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz,                               &
-                               varname = 'Velocity',                                &
-                               varX    = var_xml_val_x,                             &
-                               varY    = var_xml_val_y,                             &
-                               varZ    = var_xml_val_z )
+            call output_vector(var_xml_val_x, var_xml_val_y, var_xml_val_z)
         end if
 
         !------------------------------------------------------------
-        if (nsttout /= 0) then
+        if (due(fld_T)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
                         l=(i-nb)+(j-nb-1)*(nnx-2*nb)+(k-nb-1)*(nnx-2*nb)*(nny-2*nb)
-                        dni = 1./qvtk(i,j,k,rh)
-                        vx = qvtk(i,j,k,mx)*dni
-                        vy = qvtk(i,j,k,my)*dni
-                        vz = qvtk(i,j,k,mz)*dni
-                        P = (aindex - 1.)*(qvtk(i,j,k,en) - 0.5*qvtk(i,j,k,rh)*(vx**2 + vy**2 + vz**2))
-                        var_xml_val_x(l)=P*te0*dni/eV_per_K  ! Kelvin  (CES code just had P*te0)
+                        var_xml_val_x(l)=Tvtk(i-nb,j-nb,k-nb)*te0/eV_per_K  ! Kelvin  (CES code just had P*te0)
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz, &
-                               varname = 'Temperature',                    &
-                               var     = var_xml_val_x)
+            call output_scalar(var_xml_val_x)
         end if
 
         !------------------------------------------------------------
-        if (nsteiout /= 0) then
+        if (due(fld_ei)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
@@ -201,16 +234,15 @@ contains
                         vy  = qvtk(i,j,k,my)*dni
                         vz  = qvtk(i,j,k,mz)*dni
                         U   = qvtk(i,j,k,en) - 0.5*dn*(vx**2 + vy**2 + vz**2)
+                        var_xml_val_x(l) = U
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz, &
-                               varname = 'Internal energy density',                    &
-                               var     = var_xml_val_x)
+            call output_scalar(var_xml_val_x)
         end if
 
         !------------------------------------------------------------
-        if (nstenout /= 0) then
+        if (due(fld_en)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
@@ -219,13 +251,11 @@ contains
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz, &
-                               varname = 'Total energy density',                    &
-                               var     = var_xml_val_x)
+            call output_scalar(var_xml_val_x)
         end if
 
         !------------------------------------------------------------
-        if (nstesout /= 0) then
+        if (due(fld_es)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
@@ -241,41 +271,25 @@ contains
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz, &
-                               varname = 'Entropy density',                    &
-                               var     = var_xml_val_x)
+            call output_scalar(var_xml_val_x)
         end if
 
         !------------------------------------------------------------
-        if (nstpout /= 0) then
+        if (due(fld_P)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
                         l = (i-nb)+(j-nb-1)*(nnx-2*nb)+(k-nb-1)*(nnx-2*nb)*(nny-2*nb)
-                        dni = 1./qvtk(i,j,k,rh)
-                        vx = qvtk(i,j,k,mx)*dni
-                        vy = qvtk(i,j,k,my)*dni
-                        vz = qvtk(i,j,k,mz)*dni
-                        ! from "viscosity" version
-                        P = (aindex - 1.)*(qvtk(i,j,k,en) - 0.5*qvtk(i,j,k,rh)*(vx**2 + vy**2 + vz**2))
-                        var_xml_val_x(l) = P
-                        ! if (ieos == 1) P = (aindex - 1.)*(qvtk(i,j,k,en) - 0.5*qvtk(i,j,k,rh)*(vx**2 + vy**2 + vz**2))
-                        ! if (ieos == 2) then
-                        !     P = P_1*(qvtk(i,j,k,rh)**7.2 - 1.) + P_base
-                        !     if(P < P_floor) P = P_floor
-                        ! end if
-                        ! var_xml_val_x(l) = P*P0
+                        var_xml_val_x(l) = Pvtk(i-nb,j-nb,k-nb)
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz, &
-                               varname = 'Pressure',                    &
-                               var     = var_xml_val_x)
+            call output_scalar(var_xml_val_x)
 
         end if
 
         !------------------------------------------------------------
-        if (nststout /= 0) then
+        if (due(fld_st)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
@@ -286,15 +300,11 @@ contains
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz,                               &
-                               varname = 'Isotropic stress',                        &
-                               varX    = var_xml_val_x,                             &
-                               varY    = var_xml_val_y,                             &
-                               varZ    = var_xml_val_z )
+            call output_vector(var_xml_val_x, var_xml_val_y, var_xml_val_z)
         end if
 
         !------------------------------------------------------------
-        if (nstvrout /= 0) then
+        if (due(fld_vr)) then
             do i=1+nb,nnx-nb
                 do j=1+nb,nny-nb
                     do k=1+nb,nnz-nb
@@ -303,21 +313,237 @@ contains
                     enddo
                 enddo
             enddo
-            E_IO = VTK_VAR_XML(NC_NN   = nnx*nny*nnz, &
-                               varname = 'Vorticity',                    &
-                               var     = var_xml_val_x)
+            call output_scalar(var_xml_val_x)
         end if
 
 
-        E_IO = VTK_DAT_XML(var_location     = 'cell', &
-                           var_block_action = 'Close')
-        E_IO = VTK_GEO_XML()
-        E_IO = VTK_END_XML()
+        if (agg_rank == 0) call vtr_close()
+
+        ! Rank 0 ties the pieces together and adds them to the time series
+        if (iam == 0) call output_vtk_index(names(1:nfld), ncomps(1:nfld), nout, tnow)
 
     end subroutine output_vtk
 
     !--------------------------------------------------------------------------------
 
+    subroutine output_vtk_index(names, ncomps, nout, tnow)
+
+        implicit none
+        character(*), intent(in) :: names(:)
+        integer, intent(in) :: ncomps(:), nout
+        real, intent(in) :: tnow
+        integer :: piece_ext(6,numprocs), coords(3), irank, npiece
+        character (32) :: sources(numprocs)
+        character (20) :: pvtr_name
+
+        ! Only the aggregators (first rank of each group along x) write pieces
+        npiece = 0
+        do irank = 0,numprocs-1
+            call MPI_CART_COORDS(cartcomm, irank, 3, coords, ierr)
+            if (mod(coords(1), nagg) == 0) then
+                npiece = npiece + 1
+                piece_ext(:,npiece) = piece_extent(coords(1)+1, coords(2)+1, coords(3)+1)
+                sources(npiece) = vtk_piece_name(irank, nout)
+            end if
+        end do
+
+        write(pvtr_name,'(a,i4.4,a)') 'perseus_t', nout, '.pvtr'
+
+        call vtr_write_pvtr(outdir//'/'//trim(pvtr_name), whole_extent(),       &
+                            names, ncomps, piece_ext(:,1:npiece), sources(1:npiece))
+        call vtr_write_pvd(outdir//'/perseus.pvd', tnow, pvtr_name, nout == 0)
+
+    end subroutine output_vtk_index
+
+    !--------------------------------------------------------------------------------
+
+    ! Flag the fields due at output event nout (see nstfld)
+    subroutine fields_due(nout, due)
+        implicit none
+        integer, intent(in) :: nout
+        logical, intent(out) :: due(nvtkfld)
+        integer :: ifld
+
+        do ifld = 1,nvtkfld
+            due(ifld) = .false.
+            if (nstfld(ifld) > 0) due(ifld) = mod(nout, max(ntout/nstfld(ifld),1)) == 0
+        end do
+    end subroutine fields_due
+
+    !--------------------------------------------------------------------------------
+
+    ! Split cartcomm into output groups of nagg consecutive ranks along x
+    subroutine init_output_aggregation()
+        implicit none
+        integer :: color
+
+        nagg = nioagg
+        if (nagg < 1 .or. mod(mpi_nx, max(nagg,1)) /= 0) then
+            call mpi_print(iam, 'WARNING: nioagg must divide mpi_nx; writing one file per rank')
+            nagg = 1
+        end if
+
+        color = (mpi_Q-1) + mpi_ny*(mpi_R-1) + mpi_ny*mpi_nz*((mpi_P-1)/nagg)
+        call MPI_COMM_SPLIT(cartcomm, color, mpi_P, aggcomm, ierr)
+        call MPI_COMM_RANK(aggcomm, agg_rank, ierr)
+
+    end subroutine init_output_aggregation
+
+    !--------------------------------------------------------------------------------
+
+    ! Write a scalar field, gathering it to the aggregator first if needed
+    subroutine output_scalar(var)
+        implicit none
+        real(R4P), intent(in) :: var(nnx*nny*nnz)
+        real(R4P), allocatable :: vagg(:)
+
+        if (nagg == 1) then
+            call vtr_write_scalar(var)
+            return
+        end if
+
+        call gather_field(var, vagg)
+        if (agg_rank == 0) call vtr_write_scalar(vagg)
+        deallocate(vagg)
+
+    end subroutine output_scalar
+
+    ! Write a vector field, gathering it to the aggregator first if needed
+    subroutine output_vector(varx, vary, varz)
+        implicit none
+        real(R4P), intent(in) :: varx(nnx*nny*nnz), vary(nnx*nny*nnz), varz(nnx*nny*nnz)
+        real(R4P), allocatable :: vaggx(:), vaggy(:), vaggz(:)
+
+        if (nagg == 1) then
+            call vtr_write_vector(varx, vary, varz)
+            return
+        end if
+
+        call gather_field(varx, vaggx)
+        call gather_field(vary, vaggy)
+        call gather_field(varz, vaggz)
+        if (agg_rank == 0) call vtr_write_vector(vaggx, vaggy, vaggz)
+        deallocate(vaggx, vaggy, vaggz)
+
+    end subroutine output_vector
+
+    ! Gather a field from the ranks in aggcomm and lay it out as one block
+    ! (x fastest) on the aggregator. Other ranks get a zero-size array.
+    subroutine gather_field(var, vagg)
+        implicit none
+        real(R4P), intent(in) :: var(nnx*nny*nnz)
+        real(R4P), allocatable, intent(out) :: vagg(:)
+        real(R4P), allocatable :: recv(:)
+        integer :: ncell
+
+        ncell = nnx*nny*nnz
+        if (agg_rank == 0) then
+            allocate(recv(ncell*nagg), vagg(ncell*nagg))
+        else
+            allocate(recv(1), vagg(0))
+        end if
+
+        call MPI_GATHER(var, ncell, MPI_TT, recv, ncell, MPI_TT, 0, aggcomm, ierr)
+        if (agg_rank == 0) call unpack_x_blocks(recv, vagg)
+        deallocate(recv)
+
+    end subroutine gather_field
+
+    subroutine unpack_x_blocks(recv, vagg)
+        implicit none
+        real(R4P), intent(in)  :: recv(nnx,nny,nnz,nagg)
+        real(R4P), intent(out) :: vagg(nagg*nnx,nny,nnz)
+        integer :: ia
+
+        do ia = 1,nagg
+            vagg((ia-1)*nnx+1:ia*nnx,:,:) = recv(:,:,:,ia)
+        end do
+
+    end subroutine unpack_x_blocks
+
+    !--------------------------------------------------------------------------------
+
+    function vtk_piece_name(irank, nout)
+        implicit none
+        integer, intent(in) :: irank, nout
+        character (32) :: vtk_piece_name
+        write(vtk_piece_name,'(a,i4.4,a,i4.4,a)') 'perseus_p', irank, '_t', nout, '.vtr'
+    end function vtk_piece_name
+
+    !--------------------------------------------------------------------------------
+
+    ! Point extent of the VTK piece written by the aggregator at Cartesian coords
+    ! (P,Q,R); the piece spans nagg ranks in x
+    function piece_extent(iP, iQ, iR)
+        implicit none
+        integer, intent(in) :: iP, iQ, iR
+        integer :: piece_extent(6)
+        piece_extent = (/ (iP-1)*nnx+1, (iP-1+nagg)*nnx+1, (iQ-1)*nny+1, iQ*nny+1, &
+                          (iR-1)*nnz+1, iR*nnz+1 /)
+    end function piece_extent
+
+    function whole_extent()
+        implicit none
+        integer :: whole_extent(6)
+        whole_extent = (/ 1, mpi_nx*nnx+1, 1, mpi_ny*nny+1, 1, mpi_nz*nnz+1 /)
+    end function whole_extent
+
+    !--------------------------------------------------------------------------------
+
+    ! Coordinate of the lower face of output point i (i > nnx reaches into the
+    ! next ranks along x); the nvtk points of a stretched cell split it evenly
+    real function xvtk_node(i)
+        implicit none
+        integer, intent(in) :: i
+        integer :: ic
+        if (xstretch > 0.) then
+            ic = (i-1)/nvtk + 1
+            xvtk_node = xn(ic-1) + (i-1 - (ic-1)*nvtk)*(xn(ic) - xn(ic-1))/nvtk
+        else
+            xvtk_node = xvtk(i) - 0.5*dxvtk
+        end if
+    end function xvtk_node
+
+    real function yvtk_node(j)
+        implicit none
+        integer, intent(in) :: j
+        integer :: jc
+        if (ystretch > 0.) then
+            jc = (j-1)/nvtk + 1
+            yvtk_node = yn(jc-1) + (j-1 - (jc-1)*nvtk)*(yn(jc) - yn(jc-1))/nvtk
+        else
+            yvtk_node = yvtk(j) - 0.5*dyvtk
+        end if
+    end function yvtk_node
+
+    real function zvtk_node(k)
+        implicit none
+        integer, intent(in) :: k
+        integer :: kc
+        if (zstretch > 0.) then
+            kc = (k-1)/nvtk + 1
+            zvtk_node = zn(kc-1) + (k-1 - (kc-1)*nvtk)*(zn(kc) - zn(kc-1))/nvtk
+        else
+            zvtk_node = zvtk(k) - 0.5*dzvtk
+        end if
+    end function zvtk_node
+
+    !--------------------------------------------------------------------------------
+
+    subroutine add_vtk_field(names, ncomps, nfld, name, ncomp)
+        implicit none
+        character(*), intent(inout) :: names(:)
+        integer, intent(inout) :: ncomps(:), nfld
+        character(*), intent(in) :: name
+        integer, intent(in) :: ncomp
+
+        nfld = nfld + 1
+        names(nfld)  = name
+        ncomps(nfld) = ncomp
+    end subroutine add_vtk_field
+
+    !--------------------------------------------------------------------------------
+
     subroutine output_vtk0(Qin,nout,iam)
 
         implicit none
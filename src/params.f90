@@ -30,6 +30,11 @@
 ! Use iquad = 4
 !   nbasis = 20: nbasis10 + {xyz, xP2(y), yP2(x), xP2(z),
 !                                 zP2(x), yP2(z), zP2(y), P3(x), P3(y), P3(z)}
+!   nbasis = 64: all P_a(x)P_b(y)P_c(z) with a,b,c <= 3
+!
+! Any iquad >= 4 with nbasis = iquad**3 (tensor product) or
+! iquad*(iquad+1)*(iquad+2)/6 (total degree < iquad) uses basis tables
+! generated from the Legendre degrees of each mode (see set_mode_degrees).
 !*******************************************************************************
 module params
 
@@ -46,7 +51,7 @@ module params
     integer, parameter :: pxy = 9, pxz = 10, pyz = 11 ! deviatoric stress
     integer, parameter :: nQ  = 11                    ! number of field variables
 
-    integer, parameter :: nbastot = 30
+    integer, parameter :: nbastot = max(30, nbasis)
     integer, parameter :: ngu = 0  ! TODO: only used in output_vtk()
 
     ! iquad: # of Gaussian quadrature points per direction. iquad should not be:
@@ -160,7 +165,7 @@ module params
     !===========================================================================
     ! Arrays for field variables, fluxes/inner-integrals, and sources, and time(s)
     !------------------------------------------------------------
-    real, dimension(nx,ny,nz,nQ,nbasis) :: Q_r0, Q_r1, Q_r2, Q_r3
+    real, dimension(nx,ny,nz,nQ,nbasis) :: Q_r0, Q_r1, Q_r2
     real, dimension(nx,ny,nz,nQ,nbasis) :: glflux_r, source_r, integral_r
     !===========================================================================
 
@@ -182,6 +187,17 @@ module params
     !===========================================================================
 
 
+    !===========================================================================
+    ! Stretched grids: per-cell widths and their inverses along each axis
+    !   (= dx, dxi etc. on a uniform axis; set in init_spatial_params)
+    !------------------------------------------------------------
+    logical, parameter :: lstretch = xstretch > 0. .or. ystretch > 0. .or. zstretch > 0.
+    real, dimension(nx) :: dxc, dxci
+    real, dimension(ny) :: dyc, dyci
+    real, dimension(nz) :: dzc, dzci
+    !===========================================================================
+
+
     !===========================================================================
     ! MPI definitions
     !------------------------------------------------------------
@@ -211,21 +227,68 @@ contains
     !     Note: based on the location of this MPI domain (loc_lxd)
     real function xc(i)
         integer i
-        xc = loc_lxd + (i - 0.5)*dx
+        if (xstretch > 0.) then
+            xc = 0.5*(xn(i-1) + xn(i))
+        else
+            xc = loc_lxd + (i - 0.5)*dx
+        end if
     end function xc
 
     !-----------------------------------------------------------
     real function yc(j)
         integer j
-        yc = loc_lyd + (j - 0.5)*dy
+        if (ystretch > 0.) then
+            yc = 0.5*(yn(j-1) + yn(j))
+        else
+            yc = loc_lyd + (j - 0.5)*dy
+        end if
     end function yc
 
     !-----------------------------------------------------------
     real function zc(k)
         integer k
-        zc = loc_lzd + (k - 0.5)*dz
+        if (zstretch > 0.) then
+            zc = 0.5*(zn(k-1) + zn(k))
+        else
+            zc = loc_lzd + (k - 0.5)*dz
+        end if
     end function zc
 
+    !-----------------------------------------------------------
+    !   Return the x coordinate of the upper face of cell i (i = 0 for
+    !   the lower face of cell 1), also for cells outside this MPI domain
+    !     Note: faces follow x = lxd + lx*grid_map(s, xstretch), with s the
+    !     global face index over the number of cells along x
+    real function xn(i)
+        integer i
+        xn = lxd + (lxu - lxd)*grid_map(real(i + (mpi_P-1)*nx)/(nx*mpi_nx), xstretch)
+    end function xn
+
+    !-----------------------------------------------------------
+    real function yn(j)
+        integer j
+        yn = lyd + (lyu - lyd)*grid_map(real(j + (mpi_Q-1)*ny)/(ny*mpi_ny), ystretch)
+    end function yn
+
+    !-----------------------------------------------------------
+    real function zn(k)
+        integer k
+        zn = lzd + (lzu - lzd)*grid_map(real(k + (mpi_R-1)*nz)/(nz*mpi_nz), zstretch)
+    end function zn
+
+    !-----------------------------------------------------------
+    !   Map [0,1] onto itself, clustering points at both ends (walls) for
+    !   beta > 0: the ratio of the widths of the middle and the end cells
+    !   grows like cosh(beta)**2
+    real function grid_map(s, beta)
+        real s, beta
+        if (beta > 0.) then
+            grid_map = 0.5*(1. + tanh(beta*(2.*s - 1.))/tanh(beta))
+        else
+            grid_map = s
+        end if
+    end function grid_map
+
     !-----------------------------------------------------------
     real function rz(i,j)
         integer i,j
@@ -0,0 +1,146 @@
+!****** PHILOX.F90 ***********************************************************************
+!   Counter-based random number generation with Philox4x32-10
+!   (Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", SC11).
+!
+!   A Philox draw is a pure function of a 128-bit counter and a 64-bit key:
+!   there is no stream state to advance, so a random number can be tied to
+!   *what* it is for (e.g. seed, time stage, global cell index) rather than to
+!   the order in which a process happens to draw it. Results are therefore
+!   independent of the MPI decomposition and of the call order, and arrays of
+!   counters can be processed in one elemental (vectorizable) call.
+!
+!   Unsigned 32-bit words are held in integer(8) variables in [0, 2**32).
+!
+!   Like helpers, this module should NOT depend on problem-specific globals.
+!*******************************************************************************
+module philox
+
+    implicit none
+
+    integer, parameter :: px_i8 = selected_int_kind(18)
+    integer, parameter :: px_r8 = selected_real_kind(15,307)
+
+    integer(px_i8), parameter :: px_mask32 = 4294967295_px_i8   ! 2**32 - 1
+    integer(px_i8), parameter :: px_m0 = 3528531795_px_i8       ! 0xD2511F53
+    integer(px_i8), parameter :: px_m1 = 3449720151_px_i8       ! 0xCD9E8D57
+    integer(px_i8), parameter :: px_w0 = 2654435769_px_i8       ! 0x9E3779B9
+    integer(px_i8), parameter :: px_w1 = 3144134277_px_i8       ! 0xBB67AE85
+
+    real(px_r8), parameter :: px_two32i = 1.0_px_r8/4294967296.0_px_r8
+    real(px_r8), parameter :: px_twopi  = 6.283185307179586476925_px_r8
+
+contains
+
+    !===========================================================================
+    ! Philox4x32 with 10 rounds: counter (c0,c1,c2,c3), key (k0,k1) -> (r0..r3)
+    !------------------------------------------------------------
+    elemental subroutine philox4x32(c0, c1, c2, c3, k0, k1, r0, r1, r2, r3)
+        integer(px_i8), intent(in)  :: c0, c1, c2, c3, k0, k1
+        integer(px_i8), intent(out) :: r0, r1, r2, r3
+
+        integer(px_i8) :: x0, x1, x2, x3, y0, y1, y2, y3, key0, key1
+        integer(px_i8) :: hi0, lo0, hi1, lo1
+        integer :: iround
+
+        x0 = iand(c0, px_mask32)
+        x1 = iand(c1, px_mask32)
+        x2 = iand(c2, px_mask32)
+        x3 = iand(c3, px_mask32)
+        key0 = iand(k0, px_mask32)
+        key1 = iand(k1, px_mask32)
+
+        do iround = 1,10
+            call mulhilo32(px_m0, x0, hi0, lo0)
+            call mulhilo32(px_m1, x2, hi1, lo1)
+            y0 = ieor(ieor(hi1, x1), key0)
+            y1 = lo1
+            y2 = ieor(ieor(hi0, x3), key1)
+            y3 = lo0
+            x0 = y0
+            x1 = y1
+            x2 = y2
+            x3 = y3
+            key0 = iand(key0 + px_w0, px_mask32)
+            key1 = iand(key1 + px_w1, px_mask32)
+        end do
+
+        r0 = x0
+        r1 = x1
+        r2 = x2
+        r3 = x3
+    end subroutine philox4x32
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Four standard normal deviates from one Philox draw (Box-Muller on the
+    ! two pairs of uniforms in (0,1))
+    !------------------------------------------------------------
+    elemental subroutine philox_normal4(c0, c1, c2, c3, k0, k1, g0, g1, g2, g3)
+        integer(px_i8), intent(in) :: c0, c1, c2, c3, k0, k1
+        real, intent(out) :: g0, g1, g2, g3
+
+        integer(px_i8) :: r0, r1, r2, r3
+        real(px_r8) :: rad, ang
+
+        call philox4x32(c0, c1, c2, c3, k0, k1, r0, r1, r2, r3)
+
+        rad = sqrt(-2.0_px_r8*log((real(r0,px_r8) + 0.5_px_r8)*px_two32i))
+        ang = px_twopi*(real(r1,px_r8) + 0.5_px_r8)*px_two32i
+        g0 = real(rad*cos(ang))
+        g1 = real(rad*sin(ang))
+
+        rad = sqrt(-2.0_px_r8*log((real(r2,px_r8) + 0.5_px_r8)*px_two32i))
+        ang = px_twopi*(real(r3,px_r8) + 0.5_px_r8)*px_two32i
+        g2 = real(rad*cos(ang))
+        g3 = real(rad*sin(ang))
+    end subroutine philox_normal4
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Fill g(1:n) with standard normal deviates for the counter prefix
+    ! (c1,c2,c3) and key (k0,k1); g(4*ib+1:4*ib+4) comes from counter word
+    ! c0 = ib, so any element is reproducible on its own.
+    !------------------------------------------------------------
+    subroutine philox_normal(c1, c2, c3, k0, k1, n, g)
+        integer(px_i8), intent(in) :: c1, c2, c3, k0, k1
+        integer, intent(in) :: n
+        real, intent(out) :: g(n)
+
+        real :: g4(4)
+        integer :: ib, nfull
+
+        nfull = n/4
+        do ib = 0,nfull-1
+            call philox_normal4(int(ib,px_i8), c1, c2, c3, k0, k1,              &
+                                g(4*ib+1), g(4*ib+2), g(4*ib+3), g(4*ib+4))
+        end do
+        if (4*nfull < n) then
+            call philox_normal4(int(nfull,px_i8), c1, c2, c3, k0, k1,           &
+                                g4(1), g4(2), g4(3), g4(4))
+            g(4*nfull+1:n) = g4(1:n-4*nfull)
+        end if
+    end subroutine philox_normal
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Internal helpers
+    !------------------------------------------------------------
+    ! 32x32 -> 64-bit unsigned product split into high and low words, without
+    ! overflowing a signed 64-bit integer
+    elemental subroutine mulhilo32(a, b, hi, lo)
+        integer(px_i8), intent(in)  :: a, b
+        integer(px_i8), intent(out) :: hi, lo
+        integer(px_i8) :: plo, phi, t
+
+        plo = a*iand(b, 65535_px_i8)            ! < 2**48
+        phi = a*ishft(b, -16)                   ! < 2**48
+        t = plo + ishft(iand(phi, 65535_px_i8), 16)
+        lo = iand(t, px_mask32)
+        hi = ishft(phi, -16) + ishft(t, -32)
+    end subroutine mulhilo32
+    !---------------------------------------------------------------------------
+
+end module philox
@@ -18,19 +18,22 @@ contains
     ! exchange_flux : set internal BCs from field variables
     !------------------------------------------------------------
     subroutine exchange_flux(Q_r)
-        integer ieq, i, j, k, ipnt
+        integer ieq, i, j, k
         real, dimension(nx,ny,nz,nQ,nbasis), intent(in) :: Q_r
 
         !#########################################################
         ! Step 1: Get fluxes at the boundaries of this MPI domain
+        !   -- traces via the tangential sums (see face_trace)
         !---------------------------------------------------------
         do ieq = 1,nQ
         do k = 1,nz
         do j = 1,ny
-            do ipnt=1,nface
-                Qxlo_int(j,k,ipnt,ieq) = sum( bfvals_xm(ipnt,1:nbasis)*Q_r(1,j,k,ieq,1:nbasis)  )
-                Qxhi_int(j,k,ipnt,ieq) = sum( bfvals_xp(ipnt,1:nbasis)*Q_r(nx,j,k,ieq,1:nbasis) )
-            end do
+            if (nx == 1) then
+                call face_trace_pair(Q_r(1,j,k,ieq,1:nbasis), 1, Qxhi_int(j,k,1:nface,ieq), Qxlo_int(j,k,1:nface,ieq))
+            else
+                call face_trace(Q_r(1,j,k,ieq,1:nbasis),  1, -1., Qxlo_int(j,k,1:nface,ieq))
+                call face_trace(Q_r(nx,j,k,ieq,1:nbasis), 1,  1., Qxhi_int(j,k,1:nface,ieq))
+            end if
         end do
         end do
         end do
@@ -38,10 +41,12 @@ contains
         do ieq = 1,nQ
         do k = 1,nz
         do i = 1,nx
-            do ipnt=1,nface
-                Qylo_int(i,k,ipnt,ieq) = sum( bfvals_ym(ipnt,1:nbasis)*Q_r(i,1,k,ieq,1:nbasis)  )
-                Qyhi_int(i,k,ipnt,ieq) = sum( bfvals_yp(ipnt,1:nbasis)*Q_r(i,ny,k,ieq,1:nbasis) )
-            end do
+            if (ny == 1) then
+                call face_trace_pair(Q_r(i,1,k,ieq,1:nbasis), 2, Qyhi_int(i,k,1:nface,ieq), Qylo_int(i,k,1:nface,ieq))
+            else
+                call face_trace(Q_r(i,1,k,ieq,1:nbasis),  2, -1., Qylo_int(i,k,1:nface,ieq))
+                call face_trace(Q_r(i,ny,k,ieq,1:nbasis), 2,  1., Qyhi_int(i,k,1:nface,ieq))
+            end if
         end do
         end do
         end do
@@ -49,10 +54,12 @@ contains
         do ieq = 1,nQ
         do j = 1,ny
         do i = 1,nx
-            do ipnt=1,nface
-                Qzlo_int(i,j,ipnt,ieq) = sum( bfvals_zm(ipnt,1:nbasis)*Q_r(i,j,1,ieq,1:nbasis)  )
-                Qzhi_int(i,j,ipnt,ieq) = sum( bfvals_zp(ipnt,1:nbasis)*Q_r(i,j,nz,ieq,1:nbasis) )
-            end do
+            if (nz == 1) then
+                call face_trace_pair(Q_r(i,j,1,ieq,1:nbasis), 3, Qzhi_int(i,j,1:nface,ieq), Qzlo_int(i,j,1:nface,ieq))
+            else
+                call face_trace(Q_r(i,j,1,ieq,1:nbasis),  3, -1., Qzlo_int(i,j,1:nface,ieq))
+                call face_trace(Q_r(i,j,nz,ieq,1:nbasis), 3,  1., Qzhi_int(i,j,1:nface,ieq))
+            end if
         end do
         end do
         end do
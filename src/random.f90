@@ -1,182 +1,201 @@
 !***** RANDOM.F90 ************************************************************************
+!   Gaussian random numbers for the fluctuating hydrodynamics (llns) terms.
+!
+!   Numbers come from the counter-based Philox4x32-10 generator (philox.f90)
+!   with key (seed, 0) and counter
+!       (block, global id, stage, tag + 16*(global id / 2**32))
+!   where "global id" is the global index of the cell or face the numbers
+!   belong to, "stage" counts the Euler stages taken since random_init and
+!   "tag" tells apart faces normal to x/y/z and interior points.
+!
+!   The noise is thus the same for any MPI decomposition or call order, and
+!   no external library (previously MKL VSL) is needed.
+!*******************************************************************************
 module random
 
-use MKL_VSL_TYPE
-use MKL_VSL
-
 use params
+use philox
 ! use helpers
 ! use boundary
 
 !===========================================================================
-! MKL VSL parameters
+! Generator state: the key and the stage part of the counter
 !------------------------------------------------------------
-real :: vsl_errcode
-TYPE (VSL_STREAM_STATE) :: vsl_stream
+integer(px_i8) :: rng_seed  = 0
+integer(px_i8) :: rng_stage = 0
 
-integer, parameter :: vsl_brng   = VSL_BRNG_MCG31
-integer, parameter :: vsl_method = VSL_RNG_METHOD_GAUSSIAN_BOXMULLER
-real, parameter :: vsl_mean  = 0.0
-real, parameter :: vsl_sigma = 1.0
+! Tags for the point sets that get independent noise
+integer, parameter :: rng_xface = 1, rng_yface = 2, rng_zface = 3, rng_inner = 4
 !===========================================================================
 
 
-! NOTE: It might make sense to use global arrays for stochastic
-!   stuff at some point, especially if in separate module
-! real GRM_x(nface, 1:nx+1, ny,     nz,     3,3)
-! real GRM_y(nface, nx,     1:ny+1, nz,     3,3)
-! real GRM_z(nface, nx,     ny,     1:nz+1, 3,3)
-! real Sflux_x(nface, 1:nx+1, ny,     nz,     3,3)
-! real Sflux_y(nface, nx,     1:ny+1, nz,     3,3)
-! real Sflux_z(nface, nx,     ny,     1:nz+1, 3,3)
+!===========================================================================
+! Random stresses and heat fluxes for the current stage (llns only), filled
+! by random_forcing for all face and interior quadrature points:
+!   R(1:6) = (Sxx,Syy,Szz,Sxy,Sxz,Syz),  R(7:9) = (Qx,Qy,Qz)
+!------------------------------------------------------------
+integer, parameter :: nrnd = 9
+real, allocatable, dimension(:,:,:,:,:) :: Rflux_x  ! (nrnd,nfe,nx+1,ny,nz)
+real, allocatable, dimension(:,:,:,:,:) :: Rflux_y  ! (nrnd,nfe,nx,ny+1,nz)
+real, allocatable, dimension(:,:,:,:,:) :: Rflux_z  ! (nrnd,nfe,nx,ny,nz+1)
+real, allocatable, dimension(:,:,:,:,:) :: Rinner   ! (nrnd,npg,nx,ny,nz)
+!===========================================================================
 
 contains
 
 !-------------------------------------------------------------------------------
     subroutine random_init(seed)
         integer, intent(in) :: seed
-        vsl_errcode = vslnewstream(vsl_stream, vsl_brng, seed)
+        rng_seed  = iand(int(seed,px_i8), px_mask32)
+        rng_stage = 0
     end subroutine random_init
 !-------------------------------------------------------------------------------
 
 
 !-------------------------------------------------------------------------------
     subroutine random_cleanup()
-        vsl_errcode = vsldeletestream( vsl_stream )
+        ! Nothing to release: the generator has no stream state
     end subroutine random_cleanup
 !-------------------------------------------------------------------------------
 
 
 !-------------------------------------------------------------------------------
-    subroutine get_GRM(GRMpnts_r, npnts)
-
-        implicit none
-        integer ife,npnts,b,e,vsl_ndim
-        real, dimension(npnts,3,3) :: GRMpnts_r
-        real, allocatable :: grn(:)
-
-        vsl_ndim = npnts*3*3
-        allocate(grn(vsl_ndim))
-
-        vsl_errcode = vsRngGaussian(vsl_method, vsl_stream, vsl_ndim, grn, vsl_mean, vsl_sigma)
-
-        ! NOTE: There's probably a better way to do a reshape (w/o using Fortran 2003/8)
-        do ife = 1,npnts
-            e = 9*ife
-            b = e - 8
-            GRMpnts_r(ife,1,:) = grn(b:b+2)
-            GRMpnts_r(ife,2,:) = grn(b+3:b+5)
-            GRMpnts_r(ife,3,:) = grn(b+6:e)
-        end do
-
-    end subroutine get_GRM
+    subroutine random_next_stage()
+        ! Called once per Euler stage (via random_forcing) so every stage
+        ! draws fresh numbers
+        rng_stage = rng_stage + 1
+    end subroutine random_next_stage
 !-------------------------------------------------------------------------------
 
 
 !-------------------------------------------------------------------------------
-    subroutine get_GRM_symmetric(GRMpnts_r, npnts)
+    integer(px_i8) function global_id(i, j, k)
+        ! Global index of local cell (i,j,k); i, j or k may be nx+1, ny+1 or
+        ! nz+1 to index the upper face of the last cell. On a periodic axis
+        ! that face is the lower face of the first cell, and gets its index.
+        integer, intent(in) :: i, j, k
+        integer(px_i8) :: ig, jg, kg, nxg, nyg
+
+        ig = i + (mpi_P-1)*nx
+        jg = j + (mpi_Q-1)*ny
+        kg = k + (mpi_R-1)*nz
+        if (xhibc == 'periodic') ig = modulo(ig-1, int(nx*mpi_nx, px_i8)) + 1
+        if (yhibc == 'periodic') jg = modulo(jg-1, int(ny*mpi_ny, px_i8)) + 1
+        if (zhibc == 'periodic') kg = modulo(kg-1, int(nz*mpi_nz, px_i8)) + 1
+        nxg = nx*mpi_nx + 1
+        nyg = ny*mpi_ny + 1
+        global_id = (ig-1) + nxg*((jg-1) + nyg*(kg-1))
+    end function global_id
+!-------------------------------------------------------------------------------
 
-        implicit none
-        integer ife,npnts,b,e,vsl_ndim
-        real, dimension(npnts,3,3) :: GRMpnts_r
-        real, allocatable :: grn(:)
-
-        vsl_ndim = npnts*6
-        allocate(grn(vsl_ndim))
-
-        vsl_errcode = vsRngGaussian(vsl_method, vsl_stream, vsl_ndim, grn, vsl_mean, vsl_sigma)
-
-        ! NOTE: There's probably a better way to do a reshape (w/o using Fortran 2003/8)
-        do ife = 1,npnts
-            e = 6*ife
-            b = e - 5
-            GRMpnts_r(ife,1,1:3) = grn(b:b+2)
-            GRMpnts_r(ife,2,2:3) = grn(b+3:b+4)
-            GRMpnts_r(ife,3,3)   = grn(e)
-
-            GRMpnts_r(ife,2,1)   = GRMpnts_r(ife,1,2)
-            GRMpnts_r(ife,3,1)   = GRMpnts_r(ife,1,3)
-            GRMpnts_r(ife,3,2)   = GRMpnts_r(ife,2,3)
-        end do
 
-    end subroutine get_GRM_symmetric
 !-------------------------------------------------------------------------------
-
+    subroutine random_normal(tag, gid, n, grn)
+        ! n standard normal deviates for point set (tag, gid) at this stage
+        integer, intent(in) :: tag, n
+        integer(px_i8), intent(in) :: gid
+        real, intent(out) :: grn(n)
+
+        call philox_normal(iand(gid, px_mask32), rng_stage,                     &
+                           tag + 16*ishft(gid, -32), rng_seed, 0_px_i8, n, grn)
+    end subroutine random_normal
 !-------------------------------------------------------------------------------
-    subroutine random_stresses_pnts_r(Spnts_r, npnts)
-
-        implicit none
-        integer ife,npnts
-        real, dimension(npnts,3,3) :: GRMpnts_r, Spnts_r
-        real Gxx,Gyy,Gzz,Gxy,Gxz,Gyz
-        real eta_d,zeta_d
-        real trG,trGd3,trG_zeta
-
-        eta_d = eta_sd * sqrt_dVdt_i
-        zeta_d = zeta_sd * sqrt_dVdt_i
-        call get_GRM(GRMpnts_r, npnts)
 
-        ! NOTE: There's probably a better way to do a reshape (w/o using Fortran 2003/8)
-        do ife = 1,npnts
-            Gxx = GRMpnts_r(ife,1,1)
-            Gyy = GRMpnts_r(ife,2,2)
-            Gzz = GRMpnts_r(ife,3,3)
 
-            Gxy = sqrt2i*( GRMpnts_r(ife,1,2) + GRMpnts_r(ife,2,1) )
-            Gxz = sqrt2i*( GRMpnts_r(ife,1,3) + GRMpnts_r(ife,3,1) )
-            Gyz = sqrt2i*( GRMpnts_r(ife,2,3) + GRMpnts_r(ife,3,2) )
+!-------------------------------------------------------------------------------
+    subroutine random_forcing()
+        ! Start a new stage and, with llns, generate the random stresses and
+        ! heat fluxes at every face and interior quadrature point in bulk.
+        ! Both traces of a face point share its noise, so the stochastic flux
+        ! is single-valued (across periodic boundaries too, see global_id).
+        integer i,j,k
+
+        call random_next_stage()
+        if (.not. llns) return
+
+        if (.not. allocated(Rflux_x)) then
+            allocate(Rflux_x(nrnd,nfe,nx+1,ny,nz), Rflux_y(nrnd,nfe,nx,ny+1,nz))
+            allocate(Rflux_z(nrnd,nfe,nx,ny,nz+1), Rinner(nrnd,npg,nx,ny,nz))
+        end if
+
+        do k = 1,nz
+        do j = 1,ny
+        do i = 1,nx+1
+            call random_stress_pnts(rng_xface, global_id(i,j,k), nface, Rflux_x(:,1:nface,i,j,k))
+            Rflux_x(:,nface+1:nfe,i,j,k) = Rflux_x(:,1:nface,i,j,k)
+        end do
+        end do
+        end do
 
-            Spnts_r(ife,1,2) = eta_sd*Gxy
-            Spnts_r(ife,1,3) = eta_sd*Gxz
-            Spnts_r(ife,2,3) = eta_sd*Gyz
-            Spnts_r(ife,2,1) = Spnts_r(ife,1,2)
-            Spnts_r(ife,3,1) = Spnts_r(ife,1,3)
-            Spnts_r(ife,3,2) = Spnts_r(ife,2,3)
+        do k = 1,nz
+        do j = 1,ny+1
+        do i = 1,nx
+            call random_stress_pnts(rng_yface, global_id(i,j,k), nface, Rflux_y(:,1:nface,i,j,k))
+            Rflux_y(:,nface+1:nfe,i,j,k) = Rflux_y(:,1:nface,i,j,k)
+        end do
+        end do
+        end do
 
-            trG = (Gxx + Gyy + Gzz)
-            trGd3 = trG/3.0
-            trG_zeta = zeta_sd*trG
+        do k = 1,nz+1
+        do j = 1,ny
+        do i = 1,nx
+            call random_stress_pnts(rng_zface, global_id(i,j,k), nface, Rflux_z(:,1:nface,i,j,k))
+            Rflux_z(:,nface+1:nfe,i,j,k) = Rflux_z(:,1:nface,i,j,k)
+        end do
+        end do
+        end do
 
-            Spnts_r(ife,1,1) = eta_sd*(Gxx - trGd3) + trG_zeta
-            Spnts_r(ife,2,2) = eta_sd*(Gyy - trGd3) + trG_zeta
-            Spnts_r(ife,3,3) = eta_sd*(Gzz - trGd3) + trG_zeta
+        do k = 1,nz
+        do j = 1,ny
+        do i = 1,nx
+            call random_stress_pnts(rng_inner, global_id(i,j,k), npg, Rinner(:,:,i,j,k))
+        end do
+        end do
         end do
 
-    end subroutine random_stresses_pnts_r
+    end subroutine random_forcing
 !-------------------------------------------------------------------------------
 
-!-------------------------------------------------------------------------------
-    subroutine random_heatflux_pnts_r(Hpnts_r, npnts)
 
+!-------------------------------------------------------------------------------
+    subroutine random_stress_pnts(tag, gid, npnts, Rpnts_r)
+        ! Random stress tensor (from a 3x3 Gaussian matrix G) and heat flux
+        ! at npnts points:  Rpnts_r = (Sxx,Syy,Szz,Sxy,Sxz,Syz,Qx,Qy,Qz)
         implicit none
-        integer ife,npnts,b,e,vsl_ndim
-        real, dimension(npnts,3) :: GRVpnts_r, Hpnts_r
-        real Gx,Gy,Gz,kappa_d
-        real, allocatable :: grn(:)
+        integer tag,npnts,ipnt
+        integer(px_i8) gid
+        real, dimension(nrnd,npnts) :: Rpnts_r
+        real grn(12,npnts)
+        real Gxx,Gyy,Gzz,Gxy,Gxz,Gyz
+        real trG,trGd3,trG_zeta
 
-        vsl_ndim = npnts*3
-        allocate(grn(vsl_ndim))
+        call random_normal(tag, gid, 12*npnts, grn)
 
-        kappa_d = kappa_sd * sqrt_dVdt_i
+        do ipnt = 1,npnts
+            ! grn(1:9) is G stored row by row, grn(10:12) the heat-flux noise
+            Gxx = grn(1,ipnt)
+            Gyy = grn(5,ipnt)
+            Gzz = grn(9,ipnt)
 
-        vsl_errcode = vsRngGaussian(vsl_method, vsl_stream, vsl_ndim, grn, vsl_mean, vsl_sigma)
+            Gxy = sqrt2i*( grn(2,ipnt) + grn(4,ipnt) )
+            Gxz = sqrt2i*( grn(3,ipnt) + grn(7,ipnt) )
+            Gyz = sqrt2i*( grn(6,ipnt) + grn(8,ipnt) )
 
-        ! NOTE: There's probably a better way to do a reshape (w/o using Fortran 2003/8)
-        do ife = 1,npnts
-            e = 3*ife
-            b = e - 2
-            GRVpnts_r(ife,1:3) = grn(b:e)
+            trG = (Gxx + Gyy + Gzz)
+            trGd3 = trG/3.0
+            trG_zeta = zeta_sd*trG
 
-            Gx = GRVpnts_r(ife,1)
-            Gy = GRVpnts_r(ife,2)
-            Gz = GRVpnts_r(ife,3)
+            Rpnts_r(1,ipnt) = eta_sd*(Gxx - trGd3) + trG_zeta
+            Rpnts_r(2,ipnt) = eta_sd*(Gyy - trGd3) + trG_zeta
+            Rpnts_r(3,ipnt) = eta_sd*(Gzz - trGd3) + trG_zeta
+            Rpnts_r(4,ipnt) = eta_sd*Gxy
+            Rpnts_r(5,ipnt) = eta_sd*Gxz
+            Rpnts_r(6,ipnt) = eta_sd*Gyz
 
-            Hpnts_r(ife,1) = kappa_sd*Gx
-            Hpnts_r(ife,2) = kappa_sd*Gy
-            Hpnts_r(ife,3) = kappa_sd*Gz
+            Rpnts_r(7:9,ipnt) = kappa_sd*grn(10:12,ipnt)
         end do
 
-    end subroutine random_heatflux_pnts_r
+    end subroutine random_stress_pnts
 !-------------------------------------------------------------------------------
 
 
@@ -0,0 +1,183 @@
+"""Streaming Python interface to the f90wrap'd HERMESHD solver.
+
+Wraps the setup/step/generate_output/cleanup calling sequence used by the
+Python drivers in a ``Simulation`` object whose ``run`` method is a generator:
+
+    sim = Simulation(nx=50)
+    for snap in sim.run(until=7.0e-4, every=10):
+        rho = snap.Q[:, :, :, 0, 0]     # cell averages of density (no copy)
+    sim.cleanup()
+
+Each yielded ``Snapshot`` holds a read-only *view* of the solution array that
+the Fortran code updates in place, so it costs nothing to produce but is only
+valid until the generator is resumed. Call ``snap.copy()`` to keep one.
+
+MPI, the grid and the basis tables are initialized once per process, so any
+number of runs can share them (e.g. a parameter sweep):
+
+    sim = Simulation(nx=50)
+    for ic in (3, 4):
+        for snap in sim.run(until=7.0e-4, ic=ic):
+            pass
+        sim.finish()
+    shutdown()
+"""
+import numpy as np
+from mpi4py import MPI
+
+import hermeshd
+
+
+class Snapshot(object):
+    """State of the simulation after ``step`` time steps.
+
+    Q    : read-only view of the (nx,ny,nz,nQ,nbasis) basis coefficients
+    t    : simulation time
+    dt   : last time step
+    step : number of time steps taken
+    nout : number of output events so far
+    """
+    __slots__ = ('Q', 't', 'dt', 'step', 'nout')
+
+    def __init__(self, Q, t, dt, step, nout):
+        self.Q = Q
+        self.t = t
+        self.dt = dt
+        self.step = step
+        self.nout = nout
+
+    def copy(self):
+        """Return a snapshot that owns its data (survives further steps)."""
+        return Snapshot(np.array(self.Q, order='F', copy=True),
+                        self.t, self.dt, self.step, self.nout)
+
+    def cell_average(self, ieq):
+        """View of the cell averages (constant mode) of variable ieq."""
+        return self.Q[:, :, :, ieq, 0]
+
+
+class Simulation(object):
+    """A HERMESHD run driven from Python.
+
+    The grid dimensions must match those compiled into input.f90. When
+    ``output`` is True, the usual VTK/HDF5/checkpoint output is generated at
+    the ``ntout`` output times, exactly as in the Fortran main program;
+    otherwise nothing is written (not even the initial output).
+    """
+
+    def __init__(self, nx, ny=1, nz=1, nQ=11, nbasis=8, comm=None, output=True):
+        self.comm = MPI.COMM_WORLD if comm is None else comm
+        self.output = output
+
+        shape = (nx, ny, nz, nQ, nbasis)
+        self._Q  = np.empty(shape, order='F', dtype=np.float32)
+        self._Q1 = np.empty(shape, order='F', dtype=np.float32)
+        self._Q2 = np.empty(shape, order='F', dtype=np.float32)
+
+        # 0-d arrays so that the Fortran routines can update them in place
+        self._t       = np.array(0.0, dtype=float)
+        self._dt      = np.array(0.0, dtype=float)
+        self._t1      = np.array(0.0, dtype=float)
+        self._t_start = np.array(0.0, dtype=float)
+        self._dtout   = np.array(0.0, dtype=float)
+        self._nout    = np.array(0,   dtype=int)
+
+        self.step = 0
+        self._is_setup = False
+
+        self._Qview = self._Q.view()
+        self._Qview.flags.writeable = False
+
+    @property
+    def t(self):
+        return float(self._t)
+
+    @property
+    def dt(self):
+        return float(self._dt)
+
+    @property
+    def nout(self):
+        return int(self._nout)
+
+    def snapshot(self):
+        """Current state as a zero-copy Snapshot."""
+        return Snapshot(self._Qview, self.t, self.dt, self.step, self.nout)
+
+    def setup(self, ic=-1):
+        """Start a run from initial condition ``ic`` (-1: icid in input.f90).
+
+        The one-time initialization is done on the first call only; later
+        calls just reset the state and write the initial output.
+        """
+        hermeshd.hermeshd.init(self.comm.py2f())
+        hermeshd.hermeshd.set_output(1 if self.output else 0)
+        hermeshd.hermeshd.reset(self._Q, self._t, self._dt, self._t1,
+                                self._t_start, self._dtout, self._nout, ic)
+        self.step = 0
+        self._is_setup = True
+
+    def set_boundaries(self, xlo, xhi, ylo, yhi, zlo, zhi):
+        """Change the boundary conditions of the current run.
+
+        Periodicity is fixed at initialization and cannot be changed.
+        """
+        hermeshd.hermeshd.set_boundaries(xlo, xhi, ylo, yhi, zlo, zhi)
+
+    def reseed(self, seed):
+        """Restart the random number streams (llns noise) from ``seed``.
+
+        Call before ``setup``/``run(ic=...)`` so that random initial
+        conditions are covered by the new seed too.
+        """
+        hermeshd.hermeshd.init(self.comm.py2f())
+        hermeshd.hermeshd.reseed(seed)
+
+    def advance(self):
+        """Take one time step (and generate output if it is due)."""
+        hermeshd.hermeshd.step(self._Q, self._Q1, self._Q2, self._t, self._dt)
+        self.step += 1
+        if self.output:
+            hermeshd.hermeshd.generate_output(self._Q, self._t, self._dt,
+                                              self._t1, self._dtout, self._nout)
+
+    def run(self, until, every=1, ic=None):
+        """Advance to time ``until``, yielding a Snapshot every ``every`` steps.
+
+        The initial state is yielded first when a new run starts, and the
+        final state is always yielded, whether or not it falls on the cadence.
+        Calling run again with a later ``until`` continues the same run,
+        unless ``ic`` is given, which starts a new one from that initial
+        condition.
+        """
+        if every < 1:
+            raise ValueError('every must be a positive number of steps')
+
+        if ic is not None or not self._is_setup:
+            self.setup(-1 if ic is None else ic)
+            yield self.snapshot()
+
+        last = self.step
+        while self.t < until:
+            self.advance()
+            if self.step % every == 0:
+                last = self.step
+                yield self.snapshot()
+
+        if last != self.step:
+            yield self.snapshot()
+
+    def finish(self):
+        """End the current run and report its wall time (MPI stays up)."""
+        hermeshd.hermeshd.finish(self._t_start)
+        self._is_setup = False
+
+    def cleanup(self):
+        """End the current run and shut down the solver (finalizes MPI)."""
+        self.finish()
+        shutdown()
+
+
+def shutdown():
+    """Finalize the solver once no more runs are needed in this process."""
+    hermeshd.hermeshd.shutdown()
@@ -1,7 +1,7 @@
 from mpi4py import MPI
 import numpy as np
 
-import hermeshd
+from simulation import Simulation
 # import hermes
 
 ###########################################
@@ -31,54 +31,20 @@ size = comm.Get_size()
 # if rank == 0: print "After:   a = {}  b = {}  c = {}".format(a,b,c)
 
 
-# Get the communicator for Fortran
-fcomm = MPI.COMM_WORLD.py2f()
-
-# Alias the Fortran subroutines
-main = hermeshd.hermeshd.main
-setup = hermeshd.hermeshd.setup
-step = hermeshd.hermeshd.step
-generate_output = hermeshd.hermeshd.generate_output
-cleanup = hermeshd.hermeshd.cleanup
-
 # Instantiate some global parameters
 nx, ny, nz = 50, 1, 1
-nQ, nB = 11, 8
-
-# Field arrays
-Qio = np.empty((nx, ny, nz, nQ, nB), order='F', dtype=np.float32)
-Q1  = np.empty((nx, ny, nz, nQ, nB), order='F', dtype=np.float32)
-Q2  = np.empty((nx, ny, nz, nQ, nB), order='F', dtype=np.float32)
-
-# Time variables
-t  = np.array(0.0,    dtype=float)  # works w/ np.float32 and None
-tf = np.array(7.0e-4, dtype=float)
-dt = np.array(0.0,    dtype=float)
-
-# Timing and output variables
-t1      = np.array(0.0, dtype=float)
-t_start = np.array(0.0, dtype=float)
-dtout   = np.array(0.0, dtype=float)
-nout    = np.array(0,   dtype=int)  # works w/ np.int32 and None
-
-
-##############################
-# I. SETUP
-#-----------------------------
-setup(Qio, t, dt, t1, t_start, dtout, nout, fcomm)
+tf = 7.0e-4
 
-# if rank == 0: print "t = {}   dt = {}   nout = {}".format(t, dt, nout)
-# print np.ascontiguousarray(Qio)
+sim = Simulation(nx, ny, nz, comm=comm)
 
 ##############################
-# I. SIMULATION
+# I. SETUP  and  II. SIMULATION
 #-----------------------------
-while ( t < tf ):
-    step(Qio, Q1, Q2, t, dt)
-    generate_output(Qio, t, dt, t1, dtout, nout)
-    # if rank == 0: print "t = {}   dt = {}   nout = {}".format(t, dt, nout)
+for snap in sim.run(until=tf, every=1):
+    pass
+    # if rank == 0: print "t = {}   dt = {}   nout = {}".format(snap.t, snap.dt, snap.nout)
 
 ##############################
-# I. CLEANUP
+# III. CLEANUP
 #-----------------------------
-cleanup(t_start)
+sim.cleanup()
@@ -0,0 +1,80 @@
+"""Raw appended-binary VTK RectilinearGrid (.vtr) writer for NumPy arrays.
+
+Produces the same file layout as the Fortran ``vtr_io`` module: an XML header
+with precomputed byte offsets followed by an <AppendedData encoding="raw">
+block, where every array is an 8-byte (UInt64) byte count plus the data
+written with a single ``tofile`` call. No base64 encoding is involved.
+"""
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _byte_order():
+    return 'LittleEndian' if sys.byteorder == 'little' else 'BigEndian'
+
+
+def _as_block(a):
+    """Return a contiguous float32 array in VTK ordering (x fastest).
+
+    Scalars have shape (nx, ny, nz); vectors have shape (nx, ny, nz, ncomp),
+    and their components are interleaved per cell.
+    """
+    a = np.asarray(a, dtype=np.float32)
+    if a.ndim == 3:
+        return np.ravel(a, order='F'), 1
+    if a.ndim == 4:
+        ncomp = a.shape[3]
+        return np.ascontiguousarray(a.transpose(2, 1, 0, 3)).ravel(), ncomp
+    raise ValueError('field must have shape (nx,ny,nz) or (nx,ny,nz,ncomp)')
+
+
+def write_vtr(filename, x, y, z, cell_data, extent=None, whole_extent=None):
+    """Write a .vtr file with cell data in raw appended binary form.
+
+    x, y, z      : cell-edge coordinates (lengths nx+1, ny+1, nz+1)
+    cell_data    : mapping of name -> array of shape (nx,ny,nz) or (nx,ny,nz,3)
+    extent       : piece extent (x1,x2,y1,y2,z1,z2); defaults to the full grid
+    whole_extent : extent of the full dataset when this file is one piece
+    """
+    coords = [np.asarray(c, dtype=np.float32).ravel() for c in (x, y, z)]
+    if extent is None:
+        extent = (1, coords[0].size, 1, coords[1].size, 1, coords[2].size)
+    if whole_extent is None:
+        whole_extent = extent
+
+    blocks = OrderedDict()
+    for name, a in cell_data.items():
+        blocks[name] = _as_block(a)
+
+    tag = ('        <DataArray type="Float32" Name="{}" NumberOfComponents="{}" '
+           'format="appended" offset="{}"/>\n')
+    ext = lambda e: ' '.join(str(int(v)) for v in e)
+
+    lines = ['<?xml version="1.0"?>\n',
+             '<VTKFile type="RectilinearGrid" version="1.0" byte_order="{}" header_type="UInt64">\n'.format(_byte_order()),
+             '  <RectilinearGrid WholeExtent="{}">\n'.format(ext(whole_extent)),
+             '    <Piece Extent="{}">\n'.format(ext(extent)),
+             '      <Coordinates>\n']
+    offset = 0
+    for name, c in zip('XYZ', coords):
+        lines.append(tag.format(name, 1, offset))
+        offset += 8 + c.nbytes
+    lines.append('      </Coordinates>\n')
+    lines.append('      <CellData>\n')
+    for name, (data, ncomp) in blocks.items():
+        lines.append(tag.format(name, ncomp, offset))
+        offset += 8 + data.nbytes
+    lines += ['      </CellData>\n',
+              '    </Piece>\n',
+              '  </RectilinearGrid>\n',
+              '  <AppendedData encoding="raw">\n_']
+
+    arrays = coords + [data for data, _ in blocks.values()]
+    with open(filename, 'wb') as f:
+        f.write(''.join(lines).encode('ascii'))
+        for a in arrays:
+            np.array(a.nbytes, dtype=np.uint64).tofile(f)
+            a.tofile(f)
+        f.write(b'\n  </AppendedData>\n</VTKFile>\n')
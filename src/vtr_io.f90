@@ -0,0 +1,278 @@
+!****** VTR_IO.F90 ***********************************************************************
+!   Writer for VTK XML RectilinearGrid files (.vtr) using raw appended binary data.
+!
+!   The XML header (including the byte offset of every data array) is written
+!   up front, and each data array is then written into the <AppendedData> block
+!   with one unformatted stream write: an 8-byte byte count (header_type UInt64,
+!   so pieces above 2 GiB keep valid offsets) followed by the data.
+!   There is no base64 encoding and no scratch file, unlike LIB_VTK_IO's
+!   'BINARY' path. The files load directly in ParaView/VisIt.
+!
+!   Calling sequence (the fields must be written in the order they are declared):
+!       call vtr_open(filename, ext, x, y, z, names, ncomps)
+!       call vtr_write_scalar(var)  /  call vtr_write_vector(vx, vy, vz)
+!       ...
+!       call vtr_close()
+!
+!   For MPI runs, vtr_write_pvtr writes the parallel (.pvtr) master file that
+!   stitches the per-rank pieces into one dataset, and vtr_write_pvd maintains
+!   a .pvd time-series index of those master files.
+!
+!   Like helpers, this module should NOT depend on problem-specific globals.
+!*******************************************************************************
+module vtr_io
+
+    implicit none
+
+    integer, parameter :: vtr_r4 = selected_real_kind(6,37)  ! Float32 data
+    integer, parameter :: vtr_i4 = selected_int_kind(9)
+    integer, parameter :: vtr_i8 = selected_int_kind(18)     ! UInt64 block headers, offsets
+
+    character(1), parameter :: lf = achar(10)
+
+    integer :: vtr_unit = -1
+    integer :: vtr_ncell, vtr_nfield, vtr_ifield
+
+contains
+
+    !===========================================================================
+    ! Open a .vtr file and write the XML header and the grid coordinates.
+    !   ext(6)    : piece extent (x1,x2,y1,y2,z1,z2) in point indices
+    !   x, y, z   : cell-edge coordinates (size x2-x1+1, etc.)
+    !   names(:)  : names of the cell data arrays, in the order they'll be written
+    !   ncomps(:) : number of components of each array (1 for scalar, 3 for vector)
+    !   whole_ext : (optional) extent of the full grid if this file is one piece
+    !------------------------------------------------------------
+    subroutine vtr_open(filename, ext, x, y, z, names, ncomps, whole_ext)
+        character(*), intent(in) :: filename
+        integer, intent(in) :: ext(6)
+        real(vtr_r4), intent(in) :: x(:), y(:), z(:)
+        character(*), intent(in) :: names(:)
+        integer, intent(in) :: ncomps(:)
+        integer, intent(in), optional :: whole_ext(6)
+
+        integer :: wext(6), ifld
+        integer(vtr_i8) :: offset
+        character(len=128) :: sext, swext
+
+        wext = ext
+        if (present(whole_ext)) wext = whole_ext
+
+        vtr_ncell  = max(ext(2)-ext(1),1) * max(ext(4)-ext(3),1) * max(ext(6)-ext(5),1)
+        vtr_nfield = size(names)
+        vtr_ifield = 0
+
+        write(sext, '(6(i0,1x))') ext
+        write(swext,'(6(i0,1x))') wext
+
+        open(newunit=vtr_unit, file=trim(adjustl(filename)), access='stream',   &
+             form='unformatted', status='replace', action='write')
+
+        write(vtr_unit) '<?xml version="1.0"?>'//lf
+        write(vtr_unit) '<VTKFile type="RectilinearGrid" version="1.0" byte_order="'// &
+                        trim(byte_order())//'" header_type="UInt64">'//lf
+        write(vtr_unit) '  <RectilinearGrid WholeExtent="'//trim(swext)//'">'//lf
+        write(vtr_unit) '    <Piece Extent="'//trim(sext)//'">'//lf
+
+        offset = 0
+        write(vtr_unit) '      <Coordinates>'//lf
+        call write_array_tag('X', 1, offset)
+        offset = offset + 8 + 4*size(x)
+        call write_array_tag('Y', 1, offset)
+        offset = offset + 8 + 4*size(y)
+        call write_array_tag('Z', 1, offset)
+        offset = offset + 8 + 4*size(z)
+        write(vtr_unit) '      </Coordinates>'//lf
+
+        write(vtr_unit) '      <CellData>'//lf
+        do ifld = 1,vtr_nfield
+            call write_array_tag(trim(names(ifld)), ncomps(ifld), offset)
+            offset = offset + 8 + 4_vtr_i8*ncomps(ifld)*vtr_ncell
+        end do
+        write(vtr_unit) '      </CellData>'//lf
+
+        write(vtr_unit) '    </Piece>'//lf
+        write(vtr_unit) '  </RectilinearGrid>'//lf
+        write(vtr_unit) '  <AppendedData encoding="raw">'//lf//'_'
+
+        call write_block(x)
+        call write_block(y)
+        call write_block(z)
+
+    end subroutine vtr_open
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Write the next declared scalar cell data array (x index varies fastest)
+    !------------------------------------------------------------
+    subroutine vtr_write_scalar(var)
+        real(vtr_r4), intent(in) :: var(:)
+        vtr_ifield = vtr_ifield + 1
+        call write_block(var)
+    end subroutine vtr_write_scalar
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Write the next declared vector cell data array (components interleaved)
+    !------------------------------------------------------------
+    subroutine vtr_write_vector(varx, vary, varz)
+        real(vtr_r4), intent(in) :: varx(:), vary(:), varz(:)
+        real(vtr_r4), allocatable :: buf(:,:)
+
+        allocate(buf(3,size(varx)))
+        buf(1,:) = varx
+        buf(2,:) = vary
+        buf(3,:) = varz
+
+        vtr_ifield = vtr_ifield + 1
+        write(vtr_unit) 4_vtr_i8*size(buf), buf
+        deallocate(buf)
+    end subroutine vtr_write_vector
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Close the appended data block and the file
+    !------------------------------------------------------------
+    subroutine vtr_close()
+        if (vtr_ifield /= vtr_nfield) then
+            print *,'vtr_close: wrote', vtr_ifield, 'of', vtr_nfield, 'declared fields'
+        end if
+        write(vtr_unit) lf//'  </AppendedData>'//lf
+        write(vtr_unit) '</VTKFile>'//lf
+        close(vtr_unit)
+        vtr_unit = -1
+    end subroutine vtr_close
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Write a parallel RectilinearGrid master file (.pvtr) for a set of pieces.
+    !   whole_ext      : extent of the full grid
+    !   names, ncomps  : cell data arrays, as passed to vtr_open for each piece
+    !   piece_ext(6,:) : extent of each piece
+    !   sources(:)     : file name of each piece, relative to the .pvtr file
+    !------------------------------------------------------------
+    subroutine vtr_write_pvtr(filename, whole_ext, names, ncomps, piece_ext, sources)
+        character(*), intent(in) :: filename
+        integer, intent(in) :: whole_ext(6)
+        character(*), intent(in) :: names(:)
+        integer, intent(in) :: ncomps(:)
+        integer, intent(in) :: piece_ext(:,:)
+        character(*), intent(in) :: sources(:)
+
+        integer :: iu, ifld, ip
+        character(len=128) :: sext
+        character(len=16) :: scomp
+
+        open(newunit=iu, file=trim(adjustl(filename)), access='stream',         &
+             form='unformatted', status='replace', action='write')
+
+        write(sext,'(6(i0,1x))') whole_ext
+        write(iu) '<?xml version="1.0"?>'//lf
+        write(iu) '<VTKFile type="PRectilinearGrid" version="0.1" byte_order="'//  &
+                  trim(byte_order())//'">'//lf
+        write(iu) '  <PRectilinearGrid WholeExtent="'//trim(sext)//'" GhostLevel="0">'//lf
+
+        write(iu) '    <PCellData>'//lf
+        do ifld = 1,size(names)
+            write(scomp,'(i0)') ncomps(ifld)
+            write(iu) '      <PDataArray type="Float32" Name="'//trim(names(ifld))// &
+                      '" NumberOfComponents="'//trim(scomp)//'"/>'//lf
+        end do
+        write(iu) '    </PCellData>'//lf
+
+        write(iu) '    <PCoordinates>'//lf
+        write(iu) '      <PDataArray type="Float32" Name="X" NumberOfComponents="1"/>'//lf
+        write(iu) '      <PDataArray type="Float32" Name="Y" NumberOfComponents="1"/>'//lf
+        write(iu) '      <PDataArray type="Float32" Name="Z" NumberOfComponents="1"/>'//lf
+        write(iu) '    </PCoordinates>'//lf
+
+        do ip = 1,size(sources)
+            write(sext,'(6(i0,1x))') piece_ext(:,ip)
+            write(iu) '    <Piece Extent="'//trim(sext)//'" Source="'//               &
+                      trim(adjustl(sources(ip)))//'"/>'//lf
+        end do
+
+        write(iu) '  </PRectilinearGrid>'//lf
+        write(iu) '</VTKFile>'//lf
+        close(iu)
+    end subroutine vtr_write_pvtr
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Add a dataset at time tnow to a .pvd time-series collection.
+    !   The file is (re)created when restart is .true. or it does not exist yet;
+    !   otherwise the new entry is written over the closing tags, which are then
+    !   rewritten, so the index is a valid file after every output event.
+    !------------------------------------------------------------
+    subroutine vtr_write_pvd(filename, tnow, source, restart)
+        character(*), intent(in) :: filename, source
+        real, intent(in) :: tnow
+        logical, intent(in) :: restart
+
+        character(*), parameter :: footer = '  </Collection>'//lf//'</VTKFile>'//lf
+        integer :: iu, fsize
+        logical :: exists
+        character(len=32) :: stime
+
+        inquire(file=trim(adjustl(filename)), exist=exists)
+
+        if (restart .or. .not. exists) then
+            open(newunit=iu, file=trim(adjustl(filename)), access='stream',     &
+                 form='unformatted', status='replace', action='write')
+            write(iu) '<?xml version="1.0"?>'//lf
+            write(iu) '<VTKFile type="Collection" version="0.1" byte_order="'//  &
+                      trim(byte_order())//'">'//lf
+            write(iu) '  <Collection>'//lf
+        else
+            open(newunit=iu, file=trim(adjustl(filename)), access='stream',     &
+                 form='unformatted', status='old', action='readwrite')
+            inquire(unit=iu, size=fsize)
+            write(iu, pos=fsize-len(footer)+1)
+        end if
+
+        write(stime,'(es16.8)') tnow
+        write(iu) '    <DataSet timestep="'//trim(adjustl(stime))//               &
+                  '" group="" part="0" file="'//trim(adjustl(source))//'"/>'//lf
+        write(iu) footer
+        close(iu)
+    end subroutine vtr_write_pvd
+    !---------------------------------------------------------------------------
+
+
+    !===========================================================================
+    ! Internal helpers
+    !------------------------------------------------------------
+    subroutine write_array_tag(name, ncomp, offset)
+        character(*), intent(in) :: name
+        integer, intent(in) :: ncomp
+        integer(vtr_i8), intent(in) :: offset
+        character(len=16) :: scomp, soff
+
+        write(scomp,'(i0)') ncomp
+        write(soff, '(i0)') offset
+        write(vtr_unit) '        <DataArray type="Float32" Name="'//name//           &
+                        '" NumberOfComponents="'//trim(scomp)//                     &
+                        '" format="appended" offset="'//trim(soff)//'"/>'//lf
+    end subroutine write_array_tag
+
+    subroutine write_block(var)
+        real(vtr_r4), intent(in) :: var(:)
+        write(vtr_unit) 4_vtr_i8*size(var), var
+    end subroutine write_block
+
+    function byte_order()
+        character(len=12) :: byte_order
+        if (transfer(1_vtr_i4, 'a') == achar(1)) then
+            byte_order = 'LittleEndian'
+        else
+            byte_order = 'BigEndian'
+        end if
+    end function byte_order
+    !---------------------------------------------------------------------------
+
+end module vtr_io